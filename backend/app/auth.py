@@ -0,0 +1,131 @@
+"""Token issuing and the ``get_current_user`` dependency.
+
+Authenticated handlers depend on ``get_current_user`` instead of decoding the
+JWT and loading the user themselves. Decoded tokens are memoised until their
+``exp`` (a TLRU cache keyed by the raw token), and ``username -> user`` lookups
+sit behind a short TTL cache, so a repeat request from the same client costs
+neither a signature check nor a database round-trip.
+
+Nothing in the API renames or deletes users, so cached users are never
+invalidated; a change made directly in the database reaches each worker within
+``AUTH_USER_CACHE_TTL`` seconds. Until then a deleted user's tokens still work.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from cachetools import TLRUCache, TTLCache
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .db import get_async_db
+from .models import User
+
+load_dotenv()
+
+SECRET_KEY = "your_secret_key"
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 90
+
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token", auto_error=False)
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Detached snapshot of the authenticated user; safe to share across requests."""
+    id: int
+    username: str
+    email: str
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+def create_access_token(data: dict, expires_delta: timedelta = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def _token_expiry(token, payload, now):
+    # tokens without "exp" never expire in jose; keep them no longer than the user cache
+    return payload.get("exp") or now + USER_CACHE_TTL
+
+_tokens = TLRUCache(maxsize=TOKEN_CACHE_SIZE, ttu=_token_expiry, timer=time.time)
+_users = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_lock = threading.Lock()
+
+
+def decode_token(token: str) -> str:
+    """Return the username (``sub``) of a valid token or raise 401."""
+    with _lock:
+        payload = _tokens.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        with _lock:
+            _tokens[token] = payload
+
+    username = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return username
+
+
+async def load_user(db: AsyncSession, username: str) -> CurrentUser:
+    with _lock:
+        user = _users.get(username)
+    if user is not None:
+        return user
+
+    row = (await db.execute(
+        select(User.id, User.username, User.email).where(User.username == username)
+    )).first()
+    if not row:
+        # not cached: the account may be created a moment later
+        raise HTTPException(status_code=404, detail="User not found")
+
+    user = CurrentUser(id=row.id, username=row.username, email=row.email)
+    with _lock:
+        _users[username] = user
+    return user
+
+
+def get_current_username(token: str = Depends(oauth2_scheme)) -> str:
+    return decode_token(token)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_async_db)) -> CurrentUser:
+    return await load_user(db, decode_token(token))
+
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme),
+                            db: AsyncSession = Depends(get_async_db)) -> Optional[CurrentUser]:
+    """The signed-in user, or ``None`` for anonymous requests; a bad token is still a 401."""
+    if not token:
+        return None
+    return await load_user(db, decode_token(token))
@@ -0,0 +1,135 @@
+"""Threaded comments, fetched as a nested page with one recursive query.
+
+A page holds ``limit`` comments of one level, newest first for top-level
+comments and oldest first for replies, each with up to ``replies_limit`` replies
+per level down to ``depth`` levels. Every list that was cut short carries a
+cursor: ``next_cursor`` for the page itself and ``replies_cursor`` on a
+comment. Passing ``parent_id`` plus that cursor loads the next replies of
+that comment (and their own replies) in the same shape.
+"""
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from .pagination import decode_cursor, encode_cursor
+
+DEFAULT_COMMENT_DEPTH = 3
+MAX_COMMENT_DEPTH = 10
+DEFAULT_REPLIES_PAGE_SIZE = 5
+MAX_REPLIES_PAGE_SIZE = 50
+
+# "start from the first reply" for comments whose replies were cut off by the depth limit
+_FIRST_REPLY = (datetime(1970, 1, 1, tzinfo=timezone.utc), 0)
+
+# {level} selects the first level: top-level comments of the image (newest
+# first) or replies of :parent_id (oldest first). Each level fetches one row
+# more than it returns to know whether a cursor is needed; only returned rows
+# are expanded further.
+COMMENT_TREE_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT level.*, 1 AS depth
+        FROM (
+            SELECT c.id, c.user_id, c.image_id, c.parent_comment_id, c.content, c.created_at, c.is_edited,
+                   row_number() OVER (ORDER BY c.created_at {order}, c.id {order}) AS rn
+            FROM comments c
+            WHERE {level}
+            ORDER BY c.created_at {order}, c.id {order}
+            LIMIT :limit + 1
+        ) level
+
+        UNION ALL
+
+        SELECT replies.*, tree.depth + 1
+        FROM tree
+        CROSS JOIN LATERAL (
+            SELECT c.id, c.user_id, c.image_id, c.parent_comment_id, c.content, c.created_at, c.is_edited,
+                   row_number() OVER (ORDER BY c.created_at, c.id) AS rn
+            FROM comments c
+            WHERE c.parent_comment_id = tree.id
+            ORDER BY c.created_at, c.id
+            LIMIT :replies_limit + 1
+        ) replies
+        WHERE tree.depth < :depth
+          AND tree.rn <= CASE WHEN tree.depth = 1 THEN :limit ELSE :replies_limit END
+    )
+    SELECT tree.*, users.username,
+           tree.depth = :depth
+               AND EXISTS (SELECT 1 FROM comments r WHERE r.parent_comment_id = tree.id) AS replies_cut
+    FROM tree
+    JOIN users ON users.id = tree.user_id
+    ORDER BY tree.depth, tree.rn
+"""
+
+TOP_LEVEL = """c.image_id = :image_id AND c.parent_comment_id IS NULL
+              AND (CAST(:cursor_id AS integer) IS NULL
+                   OR (c.created_at, c.id) < (CAST(:cursor_created_at AS timestamptz), CAST(:cursor_id AS integer)))"""
+
+REPLIES = """c.image_id = :image_id AND c.parent_comment_id = :parent_id
+              AND (CAST(:cursor_id AS integer) IS NULL
+                   OR (c.created_at, c.id) > (CAST(:cursor_created_at AS timestamptz), CAST(:cursor_id AS integer)))"""
+
+TOP_LEVEL_SQL = text(COMMENT_TREE_SQL.format(level=TOP_LEVEL, order="DESC"))
+REPLIES_SQL = text(COMMENT_TREE_SQL.format(level=REPLIES, order="ASC"))
+
+
+def _node(row) -> dict:
+    return {
+        "id": row.id,
+        "username": row.username,
+        "image_id": row.image_id,
+        "parent_comment_id": row.parent_comment_id,
+        "content": row.content,
+        "created_at": row.created_at,
+        "is_edited": row.is_edited,
+        "replies": [],
+        "replies_cursor": encode_cursor(*_FIRST_REPLY) if row.replies_cut else None,
+    }
+
+
+async def comment_tree(
+    db: AsyncSession,
+    image_id: int,
+    parent_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    replies_limit: int = DEFAULT_REPLIES_PAGE_SIZE,
+    depth: int = DEFAULT_COMMENT_DEPTH,
+) -> dict:
+    """Return ``{"items": [...], "next_cursor": ...}`` with nested ``replies``."""
+    cursor_created_at, cursor_id = decode_cursor(cursor) if cursor else (None, None)
+    rows = (await db.execute(TOP_LEVEL_SQL if parent_id is None else REPLIES_SQL, {
+        "image_id": image_id,
+        "parent_id": parent_id,
+        "cursor_created_at": cursor_created_at,
+        "cursor_id": cursor_id,
+        "limit": limit,
+        "replies_limit": replies_limit,
+        "depth": depth,
+    })).all()
+
+    items: List[dict] = []
+    next_cursor = None
+    nodes = {}
+    last_child = {}
+    for row in rows:  # parents come before their replies (ordered by depth)
+        page_size = limit if row.depth == 1 else replies_limit
+        if row.rn > page_size:
+            # the extra row: more comments exist after the last one returned
+            if row.depth == 1:
+                next_cursor = encode_cursor(*last_child[None])
+            else:
+                nodes[row.parent_comment_id]["replies_cursor"] = encode_cursor(*last_child[row.parent_comment_id])
+            continue
+
+        node = _node(row)
+        nodes[row.id] = node
+        parent_key = None if row.depth == 1 else row.parent_comment_id
+        last_child[parent_key] = (row.created_at, row.id)
+        if row.depth == 1:
+            items.append(node)
+        else:
+            nodes[row.parent_comment_id]["replies"].append(node)
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+from pgvector import Vector
+from sqlalchemy import create_engine, event, exc, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from .models import Base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from .migrations import run_migrations
 import os
+import threading
+import time
+from typing import AsyncIterator
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,7 +19,151 @@ if DATABASE_URL:
 else:
     raise RuntimeError("DATABASE_URL environment variable is not set.")
 
-engine = create_engine(DATABASE_URL)
+# Sizes apply to each of the two pools (async for requests, sync for background
+# work): uvicorn workers x 2 x (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay below
+# the server's max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# 0 disables the server-side limit
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+class _WaitStatsMixin:
+    """Records how long pool checkouts wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def wait_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+class TimedQueuePool(_WaitStatsMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_WaitStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+pool_options = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+connect_args = {}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    connect_args=connect_args,
+    **pool_options,
+)
+# background workers (ingest, edit jobs, counters) and migrations
 SessionLocal = sessionmaker(bind=engine)
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+
+def _async_url(url: str):
+    """asyncpg flavour of DATABASE_URL; libpq's sslmode becomes asyncpg's ssl argument."""
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    ssl = async_url.query.get("sslmode")
+    return async_url.difference_update_query(["sslmode"]), ({"ssl": ssl} if ssl else {})
+
+
+def _encode_vector(value):
+    # SQLAlchemy's Vector type binds text ("[1,2,3]"), raw SQL may pass lists or arrays
+    if isinstance(value, str):
+        value = Vector.from_text(value)
+    return Vector._to_db_binary(value)
+
+
+async def _register_vector(conn):
+    await conn.set_type_codec(
+        "vector", encoder=_encode_vector, decoder=Vector._from_db_binary, format="binary"
+    )
+
+
+ASYNC_DATABASE_URL, async_connect_args = _async_url(DATABASE_URL)
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    async_connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=TimedAsyncQueuePool,
+    connect_args=async_connect_args,
+    **pool_options,
+)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_async_connect(dbapi_connection, connection_record):
+    dbapi_connection.run_async(_register_vector)
+
+
+# request handlers
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Request-scoped session: one per request, shared by every dependency that asks for it.
+
+    The session only checks out a connection on its first query and returns it
+    when the request finishes.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _pool_stats(pool) -> dict:
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        **pool.wait_stats(),
+    }
+
+
+def pool_stats() -> dict:
+    return {
+        "async": _pool_stats(async_engine.pool),
+        "sync": _pool_stats(engine.pool),
+    }
+
+
+run_migrations(engine)
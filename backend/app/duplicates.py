@@ -0,0 +1,138 @@
+"""Near-duplicate detection for ingested images.
+
+Ingest probes the nearest already-stored images of a new embedding. The new
+image is linked to the closest of them (``images.duplicate_of_id``) when
+either:
+
+* its CLIP similarity is at least ``DUPLICATE_SIMILARITY``, or
+* its 64-bit dHash is within ``DUPLICATE_HASH_DISTANCE`` bits.
+
+The dHash catches re-encodes and resizes that CLIP scores slightly lower.
+Only older canonical images can be linked to (never a duplicate, never
+someone else's private image), so chains never form.
+
+Search uses the link to collapse duplicates within a page (``collapse``).
+Existing rows are linked with ``python -m app.duplicates scan``.
+"""
+import argparse
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image as PILImage
+from sqlalchemy import select, update
+from sqlalchemy.sql import text
+
+from .models import Image
+from .search import first_pass_order, reduced_query, rerank_candidates, to_pgvector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_DETECTION = os.getenv("DUPLICATE_DETECTION", "true").lower() == "true"
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.97"))
+DUPLICATE_HASH_DISTANCE = int(os.getenv("DUPLICATE_HASH_DISTANCE", "4"))
+# nearest neighbours checked per image
+DUPLICATE_PROBE_SIZE = int(os.getenv("DUPLICATE_PROBE_SIZE", "10"))
+
+PROBE_SQL = """
+    WITH nearest AS MATERIALIZED (
+        SELECT id, phash, vector_embedding <=> CAST(:embedding AS vector) AS distance
+        FROM images
+        WHERE vector_embedding IS NOT NULL
+          AND id < :image_id
+          AND duplicate_of_id IS NULL
+          AND (is_private = false OR user_id = :user_id)
+        ORDER BY {first_pass}
+        LIMIT :candidates
+    )
+    SELECT id, phash, 1 - distance AS similarity
+    FROM nearest
+    ORDER BY distance
+    LIMIT :limit
+"""
+
+
+def dhash(img: PILImage.Image, size: int = 8) -> int:
+    """64-bit difference hash, as a signed integer so that it fits a BIGINT."""
+    pixels = np.asarray(img.convert("L").resize((size + 1, size), PILImage.LANCZOS), dtype=np.int16)
+    value = 0
+    for bit in (pixels[:, 1:] > pixels[:, :-1]).flatten():
+        value = (value << 1) | int(bit)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hash_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def find_duplicate(db, image_id: int, user_id: int, embedding: List[float],
+                   phash: Optional[int] = None) -> Optional[int]:
+    """Id of the canonical image that ``image_id`` duplicates, or ``None``."""
+    sql = text(PROBE_SQL.format(first_pass=first_pass_order("CAST(:embedding AS vector)")))
+    rows = db.execute(sql, {
+        "embedding": to_pgvector(embedding),
+        "embedding_reduced": reduced_query(embedding),
+        "image_id": image_id,
+        "user_id": user_id,
+        "candidates": rerank_candidates(DUPLICATE_PROBE_SIZE),
+        "limit": DUPLICATE_PROBE_SIZE,
+    }).all()
+    for row in rows:
+        if row.similarity >= DUPLICATE_SIMILARITY:
+            return row.id
+        if phash is not None and row.phash is not None and hash_distance(phash, row.phash) <= DUPLICATE_HASH_DISTANCE:
+            return row.id
+    return None
+
+
+def collapse(results: List[dict]) -> List[dict]:
+    """Keep the best-ranked result of each duplicate group, in order."""
+    seen = set()
+    collapsed = []
+    for result in results:
+        group = result.get("duplicate_of_id") or result["id"]
+        if group not in seen:
+            seen.add(group)
+            collapsed.append(result)
+    return collapsed
+
+
+def scan(db) -> int:
+    """Link existing images to their canonical copies, oldest first."""
+    linked = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Image.id, Image.user_id, Image.vector_embedding, Image.phash)
+            .where(Image.vector_embedding.isnot(None), Image.duplicate_of_id.is_(None), Image.id > last_id)
+            .order_by(Image.id).limit(500)
+        ).all()
+        if not rows:
+            return linked
+        for row in rows:
+            duplicate_of = find_duplicate(db, row.id, row.user_id, row.vector_embedding.tolist(), row.phash)
+            if duplicate_of is not None:
+                db.execute(update(Image).where(Image.id == row.id).values(duplicate_of_id=duplicate_of))
+                linked += 1
+        db.commit()
+        last_id = rows[-1].id
+        logger.info("Scanned up to id %d, %d duplicates linked", last_id, linked)
+
+
+if __name__ == "__main__":
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Near-duplicate image detection")
+    parser.add_argument("command", choices=["scan"])
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        scan(db)
+    finally:
+        db.close()
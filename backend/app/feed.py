@@ -0,0 +1,291 @@
+"""Materialised per-user feeds in ``feed_items``.
+
+A feed page is one keyset range scan of ``(user_id, created_at, image_id)``
+(see ``app.pagination``) joined to ``images`` by primary key; nothing is
+computed when it is read. Two writers keep the rows there:
+
+* fan-out on write: an upload that finishes ingesting (``app.ingest``) is
+  inserted into the feed of every follower of its author, and following a
+  user copies their ``FEED_FOLLOW_BACKFILL`` latest uploads in (unfollowing
+  takes them out again);
+* ``FeedRefresher`` re-ranks the ``FEED_RECOMMENDATIONS`` public images
+  closest to the centroid of each user's liked-image embeddings, for users
+  who liked something since their last refresh. Recommendations are placed
+  at the refresh time, best first, between the followed uploads.
+
+Rows older than ``FEED_RETENTION_DAYS`` are pruned by the same job.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from .db import SessionLocal
+from .search import DEFAULT_EF_SEARCH, MAX_EF_SEARCH, first_pass_order, rerank_candidates
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FEED_FOLLOW_BACKFILL = int(os.getenv("FEED_FOLLOW_BACKFILL", "50"))
+FEED_RECOMMENDATIONS = int(os.getenv("FEED_RECOMMENDATIONS", "50"))
+FEED_RETENTION_DAYS = int(os.getenv("FEED_RETENTION_DAYS", "30"))
+# seconds between recommendation refreshes; 0 disables recommendations
+FEED_REFRESH_INTERVAL = float(os.getenv("FEED_REFRESH_INTERVAL", "300"))
+FEED_REFRESH_BATCH_SIZE = 50
+
+# first key of the advisory locks that claim users to refresh; the second is the id
+FEED_LOCK = 25
+
+FOLLOW_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO follows (follower_id, following_id) VALUES (:follower_id, :following_id)
+        ON CONFLICT DO NOTHING
+        RETURNING follower_id, following_id
+    ),
+    followed AS (
+        UPDATE users SET followers_count = followers_count + 1
+        WHERE id IN (SELECT following_id FROM inserted)
+    )
+    UPDATE users SET following_count = following_count + 1
+    WHERE id IN (SELECT follower_id FROM inserted)
+    RETURNING following_count
+""")
+
+UNFOLLOW_SQL = text("""
+    WITH deleted AS (
+        DELETE FROM follows WHERE follower_id = :follower_id AND following_id = :following_id
+        RETURNING follower_id, following_id
+    ),
+    unfollowed AS (
+        UPDATE users SET followers_count = GREATEST(followers_count - 1, 0)
+        WHERE id IN (SELECT following_id FROM deleted)
+    )
+    UPDATE users SET following_count = GREATEST(following_count - 1, 0)
+    WHERE id IN (SELECT follower_id FROM deleted)
+    RETURNING following_count
+""")
+
+# here and in FAN_OUT_SQL an image that is already recommended turns into a
+# followed upload; left as 'recommended', the next refresh would delete it.
+# Uploads older than the retention window are left out, prune would drop them.
+BACKFILL_SQL = text("""
+    INSERT INTO feed_items (user_id, image_id, created_at, reason)
+    SELECT :follower_id, id, created_at, 'following'
+    FROM images
+    WHERE user_id = :following_id AND is_private = false AND ingest_status = 'ready'
+      AND created_at >= now() - make_interval(days => :days)
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit
+    ON CONFLICT (user_id, image_id) DO UPDATE
+        SET reason = 'following', created_at = EXCLUDED.created_at, score = NULL
+""")
+
+REMOVE_AUTHOR_SQL = text("""
+    DELETE FROM feed_items
+    USING images
+    WHERE feed_items.user_id = :follower_id
+      AND feed_items.reason = 'following'
+      AND images.id = feed_items.image_id
+      AND images.user_id = :following_id
+""")
+
+FAN_OUT_SQL = text("""
+    INSERT INTO feed_items (user_id, image_id, created_at, reason)
+    SELECT follower_id, :image_id, :created_at, 'following'
+    FROM follows
+    WHERE following_id = :user_id
+    ON CONFLICT (user_id, image_id) DO UPDATE
+        SET reason = 'following', created_at = EXCLUDED.created_at, score = NULL
+""")
+
+# users who liked something since :since and whose recommendations predate it.
+# Like app.neighbors, workers claim them with transaction-level advisory locks
+# rather than FOR UPDATE, which would hold the user rows and block the follower
+# counters of FOLLOW_SQL for the whole refresh.
+STALE_SQL = text("""
+    SELECT id
+    FROM (
+        SELECT id
+        FROM users
+        WHERE id IN (SELECT user_id FROM likes WHERE created_at > :since)
+          AND (
+              recommendations_updated_at IS NULL
+              OR recommendations_updated_at < (SELECT max(created_at) FROM likes WHERE likes.user_id = users.id)
+          )
+        ORDER BY id
+        LIMIT :scan
+    ) stale
+    WHERE pg_try_advisory_xact_lock(:lock, id)
+    LIMIT :limit
+""")
+
+CLEAR_RECOMMENDATIONS_SQL = text("DELETE FROM feed_items WHERE user_id = ANY(:ids) AND reason = 'recommended'")
+
+# {first_pass} is first_pass_order() against the centroid. Liked images and
+# followed uploads already in the feed are skipped; rank offsets keep the
+# recommendations of one refresh in similarity order under keyset paging.
+RECOMMEND_SQL = """
+    INSERT INTO feed_items (user_id, image_id, created_at, reason, score)
+    SELECT c.user_id, nearest.id, now() - nearest.rank * interval '1 millisecond', 'recommended',
+           1 - nearest.distance
+    FROM (
+        SELECT likes.user_id,
+               avg(images.vector_embedding) AS centroid,
+               avg(images.embedding_reduced) AS centroid_reduced
+        FROM likes
+        JOIN images ON images.id = likes.image_id
+        WHERE likes.user_id = ANY(:ids) AND images.vector_embedding IS NOT NULL
+        GROUP BY likes.user_id
+    ) c
+    CROSS JOIN LATERAL (
+        SELECT id, distance, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, vector_embedding <=> c.centroid AS distance
+            FROM images
+            WHERE vector_embedding IS NOT NULL
+              AND is_private = false
+              AND duplicate_of_id IS NULL
+              AND user_id <> c.user_id
+            ORDER BY {first_pass}
+            LIMIT :candidates
+        ) candidates
+        WHERE NOT EXISTS (
+            SELECT 1 FROM likes WHERE likes.user_id = c.user_id AND likes.image_id = candidates.id
+        )
+          AND NOT EXISTS (
+            SELECT 1 FROM feed_items
+            WHERE feed_items.user_id = c.user_id AND feed_items.image_id = candidates.id
+              AND feed_items.reason = 'following'
+        )
+        ORDER BY distance
+        LIMIT :limit
+    ) nearest
+    ON CONFLICT (user_id, image_id) DO NOTHING
+"""
+
+MARK_SQL = text("UPDATE users SET recommendations_updated_at = now() WHERE id = ANY(:ids)")
+
+PRUNE_SQL = text("DELETE FROM feed_items WHERE created_at < now() - make_interval(days => :days)")
+
+
+async def _toggle_follow(db: AsyncSession, follower_id: int, following_id: int, sql, feed_sql) -> bool:
+    """Run a follow/unfollow and its feed change; return False when it was a no-op."""
+    if follower_id == following_id:
+        raise HTTPException(status_code=400, detail="You cannot follow yourself")
+
+    params = {
+        "follower_id": follower_id, "following_id": following_id,
+        "limit": FEED_FOLLOW_BACKFILL, "days": FEED_RETENTION_DAYS,
+    }
+    try:
+        changed = (await db.execute(sql, params)).first() is not None
+        if changed:
+            await db.execute(feed_sql, params)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="User not found")
+    return changed
+
+
+async def follow(db: AsyncSession, follower_id: int, following_id: int) -> bool:
+    return await _toggle_follow(db, follower_id, following_id, FOLLOW_SQL, BACKFILL_SQL)
+
+
+async def unfollow(db: AsyncSession, follower_id: int, following_id: int) -> bool:
+    return await _toggle_follow(db, follower_id, following_id, UNFOLLOW_SQL, REMOVE_AUTHOR_SQL)
+
+
+def fan_out(image_id: int, user_id: int, created_at: datetime) -> int:
+    """Insert a new public upload into the feeds of its author's followers."""
+    db = SessionLocal()
+    try:
+        inserted = db.execute(FAN_OUT_SQL, {
+            "image_id": image_id, "user_id": user_id, "created_at": created_at
+        }).rowcount
+        db.commit()
+        return inserted
+    finally:
+        db.close()
+
+
+def refresh_recommendations(db, since: Optional[datetime] = None,
+                            limit: int = FEED_RECOMMENDATIONS, batch_size: int = FEED_REFRESH_BATCH_SIZE) -> int:
+    """Re-rank the recommendations of users who liked something after ``since``."""
+    sql = text(RECOMMEND_SQL.format(first_pass=first_pass_order("c.centroid", reduced="c.centroid_reduced")))
+    candidates = rerank_candidates(limit * 2)
+    refreshed = 0
+    while True:
+        ids = db.execute(STALE_SQL, {
+            "since": since or datetime.min, "lock": FEED_LOCK, "scan": 4 * batch_size, "limit": batch_size
+        }).scalars().all()
+        if not ids:
+            db.rollback()
+            return refreshed
+
+        db.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                   {"value": str(min(max(candidates, DEFAULT_EF_SEARCH), MAX_EF_SEARCH))})
+        db.execute(CLEAR_RECOMMENDATIONS_SQL, {"ids": ids})
+        db.execute(sql, {"ids": ids, "candidates": candidates, "limit": limit})
+        db.execute(MARK_SQL, {"ids": ids})
+        db.commit()
+        refreshed += len(ids)
+        logger.info("Refreshed feed recommendations of %d users", refreshed)
+
+
+def prune(db, days: int = FEED_RETENTION_DAYS) -> int:
+    deleted = db.execute(PRUNE_SQL, {"days": days}).rowcount
+    db.commit()
+    return deleted
+
+
+class FeedRefresher:
+    """Refreshes liked-centroid recommendations and prunes old feed rows every ``interval`` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # likes older than this are already reflected; None scans every like once after startup
+        self._since: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Refreshing feeds failed: {e}")
+
+    def refresh(self):
+        db = SessionLocal()
+        try:
+            started = db.execute(text("SELECT now()")).scalar()
+            db.rollback()
+            refresh_recommendations(db, self._since)
+            self._since = started
+            prune(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+feed_refresher = FeedRefresher(FEED_REFRESH_INTERVAL) if FEED_REFRESH_INTERVAL > 0 else None
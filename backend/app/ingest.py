@@ -0,0 +1,224 @@
+"""Background ingestion pipeline for uploaded images.
+
+``POST /images/`` only inserts the row with ``ingest_status='pending'`` and
+returns. The pipeline then fetches the image once, reads its dimensions,
+size and format with Pillow, computes the CLIP embedding from the same bytes
+and marks the row ``ready`` (or ``failed``). ``INGEST_WORKERS`` bounds how many
+images are processed at once, for single and bulk uploads alike.
+
+Every API process runs a pipeline, and each one re-enqueues the unfinished
+rows on startup and every ``CLEANUP_INTERVAL``. A worker therefore first
+claims its row (``pending`` -> ``processing``). A row stays claimed until it
+is ready or failed, or until its claim is ``INGEST_CLAIM_TIMEOUT`` seconds
+old, which means the process holding it died.
+
+Listings only show ``ready`` images to other users; the owner still sees a
+failed upload until it is deleted ``INGEST_FAILED_RETENTION_HOURS`` later.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from io import BytesIO
+from typing import Any, Callable, List, Optional
+
+from dotenv import load_dotenv
+from PIL import Image as PILImage
+from sqlalchemy import delete, func, or_, update
+
+from http_client import IMAGE_FETCH_MAX_BYTES, http_client
+from .db import SessionLocal
+from .duplicates import DUPLICATE_DETECTION, dhash, find_duplicate
+from .feed import fan_out
+from .models import Image
+from .reduction import reduced_columns
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INGEST_FAILED_RETENTION_HOURS = float(os.getenv("INGEST_FAILED_RETENTION_HOURS", "24"))
+CLEANUP_INTERVAL = 3600
+INGEST_CLAIM_TIMEOUT = float(os.getenv("INGEST_CLAIM_TIMEOUT", "600"))
+INGEST_MAX_IMAGE_BYTES = int(os.getenv("INGEST_MAX_IMAGE_BYTES", str(IMAGE_FETCH_MAX_BYTES)))
+
+
+def extract_metadata(data: bytes) -> dict:
+    with PILImage.open(BytesIO(data)) as img:
+        width, height = img.size
+        image_format = img.format
+        phash = dhash(img)
+    return {
+        "width": width or None,
+        "height": height or None,
+        "size": len(data) or None,
+        "format": image_format[:10] if image_format else None,
+        "phash": phash,
+    }
+
+
+async def fetch_image(image_url: str) -> bytes:
+    return await http_client.fetch_image(image_url, INGEST_MAX_IMAGE_BYTES)
+
+
+def _unclaimed():
+    """Rows no live worker is processing: pending ones and claims that timed out."""
+    return or_(
+        Image.ingest_status == "pending",
+        (Image.ingest_status == "processing")
+        & (Image.ingest_claimed_at < func.now() - timedelta(seconds=INGEST_CLAIM_TIMEOUT)),
+    )
+
+
+class IngestPipeline:
+    def __init__(self, image_embedder, on_ready: Optional[Callable[[int, List[float], Any], None]] = None,
+                 workers: int = 4):
+        self.image_embedder = image_embedder
+        self.on_ready = on_ready
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._cleanup()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, image_id: int, image_url: str):
+        self._queue.put_nowait((image_id, image_url))
+
+    @staticmethod
+    def _pending_rows():
+        db = SessionLocal()
+        try:
+            return db.query(Image.id, Image.image_url).filter(_unclaimed()).all()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _claim(image_id: int) -> bool:
+        """Mark the row ``processing``; False when another worker already has it."""
+        db = SessionLocal()
+        try:
+            claimed = db.execute(
+                update(Image).where(Image.id == image_id, _unclaimed())
+                .values(ingest_status="processing", ingest_claimed_at=func.now())
+                .returning(Image.id)
+            ).first()
+            db.commit()
+            return claimed is not None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _delete_failed() -> int:
+        db = SessionLocal()
+        try:
+            deleted = db.execute(
+                delete(Image).where(
+                    Image.ingest_status == "failed",
+                    Image.created_at < func.now() - timedelta(hours=INGEST_FAILED_RETENTION_HOURS),
+                )
+            ).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    async def _cleanup(self):
+        while True:
+            try:
+                # rows left by a previous process, or whose worker died
+                for image_id, image_url in await asyncio.to_thread(self._pending_rows):
+                    self.enqueue(image_id, image_url)
+            except Exception as e:
+                logger.error(f"Re-enqueueing unfinished images failed: {e}")
+            try:
+                deleted = await asyncio.to_thread(self._delete_failed)
+                if deleted:
+                    logger.info(f"Deleted {deleted} images whose ingest failed")
+            except Exception as e:
+                logger.error(f"Deleting failed images failed: {e}")
+            await asyncio.sleep(CLEANUP_INTERVAL)
+
+    @staticmethod
+    def _update(image_id: int, **fields):
+        """Update the row and return the columns search filters on (``None`` if it is gone)."""
+        db = SessionLocal()
+        try:
+            row = db.execute(
+                update(Image).where(Image.id == image_id).values(**fields)
+                .returning(Image.user_id, Image.is_private, Image.is_ai_generated, Image.created_at)
+            ).first()
+            db.commit()
+            return row
+        finally:
+            db.close()
+
+    @staticmethod
+    def _link_duplicate(image_id: int, user_id: int, embedding: List[float], phash: Optional[int]):
+        db = SessionLocal()
+        try:
+            duplicate_of = find_duplicate(db, image_id, user_id, embedding, phash)
+            if duplicate_of is not None:
+                db.execute(update(Image).where(Image.id == image_id).values(duplicate_of_id=duplicate_of))
+                db.commit()
+                logger.info(f"Image {image_id} is a near-duplicate of {duplicate_of}")
+        finally:
+            db.close()
+
+    async def _work(self):
+        while True:
+            image_id, image_url = await self._queue.get()
+            try:
+                await self.process(image_id, image_url)
+            except Exception as e:
+                # keep the worker alive; the row is retried once its claim times out
+                logger.error(f"Ingest worker failed on image {image_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def process(self, image_id: int, image_url: str):
+        if not await asyncio.to_thread(self._claim, image_id):
+            return
+        try:
+            data = await fetch_image(image_url)
+            # Pillow decoding and the dHash resize are CPU-bound
+            metadata = await asyncio.to_thread(extract_metadata, data)
+            embedding = await self.image_embedder.aget_embedding_from_bytes(data, url_key=f"url:{image_url}")
+            if len(embedding) != 512:
+                raise ValueError(f"Embedding length is {len(embedding)}, expected 512")
+
+            row = await asyncio.to_thread(
+                self._update, image_id,
+                vector_embedding=embedding, embedded_at=func.now(), ingest_status="ready", ingest_error=None,
+                **reduced_columns(embedding), **metadata
+            )
+            if self.on_ready is not None and row is not None:
+                self.on_ready(image_id, embedding, row)
+        except Exception as e:
+            logger.error(f"Ingest of image {image_id} ({image_url}) failed: {e}")
+            try:
+                await asyncio.to_thread(self._update, image_id, ingest_status="failed", ingest_error=str(e))
+            except Exception as e:
+                logger.error(f"Recording the failed ingest of image {image_id} failed: {e}")
+            return
+
+        if DUPLICATE_DETECTION and row is not None:
+            try:
+                await asyncio.to_thread(self._link_duplicate, image_id, row.user_id, embedding, metadata["phash"])
+            except Exception as e:
+                # the image itself is fine; it just stays unlinked
+                logger.warning(f"Duplicate probe for image {image_id} failed: {e}")
+
+        if row is not None and not row.is_private:
+            try:
+                await asyncio.to_thread(fan_out, image_id, row.user_id, row.created_at)
+            except Exception as e:
+                logger.warning(f"Feed fan-out of image {image_id} failed: {e}")
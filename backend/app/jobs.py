@@ -0,0 +1,271 @@
+"""Background job queue for long-running image edits.
+
+GPT-Image-1 edits take 60-90 s, well past Heroku's 30 s router limit, so
+``/edit-image/`` only enqueues the work and answers 202 with a job id. A small
+pool of asyncio workers runs the edits; clients poll the status endpoint or
+subscribe to server-sent events and then download the PNG.
+
+The store is pluggable (``EDIT_JOB_STORE``): ``memory`` keeps jobs in the
+worker process, ``sql`` persists them in the ``edit_jobs`` table of
+``EDIT_JOB_STORE_URL`` (the main database and its ``app.db`` engine by
+default, or e.g. a SQLite file) so any worker can answer status requests.
+
+Jobs still unfinished ``EDIT_JOB_TIMEOUT`` seconds after they were created
+are marked failed: their worker died (e.g. the process restarted), and
+nothing else would ever finish them.
+"""
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from .db import DATABASE_URL, connect_args, engine, pool_options
+from .models import EditJob
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_TTL = timedelta(seconds=int(os.getenv("EDIT_JOB_TTL", "3600")))
+# well above the image_edit HTTP timeout, so only abandoned jobs hit it
+EDIT_JOB_TIMEOUT = int(os.getenv("EDIT_JOB_TIMEOUT", "600"))
+REAP_INTERVAL = 60
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class InMemoryJobStore:
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._results: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, username: str, prompt: str):
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                "id": job_id,
+                "username": username,
+                "prompt": prompt,
+                "status": "queued",
+                "error": None,
+                "created_at": _now(),
+                "finished_at": None,
+            }
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def set_result(self, job_id: str, result: bytes):
+        with self._lock:
+            self._results[job_id] = result
+
+    def get_result(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._results.get(job_id)
+
+    def fail_stale(self, cutoff: datetime, error: str) -> int:
+        with self._lock:
+            stale = [job for job in self._jobs.values()
+                     if job["status"] not in FINISHED_STATUSES and job["created_at"] < cutoff]
+            for job in stale:
+                job.update(status="failed", error=error, finished_at=_now())
+            return len(stale)
+
+    def _prune(self):
+        cutoff = _now() - JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] and job["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+            self._results.pop(job_id, None)
+
+
+class SQLJobStore:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        EditJob.__table__.create(bind=self.engine, checkfirst=True)
+        self.Session = sessionmaker(bind=self.engine)
+
+    @staticmethod
+    def _to_dict(job: EditJob) -> dict:
+        return {
+            "id": job.id,
+            "username": job.username,
+            "prompt": job.prompt,
+            "status": job.status,
+            "error": job.error,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }
+
+    def create(self, job_id: str, username: str, prompt: str):
+        db = self.Session()
+        try:
+            db.query(EditJob).filter(EditJob.finished_at < _now() - JOB_TTL).delete()
+            db.add(EditJob(id=job_id, username=username, prompt=prompt, status="queued"))
+            db.commit()
+        finally:
+            db.close()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        db = self.Session()
+        try:
+            job = db.get(EditJob, job_id)
+            return self._to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def update(self, job_id: str, **fields):
+        db = self.Session()
+        try:
+            db.query(EditJob).filter(EditJob.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def set_result(self, job_id: str, result: bytes):
+        self.update(job_id, result=result)
+
+    def get_result(self, job_id: str) -> Optional[bytes]:
+        db = self.Session()
+        try:
+            row = db.query(EditJob.result).filter(EditJob.id == job_id).first()
+            return row.result if row else None
+        finally:
+            db.close()
+
+    def fail_stale(self, cutoff: datetime, error: str) -> int:
+        db = self.Session()
+        try:
+            failed = db.query(EditJob).filter(
+                EditJob.status.notin_(FINISHED_STATUSES), EditJob.created_at < cutoff
+            ).update({"status": "failed", "error": error, "finished_at": _now()}, synchronize_session=False)
+            db.commit()
+            return failed
+        finally:
+            db.close()
+
+
+class EditJobQueue:
+    """Runs ``handler(image_bytes, prompt) -> PIL image`` on ``workers`` asyncio tasks."""
+
+    def __init__(self, store, handler: Callable[[BytesIO, str], Awaitable], workers: int = 2):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._events: Dict[str, asyncio.Event] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reap()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, username: str, image: bytes, prompt: str) -> str:
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, username, prompt)
+        self._events[job_id] = asyncio.Event()
+        self._queue.put_nowait((job_id, image, prompt))
+        return job_id
+
+    async def _reap(self):
+        while True:
+            try:
+                failed = await asyncio.to_thread(
+                    self.store.fail_stale, _now() - timedelta(seconds=EDIT_JOB_TIMEOUT),
+                    "Job was interrupted before it finished",
+                )
+                if failed:
+                    logger.warning(f"Marked {failed} abandoned edit jobs failed")
+            except Exception as e:
+                logger.error(f"Failing abandoned edit jobs failed: {e}")
+            await asyncio.sleep(REAP_INTERVAL)
+
+    @staticmethod
+    def _to_png(image) -> bytes:
+        buf = BytesIO()
+        image.save(buf, format="PNG")
+        return buf.getvalue()
+
+    async def _work(self):
+        while True:
+            job_id, image, prompt = await self._queue.get()
+            try:
+                await asyncio.to_thread(self.store.update, job_id, status="running")
+                edited_img = await self.handler(BytesIO(image), prompt)
+                result = await asyncio.to_thread(self._to_png, edited_img)
+                await asyncio.to_thread(self.store.set_result, job_id, result)
+                await asyncio.to_thread(self.store.update, job_id, status="succeeded", finished_at=_now())
+            except Exception as e:
+                logger.error(f"Edit job {job_id} failed: {e}")
+                detail = getattr(e, "detail", None) or str(e)
+                try:
+                    await asyncio.to_thread(self.store.update, job_id, status="failed",
+                                            error=str(detail), finished_at=_now())
+                except Exception as e:
+                    # left unfinished; _reap fails it after EDIT_JOB_TIMEOUT
+                    logger.error(f"Recording the failure of edit job {job_id} failed: {e}")
+            finally:
+                event = self._events.pop(job_id, None)
+                if event:
+                    event.set()
+                self._queue.task_done()
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Wait up to ``timeout`` seconds for the job to finish and return its latest state.
+
+        Jobs run by this process wake the waiter immediately; jobs owned by
+        another worker (SQL store) are picked up on the next poll.
+        """
+        event = self._events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(min(timeout, 1.0))
+        return await asyncio.to_thread(self.store.get, job_id)
+
+
+def create_job_store():
+    store = os.getenv("EDIT_JOB_STORE", "memory").lower()
+    if store == "memory":
+        return InMemoryJobStore()
+    if store == "sql":
+        url = os.getenv("EDIT_JOB_STORE_URL") or DATABASE_URL
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        if url == DATABASE_URL:
+            return SQLJobStore(engine)
+        # a separate database still gets the pool limits, pre-ping and recycling of app.db
+        is_postgres = make_url(url).get_backend_name() == "postgresql"
+        return SQLJobStore(create_engine(url, connect_args=connect_args if is_postgres else {}, **pool_options))
+    raise ValueError(f"Unknown EDIT_JOB_STORE: {store}")
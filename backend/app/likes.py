@@ -0,0 +1,155 @@
+"""Like/unlike as single atomic statements, with an optional write-behind counter.
+
+A like is one round-trip: the ``INSERT ... ON CONFLICT DO NOTHING RETURNING``
+and the ``likes_count + 1`` update run in one CTE, so a repeated like changes
+nothing and concurrent likes never lose an increment.
+
+With ``LIKE_COUNTER_FLUSH_INTERVAL`` > 0 the ``likes`` row is still written
+immediately, but the counter change is added to an in-process buffer and
+flushed as one aggregated ``UPDATE`` per interval. That removes row-lock
+contention on ``images`` for viral images at the cost of ``likes_count``
+lagging by up to one interval.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from .db import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LIKE_COUNTER_FLUSH_INTERVAL = float(os.getenv("LIKE_COUNTER_FLUSH_INTERVAL", "0"))
+MAX_LIKED_CHECK = 500
+
+LIKE_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO likes (user_id, image_id) VALUES (:user_id, :image_id)
+        ON CONFLICT DO NOTHING
+        RETURNING image_id
+    )
+    UPDATE images SET likes_count = likes_count + 1
+    WHERE id IN (SELECT image_id FROM inserted)
+    RETURNING likes_count
+""")
+
+UNLIKE_SQL = text("""
+    WITH deleted AS (
+        DELETE FROM likes WHERE user_id = :user_id AND image_id = :image_id
+        RETURNING image_id
+    )
+    UPDATE images SET likes_count = GREATEST(likes_count - 1, 0)
+    WHERE id IN (SELECT image_id FROM deleted)
+    RETURNING likes_count
+""")
+
+INSERT_LIKE_SQL = text("""
+    INSERT INTO likes (user_id, image_id) VALUES (:user_id, :image_id)
+    ON CONFLICT DO NOTHING
+    RETURNING image_id
+""")
+
+DELETE_LIKE_SQL = text("""
+    DELETE FROM likes WHERE user_id = :user_id AND image_id = :image_id
+    RETURNING image_id
+""")
+
+FLUSH_SQL = text("""
+    UPDATE images SET likes_count = GREATEST(images.likes_count + d.delta, 0)
+    FROM unnest(CAST(:ids AS integer[]), CAST(:deltas AS integer[])) AS d(id, delta)
+    WHERE images.id = d.id
+""")
+
+LIKED_SQL = text("SELECT image_id FROM likes WHERE user_id = :user_id AND image_id = ANY(:image_ids)")
+
+
+class LikeCounterBuffer:
+    """Aggregates ``likes_count`` deltas per image and flushes them every ``interval`` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._deltas: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def add(self, image_id: int, delta: int):
+        with self._lock:
+            self._deltas[image_id] += delta
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Flushing like counters failed: {e}")
+
+    def flush(self):
+        with self._lock:
+            pending = {image_id: delta for image_id, delta in self._deltas.items() if delta}
+            self._deltas.clear()
+        if not pending:
+            return
+
+        db = SessionLocal()
+        try:
+            db.execute(FLUSH_SQL, {"ids": list(pending), "deltas": list(pending.values())})
+            db.commit()
+        except Exception:
+            # keep the deltas for the next flush
+            for image_id, delta in pending.items():
+                self.add(image_id, delta)
+            raise
+        finally:
+            db.close()
+
+
+like_buffer = LikeCounterBuffer(LIKE_COUNTER_FLUSH_INTERVAL) if LIKE_COUNTER_FLUSH_INTERVAL > 0 else None
+
+
+async def _toggle(db: AsyncSession, user_id: int, image_id: int, atomic_sql, buffered_sql, delta: int) -> bool:
+    """Run a like/unlike; return False when it was a no-op (already liked / not liked)."""
+    sql = atomic_sql if like_buffer is None else buffered_sql
+    try:
+        changed = (await db.execute(sql, {"user_id": user_id, "image_id": image_id})).first() is not None
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    if changed and like_buffer is not None:
+        like_buffer.add(image_id, delta)
+    return changed
+
+
+async def like(db: AsyncSession, user_id: int, image_id: int) -> bool:
+    return await _toggle(db, user_id, image_id, LIKE_SQL, INSERT_LIKE_SQL, 1)
+
+
+async def unlike(db: AsyncSession, user_id: int, image_id: int) -> bool:
+    return await _toggle(db, user_id, image_id, UNLIKE_SQL, DELETE_LIKE_SQL, -1)
+
+
+async def liked_image_ids(db: AsyncSession, user_id: int, image_ids: List[int]) -> List[int]:
+    rows = (await db.execute(LIKED_SQL, {"user_id": user_id, "image_ids": image_ids})).all()
+    return [row.image_id for row in rows]
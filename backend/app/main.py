@@ -1,33 +1,74 @@
-from fastapi import FastAPI, HTTPException, Query, Depends, Body, UploadFile, File, APIRouter
+from fastapi import FastAPI, HTTPException, Query, Depends, Body, UploadFile, File
 from pydantic import BaseModel
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from .models import Base, Image, Follow, User, Comment, Like
+from .models import Base, Image, Follow, User, Comment, Like, FeedItem
 import os
 from dotenv import load_dotenv
 from sqlalchemy.sql import text
 from embeddings_image import ClipImageEmbedder
 from embeddings_text import ClipTextEmbedder
-from .db import SessionLocal, engine
+from .db import SessionLocal, engine, get_async_db, pool_stats
+from .search import MAX_BATCH_QUERIES, SEARCH_MODES, SearchFilters, search_backend
+from .search_cache import search_cache
+from .duplicates import collapse
+from .neighbors import NEIGHBORS_K, neighbor_refresher, similar_images
+from .feed import feed_refresher, follow, unfollow
+from .jobs import EDIT_JOB_TIMEOUT, EditJobQueue, FINISHED_STATUSES, create_job_store
+from .ingest import IngestPipeline
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page
+from .streaming import MAX_STREAM_PAGE_SIZE, STREAM_FORMATS, stream_keyset_page, stream_query
+from .comments import (
+    DEFAULT_COMMENT_DEPTH, DEFAULT_REPLIES_PAGE_SIZE, MAX_COMMENT_DEPTH, MAX_REPLIES_PAGE_SIZE, comment_tree,
+)
+from .likes import MAX_LIKED_CHECK, like, like_buffer, liked_image_ids, unlike
+from .auth import (
+    CurrentUser, create_access_token, decode_token, get_current_user, get_current_username,
+    get_optional_user, get_password_hash, verify_password,
+)
+import asyncio
+import dataclasses
 import logging
 import sys
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import requests
 from io import BytesIO
-import traceback
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import ImageDraw
-import base64
 import json
-import tempfile
 from fastapi.responses import StreamingResponse
-from dalle_chat import edit_image
+from dalle_chat import aedit_image
+from http_client import UnsafeURLError, http_client
+from contextlib import asynccontextmanager
 from google.oauth2 import id_token
 from google.auth.transport.requests import Request as GoogleRequest
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await edit_jobs.start()
+    await ingest_pipeline.start()
+    if like_buffer is not None:
+        await like_buffer.start()
+    if neighbor_refresher is not None:
+        await neighbor_refresher.start()
+    if feed_refresher is not None:
+        await feed_refresher.start()
+    yield
+    if feed_refresher is not None:
+        await feed_refresher.stop()
+    if neighbor_refresher is not None:
+        await neighbor_refresher.stop()
+    if like_buffer is not None:
+        await like_buffer.stop()
+    await ingest_pipeline.stop()
+    await edit_jobs.stop()
+    for embedder in (text_embedder, image_embedder):
+        if embedder.batcher is not None:
+            await embedder.batcher.close()
+        if embedder.cache is not None:
+            await asyncio.to_thread(embedder.cache.close)
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -38,8 +79,28 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-image_embedder = ClipImageEmbedder()
+def find_stored_embedding(image_url: str):
+    """Reuse the vector of an image that is already in the gallery."""
+    db = SessionLocal()
+    try:
+        row = db.query(Image.vector_embedding).filter(
+            Image.image_url == image_url, Image.vector_embedding.isnot(None)
+        ).first()
+        return row.vector_embedding.tolist() if row else None
+    finally:
+        db.close()
+
+image_embedder = ClipImageEmbedder(url_lookup=find_stored_embedding)
 text_embedder = ClipTextEmbedder()
+edit_jobs = EditJobQueue(create_job_store(), aedit_image, workers=int(os.getenv("EDIT_JOB_WORKERS", "2")))
+
+def on_image_ready(image_id: int, embedding: list, row):
+    """Make a freshly ingested image searchable in this worker's in-memory indexes and caches."""
+    search_backend.add(image_id, embedding, row)
+    search_cache.add(image_id, embedding, row)
+
+ingest_pipeline = IngestPipeline(image_embedder, on_ready=on_image_ready, workers=int(os.getenv("INGEST_WORKERS", "4")))
+INGEST_BULK_MAX = int(os.getenv("INGEST_BULK_MAX", "100"))
 
 load_dotenv()
 
@@ -63,47 +124,23 @@ class ImageCreate(BaseModel):
 class FollowRequest(BaseModel):
     user_id: int
 
-SECRET_KEY = "your_secret_key"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 90
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def create_access_token(data: dict, expires_delta: timedelta = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
 @app.post("/signup/")
-async def signup(username: str = Body(...), email: str = Body(...), password: str = Body(...)):
-    db = SessionLocal()
-    try:
-        existing_user = db.query(User).filter((User.username == username) | (User.email == email)).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Username or email already exists")
-
-        hashed_password = get_password_hash(password)
-        new_user = User(username=username, email=email, password_hash=hashed_password)
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        return {"message": "User created successfully"}
-    finally:
-        db.close()
+async def signup(username: str = Body(...), email: str = Body(...), password: str = Body(...), db: AsyncSession = Depends(get_async_db)):
+    existing_user = (await db.execute(
+        select(User).where((User.username == username) | (User.email == email))
+    )).scalars().first()
+    if existing_user:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
+
+    hashed_password = get_password_hash(password)
+    new_user = User(username=username, email=email, password_hash=hashed_password)
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return {"message": "User created successfully"}
 
 @app.post("/token/")
-async def login_for_access_token(payload: dict = Body(...)):
+async def login_for_access_token(payload: dict = Body(...), db: AsyncSession = Depends(get_async_db)):
     try:
         username = payload.get("username")
         password = payload.get("password")
@@ -111,16 +148,12 @@ async def login_for_access_token(payload: dict = Body(...)):
         if not username or not password:
             raise HTTPException(status_code=400, detail="Username and password are required")
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user or not verify_password(password, user.password_hash):
-                raise HTTPException(status_code=401, detail="Invalid username or password")
+        user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+        if not user or not verify_password(password, user.password_hash):
+            raise HTTPException(status_code=401, detail="Invalid username or password")
 
-            access_token = create_access_token(data={"sub": user.username})
-            return {"access_token": access_token, "token_type": "bearer"}
-        finally:
-            db.close()
+        access_token = create_access_token(data={"sub": user.username})
+        return {"access_token": access_token, "token_type": "bearer"}
 
     except HTTPException:
         raise
@@ -134,7 +167,7 @@ class GoogleLoginRequest(BaseModel):
 
 
 @app.post("/google-login/")
-async def google_login(payload: GoogleLoginRequest):
+async def google_login(payload: GoogleLoginRequest, db: AsyncSession = Depends(get_async_db)):
     try:
         idinfo = id_token.verify_oauth2_token(
             payload.id_token,
@@ -145,158 +178,153 @@ async def google_login(payload: GoogleLoginRequest):
         email = idinfo["email"]
         username = email.split("@")[0]  # можно доработать под себя
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.email == email).first()
+        user = (await db.execute(select(User).where(User.email == email))).scalars().first()
 
-            if not user:
-                # Регаем нового
-                user = User(username=username, email=email, password_hash="google-oauth")
-                db.add(user)
-                db.commit()
-                db.refresh(user)
+        if not user:
+            # Регаем нового
+            user = User(username=username, email=email, password_hash="google-oauth")
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
 
-            # Выдаем JWT
-            access_token = create_access_token(data={"sub": user.username})
-            return {"access_token": access_token, "token_type": "bearer"}
-        finally:
-            db.close()
+        # Выдаем JWT
+        access_token = create_access_token(data={"sub": user.username})
+        return {"access_token": access_token, "token_type": "bearer"}
 
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid Google token")
 
 @app.get("/users/me/")
-async def read_users_me(token: str = Depends(oauth2_scheme)):
+async def read_users_me(username: str = Depends(get_current_username)):
+    return {"username": username}
+
+def _payload_int(payload: dict, key: str) -> int | None:
+    # asyncpg binds parameters strictly, so ids sent as strings are converted here
+    value = payload.get(key)
+    if value is None or value == "":
+        return None
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return {"username": username}
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-@app.post("/images/")
-async def add_image_with_url(payload: dict = Body(...), token: str = Depends(oauth2_scheme)):
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{key} must be an integer")
+
+def _parse_image_payload(payload: dict) -> dict:
+    image_url = payload.get("image_url")
+    if not image_url:
+        raise HTTPException(status_code=400, detail="Image URL is required")
+    return {
+        "image_url": image_url,
+        "description": payload.get("description"),
+        "is_ai_generated": bool(payload.get("is_ai_generated", False)),
+    }
+
+@app.post("/images/", status_code=202)
+async def add_image_with_url(payload: dict = Body(...), user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     try:
-        jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = jwt_payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-        finally:
-            db.close()
+        fields = _parse_image_payload(payload)
 
-        image_url = payload.get("image_url")
-        description = payload.get("description")
-        is_ai_generated = bool(payload.get("is_ai_generated", False))
-        if not image_url:
-            raise HTTPException(status_code=400, detail="Image URL is required")
+        new_image = Image(user_id=user.id, ingest_status="pending", **fields)
+        db.add(new_image)
+        await db.commit()
+        await db.refresh(new_image)
 
-        embedding = image_embedder.get_embedding(image_url)
-        if not embedding:
-            raise HTTPException(status_code=500, detail="Failed to generate embedding")
+        ingest_pipeline.enqueue(new_image.id, new_image.image_url)
+        return {"id": new_image.id, "status": "pending", "message": "Image accepted for processing"}
 
-        if len(embedding) != 512:
-            print(f"Warning: Embedding length is {len(embedding)}, expected 512.")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {e}")
 
-        db = SessionLocal()
-        try:
-            new_image = Image(
-                user_id=user.id,
-                image_url=image_url,
-                is_ai_generated=is_ai_generated,
-                description=description,
-                vector_embedding=embedding
-            )
-            db.add(new_image)
-            db.commit()
-            db.refresh(new_image)
-            return {"id": new_image.id, "message": "Image added successfully"}
-        finally:
-            db.close()
+@app.post("/images/bulk/", status_code=202)
+async def add_images_bulk(payload: dict = Body(...), user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    try:
+        items = payload.get("images")
+        if not items or not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="A non-empty list of images is required")
+        if len(items) > INGEST_BULK_MAX:
+            raise HTTPException(status_code=400, detail=f"At most {INGEST_BULK_MAX} images per request")
+        rows = [_parse_image_payload(item if isinstance(item, dict) else {"image_url": item}) for item in items]
+
+        new_images = [Image(user_id=user.id, ingest_status="pending", **fields) for fields in rows]
+        db.add_all(new_images)
+        await db.commit()
+        accepted = [(image.id, image.image_url) for image in new_images]
+
+        for image_id, image_url in accepted:
+            ingest_pipeline.enqueue(image_id, image_url)
+        return {"ids": [image_id for image_id, _ in accepted], "status": "pending"}
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing image: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing images: {e}")
+
+def search_filters(
+    is_ai_generated: bool | None = Query(None),
+    user_id: int | None = Query(None, description="Only images of this owner"),
+    created_after: datetime | None = Query(None),
+    created_before: datetime | None = Query(None),
+    viewer: CurrentUser | None = Depends(get_optional_user),
+) -> SearchFilters:
+    """Filters shared by the search endpoints. Private images only show up when
+    a signed-in user filters on their own ``user_id``."""
+    return SearchFilters(
+        is_ai_generated=is_ai_generated,
+        user_id=user_id,
+        created_after=created_after,
+        created_before=created_before,
+        viewer_id=viewer.id if viewer else None,
+    )
 
 @app.post("/search/")
 async def search_images(
     payload: dict = Body(...),
     min_similarity: float = Query(0, ge=0.0, le=1.0),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1, le=100)
+    per_page: int = Query(10, ge=1, le=100),
+    ef_search: int | None = Query(None, ge=1, le=1000),
+    probes: int | None = Query(None, ge=1),
+    mode: str = Query("vector", pattern=SEARCH_MODES),
+    vector_weight: float = Query(1.0, ge=0.0),
+    text_weight: float = Query(1.0, ge=0.0),
+    collapse_duplicates: bool = Query(False),
+    filters: SearchFilters = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         query = payload.get("query")
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
 
-        query_embedding = text_embedder.get_text_embedding(query)
+        query_embedding = await text_embedder.aget_text_embedding(query)
 
         if len(query_embedding) != 512:
             raise HTTPException(status_code=400, detail="Invalid embedding dimension")
 
-        db = SessionLocal()
         try:
-            embedding_str = ",".join(map(str, query_embedding))
-            offset = (page - 1) * per_page
-
-            sql_query = text("""
-                WITH ranked_results AS (
-                    SELECT 
-                        id,
-                        image_url,
-                        description,
-                        width,
-                        height,
-                        size,
-                        format,
-                        likes_count,
-                        1 - (vector_embedding <=> :embedding) AS similarity,
-                        ROW_NUMBER() OVER (
-                            ORDER BY (vector_embedding <=> :embedding)
-                        ) AS rank
-                    FROM images
-                    WHERE 1 - (vector_embedding <=> :embedding) > :min_similarity
+            if mode == "hybrid":
+                results = await search_cache.hybrid_search(
+                    db, query_embedding, query, min_similarity, page, per_page,
+                    vector_weight, text_weight, ef_search, probes, filters=filters
+                )
+            else:
+                results = await search_cache.search(
+                    db, query_embedding, min_similarity, page, per_page, ef_search, probes,
+                    text_query=query if mode == "filtered" else None, filters=filters
                 )
-                SELECT id, image_url, description, width, height, size, format, likes_count, similarity
-                FROM ranked_results
-                WHERE rank BETWEEN :offset AND :offset + :limit
-                ORDER BY rank
-            """)
-
-            results = db.execute(sql_query, {
-                "embedding": f"[{embedding_str}]",
-                "min_similarity": min_similarity,
-                "offset": offset,
-                "limit": per_page
-            }).fetchall()
+
+            if collapse_duplicates:
+                results = collapse(results)
 
             if not results:
                 raise HTTPException(status_code=404, detail="No images found")
 
-            return [
-                {
-                    "id": row.id,
-                    "image_url": row.image_url,
-                    "description": row.description,
-                    "likes_count": row.likes_count,
-                    "similarity": round(row.similarity, 4)
-                } for row in results
-            ]
+            return results
 
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-        finally:
-            db.close()
 
     except HTTPException:
         raise
@@ -305,136 +333,344 @@ async def search_images(
 
 
 @app.post("/search-by-image/")
-async def search_by_image(payload: dict = Body(...), min_similarity: float = Query(0, ge=0.0, le=1.0), page: int = Query(1, ge=1), per_page: int = Query(10, ge=1, le=100)):
+async def search_by_image(
+    payload: dict = Body(...),
+    min_similarity: float = Query(0, ge=0.0, le=1.0),
+    page: int = Query(1, ge=1),
+    per_page: int = Query(10, ge=1, le=100),
+    ef_search: int | None = Query(None, ge=1, le=1000),
+    probes: int | None = Query(None, ge=1),
+    collapse_duplicates: bool = Query(False),
+    filters: SearchFilters = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
         image_url = payload.get("image_url")
-        embedding = image_embedder.get_embedding(image_url)
+        embedding = await image_embedder.aget_embedding(image_url)
 
         if len(embedding) != 512:
             raise HTTPException(status_code=400, detail="Invalid embedding dimension")
 
-        db = SessionLocal()
         try:
-            embedding_str = ",".join(map(str, embedding))
-            offset = (page - 1) * per_page
-
-            sql_query = text("""
-                WITH ranked_results AS (
-                    SELECT 
-                        id,
-                        image_url,
-                        description,
-                        width,
-                        height,
-                        size,
-                        format,
-                        likes_count,
-                        1 - (vector_embedding <=> :embedding) AS similarity,
-                        ROW_NUMBER() OVER (
-                            ORDER BY (vector_embedding <=> :embedding)
-                        ) AS rank
-                    FROM images
-                    WHERE 1 - (vector_embedding <=> :embedding) > :min_similarity
-                )
-                SELECT id, image_url, description, width, height, size, format, likes_count, similarity
-                FROM ranked_results
-                WHERE rank BETWEEN :offset AND :offset + :limit
-                ORDER BY rank
-            """)
-
-            results = db.execute(sql_query, {
-                "embedding": f"[{embedding_str}]",
-                "min_similarity": min_similarity,
-                "offset": offset,
-                "limit": per_page
-            }).fetchall()
+            results = await search_cache.search(
+                db, embedding, min_similarity, page, per_page, ef_search, probes, filters=filters
+            )
+
+            if collapse_duplicates:
+                results = collapse(results)
 
             if not results:
                 raise HTTPException(status_code=404, detail="No images found")
 
-            return [
-                {
-                    "id": row.id,
-                    "image_url": row.image_url,
-                    "description": row.description,
-                    "likes_count": row.likes_count,
-                    "similarity": round(row.similarity, 4)
-                } for row in results
-            ]
+            return results
 
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-        finally:
-            db.close()
 
     except HTTPException:
         raise
+    except UnsafeURLError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching by image: {e}")
 
-@app.get("/get-images/")
-async def get_non_private_images():
+async def _embedded_image(db: AsyncSession, payload: dict, viewer_id: int | None):
+    """The image named by ``payload["image_id"]`` with its stored vector, if the viewer may see it."""
+    image_id = _payload_int(payload, "image_id")
+    if not image_id:
+        raise HTTPException(status_code=400, detail="Image ID is required")
+
+    image = (await db.execute(
+        select(Image.id, Image.user_id, Image.is_private, Image.vector_embedding, Image.neighbors_updated_at)
+        .where(Image.id == image_id)
+    )).first()
+    if not image or (image.is_private and image.user_id != viewer_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.vector_embedding is None:
+        raise HTTPException(status_code=409, detail="Image is not indexed yet")
+    return image
+
+@app.post("/search-by-id/")
+async def search_by_id(
+    payload: dict = Body(...),
+    min_similarity: float = Query(0, ge=0.0, le=1.0),
+    page: int = Query(1, ge=1),
+    per_page: int = Query(10, ge=1, le=100),
+    ef_search: int | None = Query(None, ge=1, le=1000),
+    probes: int | None = Query(None, ge=1),
+    collapse_duplicates: bool = Query(False),
+    filters: SearchFilters = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Like ``/search-by-image/`` for a gallery image, using its stored vector
+    instead of downloading and embedding it again. The image itself is left out."""
     try:
-        db = SessionLocal()
+        image = await _embedded_image(db, payload, filters.viewer_id)
+
         try:
-            results = db.query(Image, User.username).join(User, Image.user_id == User.id).filter(Image.is_private == False).all()
+            results = await search_cache.search(
+                db, image.vector_embedding.tolist(), min_similarity, page, per_page, ef_search, probes,
+                filters=dataclasses.replace(filters, exclude_id=image.id)
+            )
+
+            if collapse_duplicates:
+                results = collapse(results)
 
             if not results:
                 raise HTTPException(status_code=404, detail="No images found")
 
-            return [
-                {
-                    "id": row.Image.id,
-                    "username": row.username,
-                    "image_url": row.Image.image_url,
-                    "description": row.Image.description,
-                    "is_ai_generated": row.Image.is_ai_generated,
-                    "likes_count": row.Image.likes_count
-                } for row in results
-            ]
+            return results
 
-        finally:
-            db.close()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Error searching by image id: {e}")
+
+@app.post("/similar-images/")
+async def get_similar_images(
+    payload: dict = Body(...),
+    page: int = Query(1, ge=1),
+    per_page: int = Query(min(10, NEIGHBORS_K), ge=1, le=NEIGHBORS_K),
+    viewer: CurrentUser | None = Depends(get_optional_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """"More like this" for an image page, read from the precomputed
+    ``image_neighbors`` list (app/neighbors.py). Until the background refresh
+    has reached a new image, its neighbours are searched live instead."""
+    try:
+        image = await _embedded_image(db, payload, viewer.id if viewer else None)
 
+        try:
+            if image.neighbors_updated_at is not None:
+                return await similar_images(db, image.id, page, per_page)
+            return collapse(await search_cache.search(
+                db, image.vector_embedding.tolist(), page=page, per_page=per_page,
+                filters=SearchFilters(exclude_id=image.id)
+            ))
 
-@app.get("/get-my-images/")
-async def get_my_images(token: str = Depends(oauth2_scheme)):
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching similar images: {e}")
+
+@app.post("/search/batch/")
+async def search_batch(
+    payload: dict = Body(...),
+    min_similarity: float = Query(0, ge=0.0, le=1.0),
+    per_page: int = Query(10, ge=1, le=100),
+    ef_search: int | None = Query(None, ge=1, le=1000),
+    probes: int | None = Query(None, ge=1),
+    collapse_duplicates: bool = Query(False),
+    filters: SearchFilters = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Run many searches at once: ``{"queries": [{"query": ...} | {"image_url": ...}, ...]}``.
+
+    Texts and images are each embedded in one CLIP call and all lookups share
+    one database round-trip. Results come back in request order, one list per
+    query (empty when nothing matched).
+    """
     try:
-        jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = jwt_payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        queries = payload.get("queries")
+        if not isinstance(queries, list) or not queries:
+            raise HTTPException(status_code=400, detail="queries must be a non-empty list")
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+
+        texts, images = {}, {}
+        for i, item in enumerate(queries):
+            if isinstance(item, dict) and isinstance(item.get("query"), str) and item["query"].strip():
+                texts[i] = item["query"]
+            elif isinstance(item, dict) and isinstance(item.get("image_url"), str) and item["image_url"]:
+                images[i] = item["image_url"]
+            else:
+                raise HTTPException(status_code=400, detail=f"Query {i} needs a non-empty 'query' or 'image_url'")
+
+        text_embeddings, image_embeddings = await asyncio.gather(
+            text_embedder.aget_text_embedding_batch(list(texts.values())) if texts else asyncio.sleep(0, []),
+            image_embedder.aget_embedding_batch(list(images.values())) if images else asyncio.sleep(0, []),
+        )
+        embeddings = dict(zip(texts, text_embeddings)) | dict(zip(images, image_embeddings))
+        if any(len(embedding) != 512 for embedding in embeddings.values()):
+            raise HTTPException(status_code=400, detail="Invalid embedding dimension")
 
-        db = SessionLocal()
         try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
+            results = await search_backend.search_batch(
+                db, [embeddings[i] for i in range(len(queries))], min_similarity, per_page,
+                ef_search, probes, filters=filters
+            )
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-            results = db.query(Image).filter(Image.user_id == user.id).all()
+        if collapse_duplicates:
+            results = [collapse(items) for items in results]
 
-            if not results:
-                raise HTTPException(status_code=404, detail="No images found")
+        return [
+            {"query": texts[i], "results": items} if i in texts else {"image_url": images[i], "results": items}
+            for i, items in enumerate(results)
+        ]
+
+    except HTTPException:
+        raise
+    except UnsafeURLError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in batch search: {e}")
+
+@app.get("/pool-stats/")
+async def get_pool_stats(user: CurrentUser = Depends(get_current_user)):
+    """Connection pool usage of this worker, for sizing DB_POOL_SIZE against the worker count."""
+    return pool_stats()
+
+@app.get("/cache-stats/")
+async def get_cache_stats(user: CurrentUser = Depends(get_current_user)):
+    return {
+        "text_embeddings": text_embedder.cache.stats() if text_embedder.cache else None,
+        "image_embeddings": image_embedder.cache.stats() if image_embedder.cache else None,
+        "search_results": search_cache.stats() if search_cache.enabled else None
+    }
+
+def _page_size(limit: int, stream: str | None) -> int:
+    if not stream and limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit above {MAX_PAGE_SIZE} requires stream mode")
+    return limit
+
+def _gallery_item(row) -> dict:
+    return {
+        "id": row.Image.id,
+        "username": row.username,
+        "image_url": row.Image.image_url,
+        "description": row.Image.description,
+        "is_ai_generated": row.Image.is_ai_generated,
+        "likes_count": row.Image.likes_count
+    }
+
+def _user_image_item(image, username: str) -> dict:
+    return {
+        "id": image.id,
+        "image_url": image.image_url,
+        "username": username,
+        "description": image.description,
+        "is_ai_generated": image.is_ai_generated,
+        "created_at": image.created_at,
+        "likes_count": image.likes_count
+    }
 
-            return [
+@app.get("/get-images/")
+async def get_non_private_images(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_STREAM_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    stream: str | None = Query(None, pattern=STREAM_FORMATS),
+    is_ai_generated: bool | None = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        limit = _page_size(limit, stream)
+
+        stmt = select(Image, User.username).join(User, Image.user_id == User.id).where(
+            Image.is_private == False, Image.ingest_status == "ready"
+        )
+        if is_ai_generated is not None:
+            stmt = stmt.where(Image.is_ai_generated == is_ai_generated)
+
+        gallery_key = lambda row: (row.Image.created_at, row.Image.id)
+        if stream:
+            return stream_keyset_page(stmt, _gallery_item, stream, Image.created_at, Image.id,
+                                      cursor, limit, key=gallery_key)
+
+        results, next_cursor = await keyset_page(
+            db, stmt, Image.created_at, Image.id, cursor, limit, key=gallery_key
+        )
+
+        if not results and cursor is None and is_ai_generated is None:
+            raise HTTPException(status_code=404, detail="No images found")
+
+        return {
+            "items": [_gallery_item(row) for row in results],
+            "next_cursor": next_cursor
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/feed/")
+async def get_feed(
+    user: CurrentUser = Depends(get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """The signed-in user's feed: uploads of followed users and images close to
+    what they liked, newest first (see app/feed.py). Each item says why it is there."""
+    try:
+        stmt = (
+            select(Image, User.username, FeedItem.reason, FeedItem.created_at.label("feed_at"))
+            .select_from(FeedItem)
+            .join(Image, Image.id == FeedItem.image_id)
+            .join(User, User.id == Image.user_id)
+            .where(FeedItem.user_id == user.id, Image.is_private == False)
+        )
+
+        results, next_cursor = await keyset_page(
+            db, stmt, FeedItem.created_at, FeedItem.image_id, cursor, limit,
+            key=lambda row: (row.feed_at, row.Image.id)
+        )
+
+        return {
+            "items": [{**_gallery_item(row), "reason": row.reason} for row in results],
+            "next_cursor": next_cursor
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching feed: {e}")
+
+@app.get("/get-my-images/")
+async def get_my_images(
+    user: CurrentUser = Depends(get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    is_ai_generated: bool | None = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        stmt = select(Image).where(Image.user_id == user.id)
+        if is_ai_generated is not None:
+            stmt = stmt.where(Image.is_ai_generated == is_ai_generated)
+        results, next_cursor = await keyset_page(db, stmt, Image.created_at, Image.id, cursor, limit)
+
+        if not results and cursor is None and is_ai_generated is None:
+            raise HTTPException(status_code=404, detail="No images found")
+
+        return {
+            "items": [
                 {
                     "id": row.id,
                     "image_url": row.image_url,
                     "username": "My",
                     "description": row.description,
                     "is_ai_generated": row.is_ai_generated,
-                    "likes_count": row.likes_count
+                    "likes_count": row.likes_count,
+                    # the owner also sees uploads that are still pending or failed
+                    "ingest_status": row.ingest_status
                 } for row in results
-            ]
-
-        finally:
-            db.close()
+            ],
+            "next_cursor": next_cursor
+        }
 
     except HTTPException:
         raise
@@ -442,34 +678,34 @@ async def get_my_images(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/user-images/")
-async def get_user_images(payload: dict = Body(...)):
+async def get_user_images(
+    payload: dict = Body(...),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_STREAM_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    stream: str | None = Query(None, pattern=STREAM_FORMATS),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
+        limit = _page_size(limit, stream)
         username = payload.get("username")
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-
-            images = db.query(Image).filter(Image.user_id == user.id).all()
+        user_id = (await db.execute(select(User.id).where(User.username == username))).scalar()
+        if user_id is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        stmt = select(Image).where(Image.user_id == user_id, Image.ingest_status == "ready")
+        if stream:
+            await db.close()  # the stream reads through its own session
+            return stream_keyset_page(
+                stmt, lambda image: _user_image_item(image, username),
+                stream, Image.created_at, Image.id, cursor, limit
+            )
 
-            if not images:
-                return []
+        images, next_cursor = await keyset_page(db, stmt, Image.created_at, Image.id, cursor, limit)
 
-            return [
-                {
-                    "id": image.id,
-                    "image_url": image.image_url,
-                    "username": username,
-                    "description": image.description,
-                    "is_ai_generated": image.is_ai_generated,
-                    "created_at": image.created_at,
-                    "likes_count": image.likes_count
-                } for image in images
-            ]
-
-        finally:
-            db.close()
+        return {
+            "items": [_user_image_item(image, username) for image in images],
+            "next_cursor": next_cursor
+        }
 
     except HTTPException:
         raise
@@ -479,39 +715,27 @@ async def get_user_images(payload: dict = Body(...)):
 @app.post("/comments/")
 async def add_comment(
     payload: dict = Body(...),
-    token: str = Depends(oauth2_scheme)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = jwt_payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        image_id = payload.get("image_id")
+        image_id = _payload_int(payload, "image_id")
         content = payload.get("content")
-        parent_comment_id = payload.get("parent_comment_id")
+        parent_comment_id = _payload_int(payload, "parent_comment_id")
 
         if not image_id or not content:
             raise HTTPException(status_code=400, detail="Image ID and content are required")
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-
-            new_comment = Comment(
-                user_id=user.id,
-                image_id=image_id,
-                content=content,
-                parent_comment_id=parent_comment_id
-            )
-            db.add(new_comment)
-            db.commit()
-            db.refresh(new_comment)
-            return {"id": new_comment.id, "message": "Comment added successfully"}
-        finally:
-            db.close()
+        new_comment = Comment(
+            user_id=user.id,
+            image_id=image_id,
+            content=content,
+            parent_comment_id=parent_comment_id
+        )
+        db.add(new_comment)
+        await db.commit()
+        await db.refresh(new_comment)
+        return {"id": new_comment.id, "message": "Comment added successfully"}
 
     except HTTPException:
         raise
@@ -519,73 +743,83 @@ async def add_comment(
         raise HTTPException(status_code=500, detail=f"Error adding comment: {e}")
 
 
+def _comment_item(comment) -> dict:
+    return {
+        "id": comment.Comment.id,
+        "username": comment.username,
+        "image_id": comment.Comment.image_id,
+        "parent_comment_id": comment.Comment.parent_comment_id,
+        "content": comment.Comment.content,
+        "created_at": comment.Comment.created_at,
+    }
+
 @app.post("/comments/image/")
-async def get_comments_for_image(payload: dict = Body(...)):
+async def get_comments_for_image(
+    payload: dict = Body(...),
+    stream: str | None = Query(None, pattern=STREAM_FORMATS),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
-        image_id = payload.get("image_id")
+        image_id = _payload_int(payload, "image_id")
         if not image_id:
             raise HTTPException(status_code=400, detail="Image ID is required")
 
-        db = SessionLocal()
-        try:
-            comments = db.query(Comment, User.username).join(User, Comment.user_id == User.id).filter(Comment.image_id == image_id).all()
+        stmt = select(Comment, User.username).join(User, Comment.user_id == User.id).where(Comment.image_id == image_id)
 
-            if not comments:
-                return []
+        if stream:
+            return stream_query(stmt, _comment_item, stream)
 
-            return [
-                {
-                    "id": comment.Comment.id,
-                    "username": comment.username,
-                    "image_id": comment.Comment.image_id,
-                    "parent_comment_id": comment.Comment.parent_comment_id,
-                    "content": comment.Comment.content,
-                    "created_at": comment.Comment.created_at,
-                } for comment in comments
-            ]
-
-        finally:
-            db.close()
+        comments = (await db.execute(stmt)).all()
+
+        if not comments:
+            return []
+
+        return [_comment_item(comment) for comment in comments]
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching comments: {e}")
 
-
-@app.post("/likes/")
-async def like_post(payload: dict = Body(...), token: str = Depends(oauth2_scheme)):
+@app.post("/comments/tree/")
+async def get_comment_tree(
+    payload: dict = Body(...),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    depth: int = Query(DEFAULT_COMMENT_DEPTH, ge=1, le=MAX_COMMENT_DEPTH),
+    replies_limit: int = Query(DEFAULT_REPLIES_PAGE_SIZE, ge=1, le=MAX_REPLIES_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Nested comments of an image. Without ``parent_id`` returns top-level comments
+    (newest first); with ``parent_id`` returns that comment's replies (oldest first).
+    Follow ``next_cursor`` for the next page and a comment's ``replies_cursor``
+    (together with ``parent_id``) for more of its replies.
+    """
     try:
-        jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = jwt_payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        image_id = payload.get("image_id")
+        image_id = _payload_int(payload, "image_id")
         if not image_id:
             raise HTTPException(status_code=400, detail="Image ID is required")
+        parent_id = _payload_int(payload, "parent_id")
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
+        return await comment_tree(db, image_id, parent_id, cursor, limit, replies_limit, depth)
 
-            existing_like = db.query(Like).filter(Like.user_id == user.id, Like.image_id == image_id).first()
-            if existing_like:
-                return
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching comments: {e}")
 
-            new_like = Like(user_id=user.id, image_id=image_id)
-            db.add(new_like)
 
-            image = db.query(Image).filter(Image.id == image_id).first()
-            if image:
-                image.likes_count += 1
+@app.post("/likes/")
+async def like_post(payload: dict = Body(...), user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    try:
+        image_id = _payload_int(payload, "image_id")
+        if not image_id:
+            raise HTTPException(status_code=400, detail="Image ID is required")
 
-            db.commit()
-            return {"message": "Post liked successfully"}
-        finally:
-            db.close()
+        if not await like(db, user.id, image_id):
+            return
+        return {"message": "Post liked successfully"}
 
     except HTTPException:
         raise
@@ -593,50 +827,62 @@ async def like_post(payload: dict = Body(...), token: str = Depends(oauth2_schem
         raise HTTPException(status_code=500, detail=f"Error liking post: {e}")
 
 @app.delete("/likes/")
-async def unlike_post(payload: dict = Body(...), token: str = Depends(oauth2_scheme)):
+async def unlike_post(payload: dict = Body(...), user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     try:
-        jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = jwt_payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        image_id = payload.get("image_id")
+        image_id = _payload_int(payload, "image_id")
         if not image_id:
             raise HTTPException(status_code=400, detail="Image ID is required")
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
+        if not await unlike(db, user.id, image_id):
+            return
+        return {"message": "Post unliked successfully"}
 
-            existing_like = db.query(Like).filter(Like.user_id == user.id, Like.image_id == image_id).first()
-            if not existing_like:
-                return
-            db.delete(existing_like)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error unliking post: {e}")
+
+@app.post("/follow/")
+async def follow_user(payload: FollowRequest, user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    try:
+        if not await follow(db, user.id, payload.user_id):
+            return
+        return {"message": "User followed successfully"}
 
-            image = db.query(Image).filter(Image.id == image_id).first()
-            if image and image.likes_count > 0:
-                image.likes_count -= 1
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error following user: {e}")
 
-            db.commit()
-            return {"message": "Post unliked successfully"}
-        finally:
-            db.close()
+@app.delete("/follow/")
+async def unfollow_user(payload: FollowRequest, user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    try:
+        if not await unfollow(db, user.id, payload.user_id):
+            return
+        return {"message": "User unfollowed successfully"}
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error unliking post: {e}")
+        raise HTTPException(status_code=500, detail=f"Error unfollowing user: {e}")
+
+@app.post("/likes/check/")
+async def check_likes(payload: dict = Body(...), user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Which of ``image_ids`` the current user has liked, in one query."""
+    image_ids = payload.get("image_ids")
+    if not isinstance(image_ids, list) or not all(isinstance(i, int) for i in image_ids):
+        raise HTTPException(status_code=400, detail="A list of image IDs is required")
+    if len(image_ids) > MAX_LIKED_CHECK:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LIKED_CHECK} image IDs per request")
 
-@app.post("/generate-image/")
-async def generate_image_with_dalle(payload: dict = Body(...), token: str = Depends(oauth2_scheme)):
     try:
-        jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = jwt_payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        return {"liked": await liked_image_ids(db, user.id, image_ids) if image_ids else []}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking likes: {e}")
 
+@app.post("/generate-image/")
+async def generate_image_with_dalle(payload: dict = Body(...), username: str = Depends(get_current_username)):
+    try:
         prompt = payload.get("prompt")
         size = "1024x1024"
         style = "vivid"
@@ -667,7 +913,7 @@ async def generate_image_with_dalle(payload: dict = Body(...), token: str = Depe
             "n": n
         }
 
-        response = requests.post(dalle_url, headers=headers, json=data)
+        response = await http_client.post("dalle", dalle_url, headers=headers, json=data)
 
         if response.status_code != 200:
             raise HTTPException(status_code=response.status_code, detail=f"DALL-E API error: {response.text}")
@@ -684,68 +930,102 @@ async def generate_image_with_dalle(payload: dict = Body(...), token: str = Depe
         raise HTTPException(status_code=500, detail=f"Error generating image: {e}")
 
 @app.post("/image-info/")
-async def get_image_info(payload: dict = Body(...)):
+async def get_image_info(payload: dict = Body(...), db: AsyncSession = Depends(get_async_db)):
     try:
-        image_id = payload.get("image_id")
+        image_id = _payload_int(payload, "image_id")
         if not image_id:
             raise HTTPException(status_code=400, detail="Image ID is required")
 
-        db = SessionLocal()
-        try:
-            image = db.query(Image).filter(Image.id == image_id).first()
-            if not image:
-                raise HTTPException(status_code=404, detail="Image not found")
-
-            user = db.query(User).filter(User.id == image.user_id).first()
-
-            return {
-                "id": image.id,
-                "image_url": image.image_url,
-                "description": image.description,
-                "is_ai_generated": image.is_ai_generated,
-                "likes_count": image.likes_count,
-                "created_at": image.created_at,
-                "username": user.username
-            }
-        finally:
-            db.close()
+        image = await db.get(Image, image_id)
+        if not image:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        user = await db.get(User, image.user_id)
+
+        return {
+            "id": image.id,
+            "image_url": image.image_url,
+            "description": image.description,
+            "is_ai_generated": image.is_ai_generated,
+            "likes_count": image.likes_count,
+            "created_at": image.created_at,
+            "username": user.username,
+            "width": image.width,
+            "height": image.height,
+            "size": image.size,
+            "format": image.format,
+            "ingest_status": image.ingest_status
+        }
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching image information: {e}")
 
-@app.post("/edit-image/", response_class=StreamingResponse)
+def _job_status(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+        "status_url": f"/edit-image/{job['id']}",
+        "result_url": f"/edit-image/{job['id']}/result",
+    }
+
+async def _get_owned_job(job_id: str, username: str) -> dict:
+    # the SQL store blocks, so it is read off the event loop like the workers do
+    job = await asyncio.to_thread(edit_jobs.store.get, job_id)
+    if not job or job["username"] != username:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/edit-image/", status_code=202)
 async def edit_image_endpoint(
     file: UploadFile = File(...),
     prompt: str = Body(...),
-    token: str = Depends(oauth2_scheme)
+    username: str = Depends(get_current_username)
 ):
     """
-    Endpoint to edit an uploaded image using a text prompt via DALL-E edits API.
-    Returns the edited image as PNG stream.
+    Queue an edit of the uploaded image using a text prompt via DALL-E edits API.
+    Returns 202 with a job id; poll the status URL (or subscribe to
+    /edit-image/{job_id}/events) and download the PNG from the result URL.
     """
-    # Verify token
-    jwt_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    username: str = jwt_payload.get("sub")
-    if username is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Read uploaded file
     content = await file.read()
-    # Save to temporary file
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-        tmp.write(content)
-        tmp_path = tmp.name
-
-    # Perform edit
-    edited_img = edit_image(tmp_path, prompt)
-
-    # Convert to PNG buffer
-    buf = BytesIO()
-    edited_img.save(buf, format="PNG")
-    buf.seek(0)
-
-    return StreamingResponse(buf, media_type="image/png")
-
+    job_id = await edit_jobs.submit(username, content, prompt)
+    return _job_status(await asyncio.to_thread(edit_jobs.store.get, job_id))
+
+@app.get("/edit-image/{job_id}")
+async def get_edit_job(job_id: str, username: str = Depends(get_current_username)):
+    return _job_status(await _get_owned_job(job_id, username))
+
+@app.get("/edit-image/{job_id}/result")
+async def get_edit_job_result(job_id: str, username: str = Depends(get_current_username)):
+    job = await _get_owned_job(job_id, username)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Edit failed: {job['error']}")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    result = await asyncio.to_thread(edit_jobs.store.get_result, job_id)
+    return StreamingResponse(BytesIO(result), media_type="image/png")
+
+@app.get("/edit-image/{job_id}/events")
+async def stream_edit_job_events(job_id: str, token: str = Query(...)):
+    """
+    Server-sent events with the job status until it finishes, for at most
+    EDIT_JOB_TIMEOUT seconds. EventSource cannot send headers, so the JWT is
+    passed as a query parameter.
+    """
+    job = await _get_owned_job(job_id, decode_token(token))
+
+    async def events():
+        current = job
+        deadline = asyncio.get_running_loop().time() + EDIT_JOB_TIMEOUT
+        while True:
+            yield f"event: status\ndata: {json.dumps(_job_status(current), default=str)}\n\n"
+            if current["status"] in FINISHED_STATUSES or asyncio.get_running_loop().time() >= deadline:
+                return
+            current = await edit_jobs.wait(job_id, timeout=15) or current
 
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,314 @@
+"""Idempotent schema migrations that ``Base.metadata.create_all`` cannot express.
+
+``create_all`` only creates missing tables, so columns and indexes added to
+existing tables and the pgvector ANN index over ``images.vector_embedding`` are
+managed here. ``app.db`` runs this on startup, serialised between workers by
+an advisory lock; it can also be run by hand:
+
+    python -m app.migrations            # create whatever is missing, backfill description_tsv
+    python -m app.migrations --rebuild  # rebuild the ANN indexes (e.g. after switching type)
+
+Startup runs in one transaction, where an index build would block writes to
+its table for as long as it takes. It therefore only builds indexes on empty
+tables and otherwise logs the ones that are missing; the commands above build
+those with CREATE INDEX CONCURRENTLY.
+"""
+import argparse
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import Index, text
+from sqlalchemy.schema import CreateIndex
+
+from .models import Base
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_NAME = "ix_images_vector_embedding_ann"
+
+# hnsw (default) | ivfflat | none
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+
+# Partial ANN indexes for the filters searches use most (app/search.py always
+# excludes private images). Predicates must match SearchFilters.where()
+# literally for the planner to use them. Enabled by VECTOR_PARTIAL_INDEXES,
+# a comma-separated list of the keys below; none are built by default.
+PARTIAL_VECTOR_INDEXES = {
+    "public": "is_private = false",
+    "public_ai": "is_private = false AND is_ai_generated = true",
+    "public_non_ai": "is_private = false AND is_ai_generated = false",
+}
+VECTOR_PARTIAL_INDEXES = [
+    name.strip() for name in os.getenv("VECTOR_PARTIAL_INDEXES", "").split(",") if name.strip()
+]
+
+# What the ANN indexes store and the first search pass ranks by (app/search.py
+# re-ranks the candidates with the exact float distance):
+#   exact   - the float32 vectors themselves (default)
+#   halfvec - float16 copies, half the index size (pgvector >= 0.7)
+#   binary  - one sign bit per dimension, 1/32 of the size (pgvector >= 0.7)
+#   reduced - the 128-d PCA projection in embedding_reduced, 1/4 of the size
+#             (fit and backfill it first with ``python -m app.reduction fit``)
+# halfvec and binary are expression indexes, so no extra column has to be stored or backfilled.
+SEARCH_FIRST_PASS = os.getenv("SEARCH_FIRST_PASS", "exact").lower()
+FIRST_PASS_INDEXES = {
+    # mode: (index name, indexed expression, operator class)
+    "exact": (VECTOR_INDEX_NAME, "vector_embedding", "vector_cosine_ops"),
+    "halfvec": ("ix_images_vector_embedding_halfvec",
+                "(CAST(vector_embedding AS halfvec(512)))", "halfvec_cosine_ops"),
+    "binary": ("ix_images_vector_embedding_binary",
+               "(CAST(binary_quantize(vector_embedding) AS bit(512)))", "bit_hamming_ops"),
+    "reduced": ("ix_images_embedding_reduced", "embedding_reduced", "vector_cosine_ops"),
+}
+QUANTIZATION_MIN_PGVECTOR = (0, 7)
+
+# advisory lock key (with 0) held while startup applies the migrations
+MIGRATIONS_LOCK = 1
+
+DESCRIPTION_TSV_BATCH_SIZE = int(os.getenv("DESCRIPTION_TSV_BATCH_SIZE", "5000"))
+
+# Columns added to (and indexes dropped from) existing tables, in order. Every statement must be idempotent.
+SCHEMA_MIGRATIONS = [
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS ingest_status VARCHAR(16) NOT NULL DEFAULT 'ready'",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS ingest_error TEXT",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS ingest_claimed_at TIMESTAMP WITH TIME ZONE",
+    # a plain column kept by a trigger rather than a generated one, which adding
+    # to a populated table would rewrite under an exclusive lock
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS description_tsv tsvector",
+    """
+    CREATE OR REPLACE FUNCTION images_description_tsv() RETURNS trigger AS $$
+    BEGIN
+        NEW.description_tsv := to_tsvector('simple', coalesce(NEW.description, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    # databases migrated before the trigger keep their generated column
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                       WHERE tgrelid = 'images'::regclass AND tgname = 'images_description_tsv')
+           AND NOT EXISTS (SELECT 1 FROM pg_attribute
+                           WHERE attrelid = 'images'::regclass AND attname = 'description_tsv'
+                             AND attgenerated <> '') THEN
+            CREATE TRIGGER images_description_tsv BEFORE INSERT OR UPDATE OF description ON images
+                FOR EACH ROW EXECUTE FUNCTION images_description_tsv();
+        END IF;
+    END
+    $$
+    """,
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS embedding_reduced vector(128)",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS embedding_reduced_fitted_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS embedded_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS phash BIGINT",
+    # phash is only compared among the ANN candidates (app/duplicates.py), never looked up
+    "DROP INDEX IF EXISTS ix_images_phash",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS duplicate_of_id INTEGER REFERENCES images(id) ON DELETE SET NULL",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS neighbors_updated_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS recommendations_updated_at TIMESTAMP WITH TIME ZONE",
+]
+
+
+def vector_index_ddl(concurrently: bool = False, name: str = VECTOR_INDEX_NAME,
+                     where: Optional[str] = None, first_pass: str = "exact") -> str:
+    """CREATE INDEX statement for the configured ANN index type."""
+    if VECTOR_INDEX_TYPE == "hnsw":
+        method = "hnsw"
+        options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    elif VECTOR_INDEX_TYPE == "ivfflat":
+        method = "ivfflat"
+        options = f"lists = {IVFFLAT_LISTS}"
+    else:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE: {VECTOR_INDEX_TYPE}")
+
+    _, expression, opclass = FIRST_PASS_INDEXES[first_pass]
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON images USING {method} ({expression} {opclass}) WITH ({options})"
+        + (f" WHERE {where}" if where else "")
+    )
+
+
+def vector_indexes(first_pass: str = SEARCH_FIRST_PASS) -> List[Tuple[str, Optional[str]]]:
+    """``(name, predicate)`` of every ANN index to maintain, the full one first."""
+    if first_pass not in FIRST_PASS_INDEXES:
+        raise ValueError(f"Unknown SEARCH_FIRST_PASS: {first_pass}")
+    base_name = FIRST_PASS_INDEXES[first_pass][0]
+    indexes = [(base_name, None)]
+    for key in VECTOR_PARTIAL_INDEXES:
+        if key not in PARTIAL_VECTOR_INDEXES:
+            raise ValueError(f"Unknown VECTOR_PARTIAL_INDEXES entry: {key}")
+        indexes.append((f"{base_name}_{key}", PARTIAL_VECTOR_INDEXES[key]))
+    return indexes
+
+
+def pgvector_version(conn) -> Tuple[int, ...]:
+    version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar() or "0"
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+def check_first_pass(conn, first_pass: str = SEARCH_FIRST_PASS):
+    if first_pass in ("halfvec", "binary") and pgvector_version(conn) < QUANTIZATION_MIN_PGVECTOR:
+        raise RuntimeError(f"SEARCH_FIRST_PASS={first_pass} needs pgvector >= 0.7")
+
+
+def missing_model_indexes(conn) -> List[Index]:
+    return [
+        index for table in Base.metadata.sorted_tables for index in table.indexes
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": index.name}).scalar() is None
+    ]
+
+
+def ensure_model_indexes(conn):
+    """Create the missing model indexes of empty tables, otherwise warn about them."""
+    missing = []
+    for index in missing_model_indexes(conn):
+        if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {index.table.name})")).scalar():
+            missing.append(index.name)
+        else:
+            index.create(bind=conn)
+    if missing:
+        logger.warning(
+            "Indexes %s are missing; build them with `python -m app.migrations`", ", ".join(missing)
+        )
+
+
+def missing_vector_indexes(conn, first_pass: str = SEARCH_FIRST_PASS) -> List[Tuple[str, Optional[str]]]:
+    return [
+        (name, where) for name, where in vector_indexes(first_pass)
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None
+    ]
+
+
+def ensure_vector_index(conn):
+    """Create the missing HNSW indexes on an empty table, otherwise warn about them."""
+    if VECTOR_INDEX_TYPE == "none":
+        return
+    check_first_pass(conn)
+    missing = missing_vector_indexes(conn)
+    if not missing:
+        return
+    names = ", ".join(name for name, _ in missing)
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        # IVFFlat centroids are picked from the rows present at build time
+        logger.warning(
+            "IVFFlat indexes %s are missing, searches scan images without them; "
+            "build them with `python -m app.migrations --rebuild` once images are loaded",
+            names,
+        )
+        return
+    if conn.execute(text("SELECT EXISTS (SELECT 1 FROM images)")).scalar():
+        logger.warning(
+            "ANN indexes %s are missing, searches scan images without them; "
+            "build them with `python -m app.migrations`",
+            names,
+        )
+        return
+    for name, where in missing:
+        conn.execute(text(vector_index_ddl(name=name, where=where, first_pass=SEARCH_FIRST_PASS)))
+
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        # index builds can outlast the request-level DB_STATEMENT_TIMEOUT_MS
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        # workers booting together apply the migrations one after the other
+        conn.execute(text("SELECT pg_advisory_xact_lock(:lock, 0)"), {"lock": MIGRATIONS_LOCK})
+        Base.metadata.create_all(bind=conn)
+        for statement in SCHEMA_MIGRATIONS:
+            conn.execute(text(statement))
+        ensure_model_indexes(conn)
+        ensure_vector_index(conn)
+
+
+def backfill_description_tsv(engine, batch_size: int = DESCRIPTION_TSV_BATCH_SIZE) -> int:
+    """Fill ``description_tsv`` of rows older than its trigger, one short transaction per batch."""
+    statement = text("""
+        WITH batch AS (
+            SELECT id FROM images WHERE id > :last_id ORDER BY id LIMIT :limit
+        ), updated AS (
+            UPDATE images SET description_tsv = to_tsvector('simple', coalesce(images.description, ''))
+            FROM batch WHERE images.id = batch.id AND images.description_tsv IS NULL
+            RETURNING images.id
+        )
+        SELECT (SELECT max(id) FROM batch), (SELECT count(*) FROM updated)
+    """)
+    with engine.connect() as conn:
+        generated = conn.execute(text("""
+            SELECT attgenerated <> '' FROM pg_attribute
+            WHERE attrelid = 'images'::regclass AND attname = 'description_tsv'
+        """)).scalar()
+    if generated:
+        return 0
+    last_id, total = 0, 0
+    while True:
+        with engine.begin() as conn:
+            last_id, updated = conn.execute(statement, {"last_id": last_id, "limit": batch_size}).one()
+        if last_id is None:
+            return total
+        total += updated
+
+
+def create_model_indexes(engine):
+    """Build the missing model indexes without blocking writes to their tables."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        for index in missing_model_indexes(conn):
+            logger.info("Building %s", index.name)
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+            conn.execute(text(ddl.replace("INDEX IF NOT EXISTS", "INDEX CONCURRENTLY IF NOT EXISTS", 1)))
+
+
+def create_vector_indexes(engine, first_pass: str = SEARCH_FIRST_PASS):
+    """Build the missing ANN indexes for ``first_pass`` without blocking writes to ``images``."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        check_first_pass(conn, first_pass)
+        if VECTOR_INDEX_TYPE == "ivfflat" and not conn.execute(text("SELECT EXISTS (SELECT 1 FROM images)")).scalar():
+            logger.warning("Not building IVFFlat indexes on an empty images table")
+            return
+        for name, where in missing_vector_indexes(conn, first_pass):
+            logger.info("Building %s", name)
+            conn.execute(text(vector_index_ddl(concurrently=True, name=name, where=where, first_pass=first_pass)))
+
+
+def rebuild_vector_index(engine):
+    """Drop and recreate the ANN indexes without blocking writes to ``images``."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        if VECTOR_INDEX_TYPE != "none":
+            check_first_pass(conn)
+        for name, where in vector_indexes():
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            if VECTOR_INDEX_TYPE != "none":
+                conn.execute(text(vector_index_ddl(
+                    concurrently=True, name=name, where=where, first_pass=SEARCH_FIRST_PASS
+                )))
+
+
+if __name__ == "__main__":
+    from .db import engine
+
+    parser = argparse.ArgumentParser(description="Apply Visium schema migrations")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the vector ANN indexes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    filled = backfill_description_tsv(engine)
+    if filled:
+        logger.info("Filled description_tsv of %d images", filled)
+    create_model_indexes(engine)
+    if args.rebuild:
+        logger.info("Rebuilding %s as %s", VECTOR_INDEX_NAME, VECTOR_INDEX_TYPE)
+        rebuild_vector_index(engine)
+    elif VECTOR_INDEX_TYPE != "none":
+        create_vector_indexes(engine)
+    logger.info("Migrations applied")
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, Text, String, ForeignKey, DateTime, func, CheckConstraint, Boolean
+from sqlalchemy import Column, Integer, Text, String, ForeignKey, DateTime, func, CheckConstraint, Boolean, LargeBinary, Index, BigInteger, Float, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -10,7 +11,7 @@ class Image(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    image_url = Column(String, nullable=False)
+    image_url = Column(String, nullable=False, index=True)
     is_private = Column(Boolean, default=False)
     is_ai_generated = Column(Boolean, default=False)
     description = Column(Text)
@@ -20,13 +21,54 @@ class Image(Base):
     size = Column(Integer, CheckConstraint("size > 0"))
     format = Column(String(10))
     vector_embedding = Column(Vector(512))
+    # when ingest stored vector_embedding; the in-memory search backend syncs on it
+    embedded_at = Column(DateTime(timezone=True))
+    # PCA projection of vector_embedding for the reduced first search pass (app/reduction.py)
+    embedding_reduced = Column(Vector(128))
+    # fitted_at of the projection embedding_reduced was computed with
+    embedding_reduced_fitted_at = Column(DateTime(timezone=True))
+    # near-duplicate detection at ingest (app/duplicates.py): 64-bit dHash and the canonical image
+    phash = Column(BigInteger)
+    duplicate_of_id = Column(Integer, ForeignKey("images.id", ondelete="SET NULL"))
+    # when the image_neighbors list of this image was computed; NULL = pending (app/neighbors.py)
+    neighbors_updated_at = Column(DateTime(timezone=True))
     likes_count = Column(Integer, CheckConstraint("likes_count >= 0"), default=0)
+    # pending -> processing -> ready | failed, driven by the ingestion pipeline in app/ingest.py
+    ingest_status = Column(String(16), nullable=False, default="ready", server_default="ready")
+    ingest_error = Column(Text)
+    # when a worker claimed the row; claims older than INGEST_CLAIM_TIMEOUT are taken over
+    ingest_claimed_at = Column(DateTime(timezone=True))
+    # full-text side of hybrid search (app/search.py); 'simple' keeps mixed-language descriptions unstemmed
+    # to_tsvector('simple', coalesce(description, '')), set by the images_description_tsv trigger (app/migrations.py)
+    description_tsv = Column(TSVECTOR)
 
     __table_args__ = (
         CheckConstraint("width > 0", name="check_width_positive"),
         CheckConstraint("height > 0", name="check_height_positive"),
         CheckConstraint("size > 0", name="check_size_positive"),
         CheckConstraint("likes_count >= 0", name="check_likes_count_non_negative"),
+        # keyset pagination of the gallery and of per-user listings (app/pagination.py)
+        Index("ix_images_created_at_id", "created_at", "id"),
+        Index("ix_images_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_images_description_tsv", "description_tsv", postgresql_using="gin"),
+        Index("ix_images_embedded_at", "embedded_at"),
+        Index("ix_images_duplicate_of_id", "duplicate_of_id"),
+        Index("ix_images_neighbors_pending", "id", postgresql_where=text("neighbors_updated_at IS NULL AND vector_embedding IS NOT NULL")),
+    )
+
+class ImageNeighbor(Base):
+    """Precomputed "more like this" list of an image (app/neighbors.py)."""
+    __tablename__ = "image_neighbors"
+
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    similarity = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # a neighbour page is one range scan of this index
+        Index("ix_image_neighbors_image_id_similarity", "image_id", text("similarity DESC")),
+        # ON DELETE CASCADE of the neighbour side
+        Index("ix_image_neighbors_neighbor_id", "neighbor_id"),
     )
 
 class User(Base):
@@ -39,6 +81,8 @@ class User(Base):
     profile_picture_url = Column(String(255))
     followers_count = Column(Integer, default=0, nullable=False)
     following_count = Column(Integer, default=0, nullable=False)
+    # last liked-centroid recommendation refresh of this user's feed (app/feed.py)
+    recommendations_updated_at = Column(DateTime(timezone=True))
 
     __table_args__ = (
         CheckConstraint(followers_count >= 0, name="check_followers_count_non_negative"),
@@ -54,6 +98,8 @@ class Follow(Base):
 
     __table_args__ = (
         CheckConstraint("follower_id <> following_id", name="check_follower_not_equal_following"),
+        # fan-out of a new upload to the author's followers (app/feed.py)
+        Index("ix_follows_following_id", "following_id"),
     )
 
 class Like(Base):
@@ -63,6 +109,31 @@ class Like(Base):
     image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # users whose likes changed since the last recommendation refresh (app/feed.py)
+        Index("ix_likes_created_at", "created_at"),
+    )
+
+class FeedItem(Base):
+    """A materialised feed entry (app/feed.py): a followed user's upload or a recommendation."""
+    __tablename__ = "feed_items"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    # feed position: the upload time, or the refresh time for recommendations
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    # following | recommended
+    reason = Column(String(16), nullable=False)
+    # similarity to the liked-image centroid, for recommendations
+    score = Column(Float)
+
+    __table_args__ = (
+        # a feed page is one keyset range scan of this index
+        Index("ix_feed_items_user_id_created_at_image_id", "user_id", "created_at", "image_id"),
+        Index("ix_feed_items_created_at", "created_at"),
+        Index("ix_feed_items_image_id", "image_id"),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
 
@@ -73,4 +144,22 @@ class Comment(Base):
     content = Column(Text, CheckConstraint("LENGTH(content) BETWEEN 1 AND 2000"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-    is_edited = Column(Boolean, default=False)
\ No newline at end of file
+    is_edited = Column(Boolean, default=False)
+
+    __table_args__ = (
+        # threaded comment pages (app/comments.py): top-level comments of an image, replies of a comment
+        Index("ix_comments_image_id_created_at_id", "image_id", "created_at", "id"),
+        Index("ix_comments_parent_comment_id_created_at_id", "parent_comment_id", "created_at", "id"),
+    )
+
+class EditJob(Base):
+    __tablename__ = "edit_jobs"
+
+    id = Column(String(32), primary_key=True)
+    username = Column(String(50), nullable=False)
+    prompt = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default="queued")
+    error = Column(Text)
+    result = Column(LargeBinary)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
@@ -0,0 +1,235 @@
+"""Precomputed "more like this" lists in ``image_neighbors``.
+
+Every embedded image gets its ``NEIGHBORS_K`` most similar public images
+(canonical copies only, see ``app.duplicates``), so ``/similar-images/`` is one
+range read of the ``(image_id, similarity)`` index instead of an ANN search.
+``NeighborRefresher`` keeps the lists up to date in the background:
+
+* images with ``neighbors_updated_at IS NULL`` (new uploads) get their list
+  computed in batches, one LATERAL ANN lookup per image in a single statement;
+* a new public image is also offered to the existing lists of its own
+  neighbours (similarity is symmetric), which are then trimmed back to K.
+
+Deleted images drop out through ``ON DELETE CASCADE`` and images made private
+are skipped when a list is read, so lists can only get shorter in between.
+A full rebuild (e.g. after a model change) is
+
+    python -m app.neighbors refresh --all
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from .db import SessionLocal
+from .search import DEFAULT_EF_SEARCH, MAX_EF_SEARCH, first_pass_order, format_result, rerank_candidates
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NEIGHBORS_K = int(os.getenv("NEIGHBORS_K", "20"))
+NEIGHBORS_BATCH_SIZE = int(os.getenv("NEIGHBORS_BATCH_SIZE", "100"))
+# seconds between background refreshes; 0 leaves it to ``python -m app.neighbors refresh``
+NEIGHBORS_REFRESH_INTERVAL = float(os.getenv("NEIGHBORS_REFRESH_INTERVAL", "30"))
+
+# first key of the advisory locks that claim pending images; the second is the id
+NEIGHBORS_LOCK = 24
+
+# Several API workers refresh side by side, each claiming its batch with
+# transaction-level advisory locks. Unlike FOR UPDATE these leave the image
+# rows free for likes and duplicate links while the lists are computed, and
+# they go away with the transaction if a worker dies. The inner LIMIT keeps
+# the locks to the rows actually looked at.
+PENDING_SQL = text("""
+    SELECT id
+    FROM (
+        SELECT id
+        FROM images
+        WHERE neighbors_updated_at IS NULL AND vector_embedding IS NOT NULL
+        ORDER BY id
+        LIMIT :scan
+    ) pending
+    WHERE pg_try_advisory_xact_lock(:lock, id)
+    LIMIT :limit
+""")
+
+CLEAR_SQL = text("DELETE FROM image_neighbors WHERE image_id = ANY(:ids)")
+
+# {first_pass} is first_pass_order() against the source image's own vectors
+NEIGHBORS_SQL = """
+    INSERT INTO image_neighbors (image_id, neighbor_id, similarity)
+    SELECT s.id, nearest.id, 1 - nearest.distance
+    FROM images s
+    CROSS JOIN LATERAL (
+        SELECT id, distance
+        FROM (
+            SELECT id, vector_embedding <=> s.vector_embedding AS distance
+            FROM images
+            WHERE vector_embedding IS NOT NULL
+              AND is_private = false
+              AND duplicate_of_id IS NULL
+              AND id <> s.id
+              AND id IS DISTINCT FROM s.duplicate_of_id
+            ORDER BY {first_pass}
+            LIMIT :candidates
+        ) candidates
+        ORDER BY distance
+        LIMIT :k
+    ) nearest
+    WHERE s.id = ANY(:ids)
+"""
+
+# offer the new images to the already computed lists of their neighbours
+REVERSE_SQL = text("""
+    INSERT INTO image_neighbors (image_id, neighbor_id, similarity)
+    SELECT n.neighbor_id, n.image_id, n.similarity
+    FROM image_neighbors n
+    JOIN images source ON source.id = n.image_id
+    JOIN images target ON target.id = n.neighbor_id
+    WHERE n.image_id = ANY(:ids)
+      AND source.is_private = false
+      AND source.duplicate_of_id IS NULL
+      AND target.neighbors_updated_at IS NOT NULL
+    ON CONFLICT (image_id, neighbor_id) DO UPDATE SET similarity = EXCLUDED.similarity
+    RETURNING image_id
+""")
+
+TRIM_SQL = text("""
+    DELETE FROM image_neighbors n
+    USING (
+        SELECT image_id, neighbor_id,
+               row_number() OVER (PARTITION BY image_id ORDER BY similarity DESC, neighbor_id) AS rank
+        FROM image_neighbors
+        WHERE image_id = ANY(:ids)
+    ) ranked
+    WHERE n.image_id = ranked.image_id
+      AND n.neighbor_id = ranked.neighbor_id
+      AND ranked.rank > :k
+""")
+
+MARK_SQL = text("UPDATE images SET neighbors_updated_at = now() WHERE id = ANY(:ids)")
+
+RESET_SQL = text("UPDATE images SET neighbors_updated_at = NULL WHERE neighbors_updated_at IS NOT NULL")
+
+SIMILAR_SQL = text("""
+    SELECT
+        images.id,
+        images.image_url,
+        images.description,
+        images.width,
+        images.height,
+        images.size,
+        images.format,
+        images.likes_count,
+        images.duplicate_of_id,
+        n.similarity
+    FROM image_neighbors n
+    JOIN images ON images.id = n.neighbor_id
+    WHERE n.image_id = :image_id AND images.is_private = false
+    ORDER BY n.similarity DESC, n.neighbor_id
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def refresh_batch(db, k: int = NEIGHBORS_K, batch_size: int = NEIGHBORS_BATCH_SIZE) -> int:
+    """Compute up to ``batch_size`` pending lists in one transaction; return how many."""
+    ids = db.execute(PENDING_SQL, {
+        "lock": NEIGHBORS_LOCK, "scan": 4 * batch_size, "limit": batch_size
+    }).scalars().all()
+    if not ids:
+        db.rollback()
+        return 0
+
+    candidates = rerank_candidates(k)
+    db.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+               {"value": str(min(max(candidates, DEFAULT_EF_SEARCH), MAX_EF_SEARCH))})
+    db.execute(CLEAR_SQL, {"ids": ids})
+    db.execute(
+        text(NEIGHBORS_SQL.format(first_pass=first_pass_order("s.vector_embedding", reduced="s.embedding_reduced"))),
+        {"ids": ids, "k": k, "candidates": candidates},
+    )
+    offered = set(db.execute(REVERSE_SQL, {"ids": ids}).scalars().all())
+    if offered:
+        db.execute(TRIM_SQL, {"ids": list(offered), "k": k})
+    db.execute(MARK_SQL, {"ids": ids})
+    db.commit()
+    return len(ids)
+
+
+def refresh_pending(k: int = NEIGHBORS_K, batch_size: int = NEIGHBORS_BATCH_SIZE) -> int:
+    """Work through every pending list; return how many were computed."""
+    db = SessionLocal()
+    try:
+        total = 0
+        while True:
+            done = refresh_batch(db, k, batch_size)
+            if not done:
+                return total
+            total += done
+            logger.info("Computed %d neighbour lists", total)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def similar_images(db: AsyncSession, image_id: int, page: int = 1, per_page: int = 10) -> List[dict]:
+    rows = (await db.execute(SIMILAR_SQL, {
+        "image_id": image_id, "limit": per_page, "offset": (page - 1) * per_page
+    })).all()
+    return [format_result(row, row.similarity) for row in rows]
+
+
+class NeighborRefresher:
+    """Computes pending neighbour lists every ``interval`` seconds."""
+
+    def __init__(self, interval: float, k: int = NEIGHBORS_K, batch_size: int = NEIGHBORS_BATCH_SIZE):
+        self.interval = interval
+        self.k = k
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(refresh_pending, self.k, self.batch_size)
+            except Exception as e:
+                logger.error(f"Refreshing image neighbours failed: {e}")
+
+
+neighbor_refresher = NeighborRefresher(NEIGHBORS_REFRESH_INTERVAL) if NEIGHBORS_REFRESH_INTERVAL > 0 else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the image_neighbors lists")
+    parser.add_argument("command", choices=["refresh"])
+    parser.add_argument("--all", action="store_true", help="recompute every list, not only pending ones")
+    parser.add_argument("-k", type=int, default=NEIGHBORS_K)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.all:
+        db = SessionLocal()
+        try:
+            db.execute(RESET_SQL)
+            db.commit()
+        finally:
+            db.close()
+    refresh_pending(args.k)
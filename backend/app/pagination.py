@@ -0,0 +1,51 @@
+"""Keyset (cursor) pagination on ``(created_at, id)``, newest first.
+
+A cursor is the opaque, URL-safe encoding of the last row's ``(created_at, id)``.
+The next page is ``WHERE (created_at, id) < cursor``, which a composite index on
+those columns serves without counting or skipping the rows before it.
+"""
+import base64
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_query(stmt, created_at_col, id_col, cursor: Optional[str], limit: int):
+    """Order ``stmt`` newest first, resume after ``cursor`` and fetch one extra row to detect a next page."""
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(created_at_col, id_col) < tuple_(created_at, last_id))
+    return stmt.order_by(created_at_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def single_entity(stmt) -> bool:
+    """True for ``select(Model)``, whose rows are returned as model instances."""
+    return len(stmt.column_descriptions) == 1
+
+
+async def keyset_page(db: AsyncSession, stmt, created_at_col, id_col, cursor: Optional[str], limit: int,
+                      key: Callable = lambda row: (row.created_at, row.id)):
+    """Return ``(rows, next_cursor)``; ``next_cursor`` is None on the last page."""
+    result = await db.execute(keyset_query(stmt, created_at_col, id_col, cursor, limit))
+    rows = result.scalars().all() if single_entity(stmt) else result.all()
+    next_cursor = encode_cursor(*key(rows[limit - 1])) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,144 @@
+"""Build the compact first-pass ANN indexes and measure their recall.
+
+``SEARCH_FIRST_PASS=halfvec|binary|reduced`` makes searches scan a float16,
+binary-quantised or PCA-reduced (``app.reduction``) index and re-rank its
+candidates with the exact float distance (see ``app.migrations`` and
+``app.search``). Switching over:
+
+    python -m app.quantization build --mode binary     # CREATE INDEX CONCURRENTLY, writes keep going
+    python -m app.quantization recall --mode binary    # recall@k against exact search, index sizes
+    SEARCH_FIRST_PASS=binary ...                       # restart the API with the new first pass
+    python -m app.quantization drop --mode exact       # free the float32 index once unused
+
+``recall`` samples stored embeddings as queries, ranks each exactly (no
+index) and through the first pass + re-rank, and reports the overlap of the
+two top-k lists, so the rerank factor can be tuned before switching.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import select, text
+
+from .db import SessionLocal, engine
+from .migrations import (
+    FIRST_PASS_INDEXES, VECTOR_INDEX_TYPE, create_vector_indexes, vector_indexes,
+)
+from .models import Image
+from .reduction import current_projection
+from .search import (
+    DEFAULT_RERANK_FACTORS, FIRST_PASS_ORDER, MAX_EF_SEARCH, PUBLIC, SEARCH_SQL, to_pgvector,
+)
+
+logger = logging.getLogger(__name__)
+
+EXACT_SQL = """
+    SELECT id
+    FROM images
+    WHERE vector_embedding IS NOT NULL
+      {filters}
+    ORDER BY vector_embedding <=> CAST(:embedding AS vector)
+    LIMIT :limit
+"""
+
+
+def build(mode: str):
+    create_vector_indexes(engine, mode)
+
+
+def drop(mode: str):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, _ in vector_indexes(mode):
+            logger.info("Dropping %s", name)
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def index_sizes() -> dict:
+    names = [name for mode in FIRST_PASS_INDEXES for name, _ in vector_indexes(mode)]
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT indexrelname AS name, pg_relation_size(indexrelid) AS size
+            FROM pg_stat_user_indexes
+            WHERE indexrelname = ANY(:names)
+        """), {"names": names}).all()
+    return {row.name: row.size for row in rows}
+
+
+def recall(mode: str, queries: int, k: int, factor: int) -> dict:
+    """Mean recall@k of the ``mode`` first pass + exact re-rank, over stored embeddings as queries."""
+    conditions, params = PUBLIC.where()
+    projection = current_projection()
+    if mode == "reduced" and projection is None:
+        raise RuntimeError("no PCA projection is fitted (python -m app.reduction fit)")
+    candidates = max(k, min(k * factor, MAX_EF_SEARCH))
+    search_sql = text(SEARCH_SQL.format(
+        filters=conditions, first_pass=FIRST_PASS_ORDER[mode].format(
+            query="CAST(:embedding AS vector)", reduced="CAST(:embedding_reduced AS vector)"
+        )
+    ))
+    exact_sql = text(EXACT_SQL.format(filters=conditions))
+
+    db = SessionLocal()
+    try:
+        samples = db.execute(
+            select(Image.vector_embedding).where(Image.vector_embedding.isnot(None))
+            .order_by(text("random()")).limit(queries)
+        ).scalars().all()
+
+        found = 0
+        expected = 0
+        elapsed = 0.0
+        for embedding in samples:
+            query = {**params, "embedding": to_pgvector(embedding.tolist())}
+            if mode == "reduced":
+                query["embedding_reduced"] = to_pgvector(projection.project(embedding))
+
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+            exact = {row.id for row in db.execute(exact_sql, {**query, "limit": k})}
+            db.rollback()
+
+            db.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                       {"value": str(min(candidates, MAX_EF_SEARCH))})
+            start = time.perf_counter()
+            approximate = {row.id for row in db.execute(search_sql, {
+                **query, "candidates": candidates, "limit": k, "offset": 0, "min_similarity": -1.0
+            })}
+            elapsed += time.perf_counter() - start
+            db.rollback()
+
+            found += len(exact & approximate)
+            expected += len(exact)
+    finally:
+        db.close()
+
+    return {
+        "mode": mode,
+        "queries": len(samples),
+        "k": k,
+        "candidates": candidates,
+        "recall": round(found / expected, 4) if expected else None,
+        "avg_ms": round(elapsed / len(samples) * 1000, 3) if samples else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact first-pass vector indexes")
+    parser.add_argument("command", choices=["build", "drop", "recall", "sizes"])
+    parser.add_argument("--mode", choices=list(FIRST_PASS_INDEXES), default="binary")
+    parser.add_argument("--queries", type=int, default=100, help="recall: sampled query vectors")
+    parser.add_argument("-k", type=int, default=10, help="recall: results compared per query")
+    parser.add_argument("--factor", type=int, help="recall: rerank factor (default per mode)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if VECTOR_INDEX_TYPE == "none":
+        parser.error("VECTOR_INDEX_TYPE=none: there are no ANN indexes to manage")
+    if args.command == "build":
+        build(args.mode)
+    elif args.command == "drop":
+        drop(args.mode)
+    elif args.command == "recall":
+        print(recall(args.mode, args.queries, args.k, args.factor or DEFAULT_RERANK_FACTORS[args.mode]))
+        print(index_sizes())
+    else:
+        print(index_sizes())
@@ -0,0 +1,236 @@
+"""PCA projection of CLIP embeddings to ``images.embedding_reduced``.
+
+A 128-d projection of the 512-d vectors backs a fast first search pass
+(``SEARCH_FIRST_PASS=reduced``, see ``app.search``) whose candidates are then
+re-ranked by the exact 512-d distance. The projection is fitted offline over
+the stored embeddings and persisted to ``EMBEDDING_PCA_PATH`` as a ``.npz``
+file (mean + components); ingest and search apply the same file.
+
+    python -m app.reduction fit        # fit over images, save, backfill every row
+    python -m app.reduction backfill   # rewrite rows missing or behind the current fit
+
+``python -m app.quantization recall --mode reduced`` measures the recall of
+the reduced first pass. Every row records the fit it was projected with
+(``embedding_reduced_fitted_at``), so rows that ingest wrote with an older
+projection are picked up by ``backfill``.
+
+A refit saves the new projection aside, rewrites every row, and only then
+publishes it to ``EMBEDDING_PCA_PATH``, which running APIs reload within
+``PCA_RELOAD_INTERVAL`` seconds. While rows mix two projections, reduced
+distances are meaningless, so ``fit`` keeps a ``<path>.refitting`` marker file
+in place and searches fall back to the exact first pass until it is removed
+(a ``backfill`` that completes removes a marker left behind by a failed fit).
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import or_, select, update
+
+from .models import Image
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# must match the images.embedding_reduced column type
+REDUCED_DIM = 128
+EMBEDDING_PCA_PATH = os.getenv(
+    "EMBEDDING_PCA_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "embedding_pca.npz")
+)
+# rows sampled for fitting; PCA components settle long before the full table
+PCA_FIT_SAMPLE = int(os.getenv("EMBEDDING_PCA_FIT_SAMPLE", "100000"))
+BACKFILL_BATCH_SIZE = 1000
+# seconds between checks whether the file was refitted
+PCA_RELOAD_INTERVAL = float(os.getenv("EMBEDDING_PCA_RELOAD_INTERVAL", "10"))
+
+
+class PcaProjection:
+    """``x -> normalize((x / |x| - mean) @ components.T)``, so cosine distance stays meaningful."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance_ratio: np.ndarray,
+                 fitted_at: Optional[datetime] = None):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+        self.explained_variance_ratio = explained_variance_ratio
+        # identifies the fit; stored next to every projected row
+        self.fitted_at = fitted_at
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int = REDUCED_DIM) -> "PcaProjection":
+        data = cls._normalize(np.asarray(vectors, dtype=np.float32))
+        mean = data.mean(axis=0)
+        _, singular_values, components = np.linalg.svd(data - mean, full_matrices=False)
+        variance = singular_values ** 2
+        return cls(mean, components[:dim], variance[:dim] / variance.sum(), datetime.now(timezone.utc))
+
+    def transform(self, vectors) -> np.ndarray:
+        data = self._normalize(np.asarray(vectors, dtype=np.float32))
+        return self._normalize((data - self.mean) @ self.components.T)
+
+    def project(self, embedding: List[float]) -> List[float]:
+        return self.transform(embedding).tolist()
+
+    def save(self, path: str):
+        # written aside and renamed, so a reloading API never reads half a file
+        partial = f"{path}.tmp"
+        with open(partial, "wb") as file:
+            np.savez(file, mean=self.mean, components=self.components,
+                     explained_variance_ratio=self.explained_variance_ratio,
+                     fitted_at=(self.fitted_at or datetime.now(timezone.utc)).isoformat())
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PcaProjection":
+        with np.load(path) as data:
+            fitted_at = datetime.fromisoformat(str(data["fitted_at"])) if "fitted_at" in data else None
+            return cls(data["mean"], data["components"], data["explained_variance_ratio"], fitted_at)
+
+
+def load_projection(path: str = EMBEDDING_PCA_PATH) -> Optional[PcaProjection]:
+    if not os.path.exists(path):
+        return None
+    projection = PcaProjection.load(path)
+    if projection.components.shape[0] != REDUCED_DIM:
+        raise ValueError(f"{path} projects to {projection.components.shape[0]} dimensions, expected {REDUCED_DIM}")
+    return projection
+
+
+def refitting_marker(path: str = EMBEDDING_PCA_PATH) -> str:
+    return f"{path}.refitting"
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+_projection = load_projection()
+_projection_mtime = _mtime(EMBEDDING_PCA_PATH)
+_refitting = os.path.exists(refitting_marker())
+_checked_at = time.monotonic()
+
+
+def current_projection() -> Optional[PcaProjection]:
+    """The projection in ``EMBEDDING_PCA_PATH``, reloaded once the file has been refitted."""
+    global _projection, _projection_mtime, _refitting, _checked_at
+    if time.monotonic() - _checked_at >= PCA_RELOAD_INTERVAL:
+        _checked_at = time.monotonic()
+        _refitting = os.path.exists(refitting_marker())
+        mtime = _mtime(EMBEDDING_PCA_PATH)
+        if mtime != _projection_mtime:
+            try:
+                _projection = load_projection()
+                _projection_mtime = mtime
+                logger.info("Reloaded the PCA projection from %s", EMBEDDING_PCA_PATH)
+            except Exception as e:
+                logger.error(f"Reloading the PCA projection failed: {e}")
+    return _projection
+
+
+def projections_consistent() -> bool:
+    """False while a refit leaves rows projected with different fits."""
+    current_projection()
+    return not _refitting
+
+
+def reduced_columns(embedding: List[float]) -> dict:
+    """Column values to store next to ``vector_embedding`` (nothing until a projection is fitted)."""
+    projection = current_projection()
+    if projection is None:
+        return {}
+    return {"embedding_reduced": projection.project(embedding), "embedding_reduced_fitted_at": projection.fitted_at}
+
+
+def _sample_embeddings(db, limit: int) -> np.ndarray:
+    rows = db.execute(
+        select(Image.vector_embedding).where(Image.vector_embedding.isnot(None))
+        .order_by(Image.id.desc()).limit(limit)
+    ).scalars().all()
+    return np.vstack(rows) if rows else np.empty((0, 512), dtype=np.float32)
+
+
+def backfill(db, projection: PcaProjection, only_stale: bool = True) -> int:
+    """Write ``embedding_reduced`` in id order, one batch per transaction.
+
+    ``only_stale`` limits it to rows without a projection or with one from another fit.
+    """
+    last_id = 0
+    written = 0
+    while True:
+        query = select(Image.id, Image.vector_embedding).where(
+            Image.vector_embedding.isnot(None), Image.id > last_id
+        )
+        if only_stale:
+            query = query.where(or_(
+                Image.embedding_reduced.is_(None),
+                Image.embedding_reduced_fitted_at.is_distinct_from(projection.fitted_at),
+            ))
+        rows = db.execute(query.order_by(Image.id).limit(BACKFILL_BATCH_SIZE)).all()
+        if not rows:
+            return written
+
+        reduced = projection.transform(np.vstack([row.vector_embedding for row in rows]))
+        db.execute(update(Image), [
+            {"id": row.id, "embedding_reduced": vector.tolist(), "embedding_reduced_fitted_at": projection.fitted_at}
+            for row, vector in zip(rows, reduced)
+        ])
+        db.commit()
+        last_id = rows[-1].id
+        written += len(rows)
+        logger.info("Backfilled %d rows (up to id %d)", written, last_id)
+
+
+if __name__ == "__main__":
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Fit and apply the embedding PCA projection")
+    parser.add_argument("command", choices=["fit", "backfill"])
+    parser.add_argument("--path", default=EMBEDDING_PCA_PATH)
+    parser.add_argument("--sample", type=int, default=PCA_FIT_SAMPLE, help="fit: rows to fit on")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        if args.command == "fit":
+            vectors = _sample_embeddings(db, args.sample)
+            if len(vectors) < REDUCED_DIM:
+                parser.error(f"need at least {REDUCED_DIM} embedded images to fit, found {len(vectors)}")
+            fitted = PcaProjection.fit(vectors)
+            pending = f"{args.path}.pending"
+            fitted.save(pending)
+            logger.info("Fitted on %d rows, explained variance %.3f, saved to %s",
+                        len(vectors), fitted.explained_variance_ratio.sum(), pending)
+            open(refitting_marker(args.path), "w").close()
+            # until every API has seen the marker and searches exactly
+            time.sleep(PCA_RELOAD_INTERVAL)
+            backfill(db, fitted, only_stale=False)
+            os.replace(pending, args.path)
+            logger.info("Published the projection to %s", args.path)
+            time.sleep(PCA_RELOAD_INTERVAL)
+            # rows ingested with the previous projection while the APIs had not reloaded yet
+            backfill(db, fitted)
+            os.remove(refitting_marker(args.path))
+        else:
+            current = load_projection(args.path)
+            if current is None:
+                parser.error(f"{args.path} does not exist; run fit first")
+            backfill(db, current)
+            if os.path.exists(refitting_marker(args.path)):
+                os.remove(refitting_marker(args.path))
+    finally:
+        db.close()
@@ -0,0 +1,765 @@
+"""Vector similarity search over ``images.vector_embedding``.
+
+The ranking is done by a pluggable backend selected with ``SEARCH_BACKEND``.
+
+Metadata filters (``SearchFilters``) are part of the ANN query itself rather
+than applied to its output, so a filtered search still fills its page: the
+common "public" filters can be served by partial ANN indexes
+(``VECTOR_PARTIAL_INDEXES``, see ``app.migrations``) and on pgvector >= 0.8 iterative index scans keep reading
+the index until enough rows pass the remaining conditions.
+"""
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from .migrations import SEARCH_FIRST_PASS, VECTOR_INDEX_TYPE
+from .models import Image
+from .reduction import current_projection, projections_consistent
+
+load_dotenv()
+
+# pgvector defaults hnsw.ef_search to 40 and caps it at 1000
+DEFAULT_EF_SEARCH = 40
+MAX_EF_SEARCH = 1000
+
+# off | relaxed_order | strict_order (ivfflat only knows relaxed_order); needs pgvector >= 0.8
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order").lower()
+# upper bound of rows an iterative HNSW scan visits; unset keeps pgvector's default (20000)
+HNSW_MAX_SCAN_TUPLES = os.getenv("HNSW_MAX_SCAN_TUPLES")
+
+# First-pass ranking expression per SEARCH_FIRST_PASS; each must repeat the
+# indexed expression of app.migrations.FIRST_PASS_INDEXES to use its index.
+FIRST_PASS_ORDER = {
+    "exact": "vector_embedding <=> {query}",
+    "halfvec": "CAST(vector_embedding AS halfvec(512)) <=> CAST({query} AS halfvec(512))",
+    "binary": "CAST(binary_quantize(vector_embedding) AS bit(512)) <~> binary_quantize({query})",
+    "reduced": "embedding_reduced <=> {reduced}",
+}
+# A quantised first pass fetches this many times the requested rows, which the
+# exact float distance then re-ranks; more candidates buy back recall.
+DEFAULT_RERANK_FACTORS = {"exact": 1, "halfvec": 2, "binary": 8, "reduced": 4}
+SEARCH_RERANK_FACTOR = int(os.getenv("SEARCH_RERANK_FACTOR", str(DEFAULT_RERANK_FACTORS.get(SEARCH_FIRST_PASS, 1))))
+
+# Hybrid search: how many candidates each ranking contributes, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "100"))
+
+# queries accepted by one batch search
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "32"))
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# vector: CLIP similarity only; hybrid: RRF of CLIP and full-text rankings;
+# filtered: CLIP ranking of the images whose description matches the query
+SEARCH_MODES = "^(vector|hybrid|filtered)$"
+
+# must match the expression of the images_description_tsv trigger (app/migrations.py)
+TEXT_MATCH = "description_tsv @@ websearch_to_tsquery('simple', :text_query)"
+
+# {filters} is SearchFilters.where() plus the optional text match and
+# {first_pass} an entry of FIRST_PASS_ORDER. The similarity threshold is
+# checked after the LIMIT so that the index scan is never asked for rows it
+# cannot find; the outer ORDER BY re-ranks the candidates by exact distance,
+# which also restores order after a relaxed_order iterative scan.
+SEARCH_SQL = """
+    WITH nearest AS MATERIALIZED (
+        SELECT
+            id,
+            image_url,
+            description,
+            width,
+            height,
+            size,
+            format,
+            likes_count,
+            duplicate_of_id,
+            vector_embedding <=> :embedding AS distance
+        FROM images
+        WHERE vector_embedding IS NOT NULL
+          {filters}
+        ORDER BY {first_pass}
+        LIMIT :candidates
+    )
+    SELECT *, 1 - distance AS similarity
+    FROM nearest
+    WHERE distance < 1 - :min_similarity
+    ORDER BY distance
+    LIMIT :limit OFFSET :offset
+"""
+
+# Both rankings and their reciprocal-rank fusion in one statement. Each side
+# contributes weight / (k + rank) for its top :candidates rows.
+HYBRID_SQL = f"""
+    WITH vector_ranked AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, vector_embedding <=> :embedding AS distance
+            FROM images
+            WHERE vector_embedding IS NOT NULL
+              {{filters}}
+            ORDER BY {{first_pass}}
+            LIMIT :vector_candidates
+        ) nearest
+        WHERE distance < 1 - :min_similarity
+        ORDER BY distance
+        LIMIT :candidates
+    ),
+    text_ranked AS (
+        SELECT id, row_number() OVER (ORDER BY text_rank DESC, id) AS rank
+        FROM (
+            SELECT id, ts_rank_cd(description_tsv, websearch_to_tsquery('simple', :text_query)) AS text_rank
+            FROM images
+            WHERE vector_embedding IS NOT NULL AND {TEXT_MATCH}
+              {{filters}}
+            ORDER BY text_rank DESC, id
+            LIMIT :candidates
+        ) matches
+    ),
+    fused AS (
+        SELECT id, SUM(score) AS score
+        FROM (
+            SELECT id, CAST(:vector_weight AS float8) / (:rrf_k + rank) AS score FROM vector_ranked
+            UNION ALL
+            SELECT id, CAST(:text_weight AS float8) / (:rrf_k + rank) FROM text_ranked
+        ) scores
+        GROUP BY id
+        HAVING SUM(score) > 0
+    )
+    SELECT
+        images.id,
+        images.image_url,
+        images.description,
+        images.width,
+        images.height,
+        images.size,
+        images.format,
+        images.likes_count,
+        images.duplicate_of_id,
+        1 - (images.vector_embedding <=> :embedding) AS similarity,
+        fused.score
+    FROM fused
+    JOIN images ON images.id = fused.id
+    ORDER BY fused.score DESC, images.id
+    LIMIT :limit OFFSET :offset
+"""
+
+# One ANN lookup per query vector, all in one round-trip: {queries} is a VALUES
+# list of (query_index, vector[, reduced vector]) built by batch_search_sql().
+BATCH_SEARCH_SQL = """
+    SELECT q.query_index, nearest.*, 1 - nearest.distance AS similarity
+    FROM (VALUES {queries}) AS q(query_index, embedding{columns})
+    CROSS JOIN LATERAL (
+        SELECT *
+        FROM (
+            SELECT
+                id,
+                image_url,
+                description,
+                width,
+                height,
+                size,
+                format,
+                likes_count,
+                duplicate_of_id,
+                vector_embedding <=> q.embedding AS distance
+            FROM images
+            WHERE vector_embedding IS NOT NULL
+              {filters}
+            ORDER BY {first_pass}
+            LIMIT :candidates
+        ) candidates
+        ORDER BY distance
+        LIMIT :limit
+    ) nearest
+    WHERE nearest.distance < 1 - :min_similarity
+    ORDER BY q.query_index, nearest.distance
+"""
+
+TEXT_MATCH_SQL = text(f"SELECT id FROM images WHERE {TEXT_MATCH}")
+
+TEXT_RANK_SQL = f"""
+    SELECT id
+    FROM images
+    WHERE vector_embedding IS NOT NULL AND {TEXT_MATCH}
+      {{filters}}
+    ORDER BY ts_rank_cd(description_tsv, websearch_to_tsquery('simple', :text_query)) DESC, id
+    LIMIT :candidates
+"""
+
+HYDRATE_SQL = text("""
+    SELECT id, image_url, description, width, height, size, format, likes_count, duplicate_of_id
+    FROM images
+    WHERE id = ANY(:ids)
+""")
+
+
+def to_pgvector(embedding: List[float]) -> str:
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+
+def first_pass_order(query: str, reduced: str = "CAST(:embedding_reduced AS vector)") -> str:
+    """ORDER BY expression of the first search pass against the vector ``query``
+    (``reduced``: its PCA projection, for the reduced first pass). The reduced
+    pass falls back to exact distances while a refit mixes projections."""
+    first_pass = SEARCH_FIRST_PASS
+    if first_pass == "reduced" and not projections_consistent():
+        first_pass = "exact"
+    return FIRST_PASS_ORDER[first_pass].format(query=query, reduced=reduced)
+
+
+def reduced_query(embedding: List[float]) -> Optional[str]:
+    """The query's PCA projection when the first pass needs one."""
+    if SEARCH_FIRST_PASS != "reduced":
+        return None
+    projection = current_projection()
+    if projection is None:
+        raise RuntimeError("SEARCH_FIRST_PASS=reduced but no PCA projection is fitted (python -m app.reduction fit)")
+    return to_pgvector(projection.project(embedding))
+
+
+def rerank_candidates(needed: int) -> int:
+    """Rows the first pass has to return so that re-ranking can fill ``needed``."""
+    return max(needed, min(needed * SEARCH_RERANK_FACTOR, MAX_EF_SEARCH))
+
+
+def batch_search_sql(count: int, filters: str) -> str:
+    reduced = SEARCH_FIRST_PASS == "reduced"
+    queries = ", ".join(
+        f"({i}, CAST(:embedding_{i} AS vector)" + (f", CAST(:reduced_{i} AS vector))" if reduced else ")")
+        for i in range(count)
+    )
+    return BATCH_SEARCH_SQL.format(
+        queries=queries, columns=", reduced" if reduced else "",
+        filters=filters, first_pass=first_pass_order("q.embedding", "q.reduced"),
+    )
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """Metadata restrictions of a search.
+
+    Private images are always excluded, except when a signed-in viewer
+    searches their own images (``user_id == viewer_id``). Naive datetimes are
+    taken as UTC.
+    """
+    is_ai_generated: Optional[bool] = None
+    user_id: Optional[int] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    viewer_id: Optional[int] = None
+    # "more like this": leave the source image out of its own results
+    exclude_id: Optional[int] = None
+
+    @property
+    def include_private(self) -> bool:
+        return self.user_id is not None and self.user_id == self.viewer_id
+
+    def matches(self, row) -> bool:
+        """Whether an image row (with the filter columns) passes; the Python side of ``where``."""
+        if not self.include_private and row.is_private is not False:
+            return False
+        if self.is_ai_generated is not None and row.is_ai_generated is not self.is_ai_generated:
+            return False
+        if self.user_id is not None and row.user_id != self.user_id:
+            return False
+        if self.created_after is not None and not (row.created_at and row.created_at >= _utc(self.created_after)):
+            return False
+        if self.created_before is not None and not (row.created_at and row.created_at < _utc(self.created_before)):
+            return False
+        return True
+
+    def where(self) -> Tuple[str, dict]:
+        """``AND ...`` conditions on ``images`` and their bind parameters.
+
+        Booleans are inlined as literals rather than bound: the planner can
+        only pick a partial index whose predicate it sees in the query text.
+        """
+        conditions = []
+        params = {}
+        if not self.include_private:
+            conditions.append("is_private = false")
+        if self.is_ai_generated is not None:
+            conditions.append(f"is_ai_generated = {'true' if self.is_ai_generated else 'false'}")
+        if self.user_id is not None:
+            conditions.append("user_id = :filter_user_id")
+            params["filter_user_id"] = self.user_id
+        if self.created_after is not None:
+            conditions.append("created_at >= :filter_created_after")
+            params["filter_created_after"] = _utc(self.created_after)
+        if self.created_before is not None:
+            conditions.append("created_at < :filter_created_before")
+            params["filter_created_before"] = _utc(self.created_before)
+        if self.exclude_id is not None:
+            conditions.append("id <> :filter_exclude_id")
+            params["filter_exclude_id"] = self.exclude_id
+        return "".join(f" AND {condition}" for condition in conditions), params
+
+
+PUBLIC = SearchFilters()
+
+_pgvector_version: Optional[Tuple[int, ...]] = None
+
+
+async def pgvector_version(db: AsyncSession) -> Tuple[int, ...]:
+    """Installed ``vector`` extension version, read once per process."""
+    global _pgvector_version
+    if _pgvector_version is None:
+        version = (await db.execute(
+            text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        )).scalar() or "0"
+        _pgvector_version = tuple(int(part) for part in version.split(".") if part.isdigit())
+    return _pgvector_version
+
+
+async def apply_search_params(db: AsyncSession, limit: int, offset: int,
+                        ef_search: Optional[int] = None, probes: Optional[int] = None):
+    """Set per-transaction ANN recall/latency knobs.
+
+    An HNSW scan returns at most ``ef_search`` rows, so it is raised to cover
+    the requested page even when the caller did not ask for it. Iterative
+    scans are switched on where pgvector supports them (0.8+); older versions
+    reject the setting, so it is skipped there and filters fall back to what
+    the partial indexes and ``ef_search`` cover.
+    """
+    needed = min(offset + limit, MAX_EF_SEARCH)
+    if ef_search is not None or needed > DEFAULT_EF_SEARCH:
+        await db.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                         {"value": str(max(ef_search or 0, needed))})
+    if probes is not None:
+        await db.execute(text("SELECT set_config('ivfflat.probes', :value, true)"),
+                         {"value": str(probes)})
+
+    if VECTOR_ITERATIVE_SCAN == "off" or await pgvector_version(db) < (0, 8):
+        return
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        await db.execute(text("SELECT set_config('ivfflat.iterative_scan', 'relaxed_order', true)"))
+    else:
+        await db.execute(text("SELECT set_config('hnsw.iterative_scan', :value, true)"),
+                         {"value": VECTOR_ITERATIVE_SCAN})
+        if HNSW_MAX_SCAN_TUPLES:
+            await db.execute(text("SELECT set_config('hnsw.max_scan_tuples', :value, true)"),
+                             {"value": HNSW_MAX_SCAN_TUPLES})
+
+
+def format_result(row, similarity: float, score: Optional[float] = None) -> dict:
+    result = {
+        "id": row.id,
+        "image_url": row.image_url,
+        "description": row.description,
+        "likes_count": row.likes_count,
+        "duplicate_of_id": row.duplicate_of_id,
+        "similarity": round(float(similarity), 4)
+    }
+    if score is not None:
+        result["score"] = round(float(score), 6)
+    return result
+
+
+async def hydrate_rows(db: AsyncSession, ids: List[int]) -> dict:
+    """``id -> row`` for the display columns of ``ids`` (missing ids are left out)."""
+    if not ids:
+        return {}
+    rows = (await db.execute(HYDRATE_SQL, {"ids": ids})).fetchall()
+    return {row.id: row for row in rows}
+
+
+async def hydrate(db: AsyncSession, ids: List[int], similarities: List[float],
+                  scores: Optional[List[float]] = None) -> List[dict]:
+    """Format ranked ids in order, fetching their rows with one ``id = ANY(...)`` query."""
+    by_id = await hydrate_rows(db, ids)
+    scores = scores or [None] * len(ids)
+    return [
+        format_result(by_id[image_id], similarity, score)
+        for image_id, similarity, score in zip(ids, similarities, scores)
+        if image_id in by_id
+    ]
+
+
+def rrf_scores(rankings: List[List[int]], weights: List[float], k: int = RRF_K) -> dict:
+    """Reciprocal-rank fusion: ``sum(weight / (k + rank))`` over the rankings an id appears in."""
+    scores: dict = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, image_id in enumerate(ranking, start=1):
+            scores[image_id] = scores.get(image_id, 0.0) + weight / (k + rank)
+    return scores
+
+
+class PgvectorSearchBackend:
+    """Ranks inside Postgres, served by the ANN index from ``app.migrations``."""
+
+    async def search(
+        self,
+        db: AsyncSession,
+        embedding: List[float],
+        min_similarity: float = 0.0,
+        page: int = 1,
+        per_page: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        text_query: Optional[str] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[dict]:
+        """Rank by CLIP similarity; ``text_query`` first narrows to images whose description matches it."""
+        offset = (page - 1) * per_page
+        candidates = rerank_candidates(offset + per_page)
+        await apply_search_params(db, candidates, 0, ef_search, probes)
+
+        conditions, params = filters.where()
+        params.update({
+            "embedding": to_pgvector(embedding),
+            "embedding_reduced": reduced_query(embedding),
+            "min_similarity": min_similarity,
+            "candidates": candidates,
+            "offset": offset,
+            "limit": per_page
+        })
+        if text_query:
+            conditions += f" AND {TEXT_MATCH}"
+            params["text_query"] = text_query
+        results = (await db.execute(text(SEARCH_SQL.format(
+            filters=conditions, first_pass=first_pass_order("CAST(:embedding AS vector)")
+        )), params)).fetchall()
+
+        return [format_result(row, row.similarity) for row in results]
+
+    async def hybrid_search(
+        self,
+        db: AsyncSession,
+        embedding: List[float],
+        text_query: str,
+        min_similarity: float = 0.0,
+        page: int = 1,
+        per_page: int = 10,
+        vector_weight: float = 1.0,
+        text_weight: float = 1.0,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[dict]:
+        offset = (page - 1) * per_page
+        candidates = max(HYBRID_CANDIDATES, offset + per_page)
+        vector_candidates = rerank_candidates(candidates)
+        await apply_search_params(db, vector_candidates, 0, ef_search, probes)
+
+        conditions, params = filters.where()
+        results = (await db.execute(text(HYBRID_SQL.format(
+            filters=conditions, first_pass=first_pass_order("CAST(:embedding AS vector)")
+        )), {
+            **params,
+            "vector_candidates": vector_candidates,
+            "embedding": to_pgvector(embedding),
+            "embedding_reduced": reduced_query(embedding),
+            "text_query": text_query,
+            "min_similarity": min_similarity,
+            "candidates": candidates,
+            "vector_weight": vector_weight,
+            "text_weight": text_weight,
+            "rrf_k": RRF_K,
+            "offset": offset,
+            "limit": per_page
+        })).fetchall()
+
+        return [format_result(row, row.similarity, row.score) for row in results]
+
+    async def search_batch(
+        self,
+        db: AsyncSession,
+        embeddings: List[List[float]],
+        min_similarity: float = 0.0,
+        per_page: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[List[dict]]:
+        """Top ``per_page`` matches of every embedding, one list per embedding, in one query."""
+        candidates = rerank_candidates(per_page)
+        await apply_search_params(db, candidates, 0, ef_search, probes)
+
+        conditions, params = filters.where()
+        params.update({f"embedding_{i}": to_pgvector(embedding) for i, embedding in enumerate(embeddings)})
+        if SEARCH_FIRST_PASS == "reduced":
+            params.update({f"reduced_{i}": reduced_query(embedding) for i, embedding in enumerate(embeddings)})
+        params.update({"min_similarity": min_similarity, "candidates": candidates, "limit": per_page})
+        rows = (await db.execute(text(batch_search_sql(len(embeddings), conditions)), params)).fetchall()
+
+        results: List[List[dict]] = [[] for _ in embeddings]
+        for row in rows:
+            results[row.query_index].append(format_result(row, row.similarity))
+        return results
+
+    def add(self, image_id: int, embedding: List[float], row=None):
+        pass
+
+
+class NumpySearchBackend:
+    """Brute-force cosine search over an in-process copy of every embedding.
+
+    Vectors live in one contiguous, L2-normalised float32 matrix, so a query is
+    a single matrix-vector product plus ``argpartition``. The columns that
+    searches filter on are kept in parallel arrays and turned into a mask
+    before ranking. Postgres is only used to hydrate the winning ids. Each
+    worker process holds its own copy: rows added through ``add`` show up
+    immediately, rows added by other workers are picked up every
+    ``sync_interval`` seconds by their ``embedded_at``. Ingest finishes out of
+    id order, so ids are no watermark; each sync re-reads the last
+    ``sync_overlap`` seconds to catch transactions that committed late.
+    """
+
+    def __init__(self, dim: int = 512, sync_interval: float = 30.0, sync_overlap: float = 60.0):
+        self.dim = dim
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        # NULL flags count as neither true nor false, as they do in SQL
+        self._is_private = np.empty(0, dtype=np.int8)
+        self._is_ai_generated = np.empty(0, dtype=np.int8)
+        self._user_ids = np.empty(0, dtype=np.int64)
+        self._created_at = np.empty(0, dtype=np.float64)
+        self._size = 0
+        self._loaded = False
+        self._last_sync = 0.0
+        # database time at the start of the last sync
+        self._synced_at: Optional[datetime] = None
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _flag(value: Optional[bool]) -> int:
+        return -1 if value is None else int(value)
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray, rows):
+        needed = self._size + len(ids)
+        if needed > len(self._ids):
+            capacity = max(needed, 2 * len(self._ids), 1024)
+            matrix = np.empty((capacity, self.dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            self._matrix = matrix
+            for name in ("_ids", "_is_private", "_is_ai_generated", "_user_ids", "_created_at"):
+                old = getattr(self, name)
+                buffer = np.empty(capacity, dtype=old.dtype)
+                buffer[:self._size] = old[:self._size]
+                setattr(self, name, buffer)
+
+        new = slice(self._size, needed)
+        self._matrix[new] = self._normalize(vectors.astype(np.float32, copy=False))
+        self._ids[new] = ids
+        self._is_private[new] = [self._flag(row.is_private) for row in rows]
+        self._is_ai_generated[new] = [self._flag(row.is_ai_generated) for row in rows]
+        self._user_ids[new] = [row.user_id for row in rows]
+        self._created_at[new] = [row.created_at.timestamp() if row.created_at else np.nan for row in rows]
+        self._size = needed
+
+    async def _sync(self, db: AsyncSession):
+        started = (await db.execute(text("SELECT now()"))).scalar()
+        query = (
+            select(Image.id, Image.vector_embedding, Image.user_id, Image.is_private,
+                   Image.is_ai_generated, Image.created_at)
+            .where(Image.vector_embedding.isnot(None))
+            .order_by(Image.id)
+        )
+        if self._synced_at is not None:
+            query = query.where(Image.embedded_at >= self._synced_at - timedelta(seconds=self.sync_overlap))
+        rows = (await db.execute(query)).all()
+        if rows:
+            ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+            with self._lock:
+                # the overlap re-reads rows that are already indexed
+                new = np.flatnonzero(~np.isin(ids, self._ids[:self._size]))
+                if len(new):
+                    self._append(ids[new], np.vstack([rows[i].vector_embedding for i in new]),
+                                 [rows[i] for i in new])
+        self._synced_at = started
+        self._loaded = True
+        self._last_sync = time.monotonic()
+
+    def add(self, image_id: int, embedding: List[float], row=None):
+        """Index a freshly ingested image; ``row`` carries its filter columns.
+
+        Without ``row`` the image is left to the next sync.
+        """
+        if not self._loaded or row is None:
+            return
+        with self._lock:
+            if image_id not in self._ids[:self._size]:
+                self._append(np.array([image_id], dtype=np.int64),
+                             np.asarray(embedding, dtype=np.float32).reshape(1, -1), [row])
+
+    def _filter_mask(self, filters: SearchFilters) -> np.ndarray:
+        """Rows passing ``filters``; the counterpart of ``SearchFilters.where``. Call under the lock."""
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        if not filters.include_private:
+            mask &= self._is_private[:size] == 0
+        if filters.is_ai_generated is not None:
+            mask &= self._is_ai_generated[:size] == int(filters.is_ai_generated)
+        if filters.user_id is not None:
+            mask &= self._user_ids[:size] == filters.user_id
+        if filters.created_after is not None:
+            mask &= self._created_at[:size] >= _utc(filters.created_after).timestamp()
+        if filters.created_before is not None:
+            mask &= self._created_at[:size] < _utc(filters.created_before).timestamp()
+        if filters.exclude_id is not None:
+            mask &= self._ids[:size] != filters.exclude_id
+        return mask
+
+    def top_k(self, embedding: List[float], k: int, min_similarity: float = 0.0,
+              allowed_ids: Optional[List[int]] = None, filters: SearchFilters = PUBLIC):
+        """Return ``(ids, similarities)`` of the ``k`` best matches, best first."""
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            matrix, ids = self._matrix[:self._size], self._ids[:self._size]
+            mask = self._filter_mask(filters)
+            similarities = matrix @ query
+
+        mask &= similarities > min_similarity
+        if allowed_ids is not None:
+            mask &= np.isin(ids, allowed_ids)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > k:
+            top = np.argpartition(-similarities[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        order = candidates[np.argsort(-similarities[candidates], kind="stable")]
+        return ids[order], similarities[order]
+
+    async def search(
+        self,
+        db: AsyncSession,
+        embedding: List[float],
+        min_similarity: float = 0.0,
+        page: int = 1,
+        per_page: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        text_query: Optional[str] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[dict]:
+        await self._ensure_synced(db)
+
+        allowed_ids = None
+        if text_query:
+            allowed_ids = (await db.execute(TEXT_MATCH_SQL, {"text_query": text_query})).scalars().all()
+
+        offset = (page - 1) * per_page
+        ids, similarities = self.top_k(embedding, offset + per_page, min_similarity, allowed_ids, filters)
+        ids, similarities = ids[offset:], similarities[offset:]
+        return await hydrate(db, ids.tolist(), similarities.tolist())
+
+    async def hybrid_search(
+        self,
+        db: AsyncSession,
+        embedding: List[float],
+        text_query: str,
+        min_similarity: float = 0.0,
+        page: int = 1,
+        per_page: int = 10,
+        vector_weight: float = 1.0,
+        text_weight: float = 1.0,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[dict]:
+        """Fuse the in-memory vector ranking with the Postgres full-text ranking."""
+        await self._ensure_synced(db)
+
+        offset = (page - 1) * per_page
+        candidates = max(HYBRID_CANDIDATES, offset + per_page)
+        vector_ids, _ = self.top_k(embedding, candidates, min_similarity, filters=filters)
+        conditions, params = filters.where()
+        text_ids = (await db.execute(text(TEXT_RANK_SQL.format(filters=conditions)), {
+            **params, "text_query": text_query, "candidates": candidates
+        })).scalars().all()
+
+        scores = rrf_scores([vector_ids.tolist(), list(text_ids)], [vector_weight, text_weight])
+        ranked = sorted((image_id for image_id, score in scores.items() if score > 0),
+                        key=lambda image_id: (-scores[image_id], image_id))[offset:offset + per_page]
+        similarities = self.similarities(embedding, ranked)
+        return await hydrate(db, ranked, similarities, [scores[image_id] for image_id in ranked])
+
+    async def search_batch(
+        self,
+        db: AsyncSession,
+        embeddings: List[List[float]],
+        min_similarity: float = 0.0,
+        per_page: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[List[dict]]:
+        """Score every query with one matrix-matrix product and hydrate all winners at once."""
+        await self._ensure_synced(db)
+
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            matrix, ids = self._matrix[:self._size], self._ids[:self._size]
+            mask = self._filter_mask(filters)
+            similarities = matrix @ queries.T  # (images, queries)
+
+        ranked = []
+        for column in similarities.T:
+            candidates = np.flatnonzero(mask & (column > min_similarity))
+            if len(candidates) > per_page:
+                top = np.argpartition(-column[candidates], per_page - 1)[:per_page]
+                candidates = candidates[top]
+            order = candidates[np.argsort(-column[candidates], kind="stable")]
+            ranked.append((ids[order].tolist(), column[order].tolist()))
+
+        rows = await hydrate_rows(db, list({image_id for query_ids, _ in ranked for image_id in query_ids}))
+        return [
+            [format_result(rows[image_id], similarity)
+             for image_id, similarity in zip(query_ids, query_similarities) if image_id in rows]
+            for query_ids, query_similarities in ranked
+        ]
+
+    def similarities(self, embedding: List[float], image_ids: List[int]) -> List[float]:
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            ids = self._ids[:self._size]
+            positions = np.flatnonzero(np.isin(ids, image_ids))
+            found = dict(zip(ids[positions].tolist(), (self._matrix[positions] @ query).tolist()))
+        return [found.get(image_id, 0.0) for image_id in image_ids]
+
+    def _stale(self) -> bool:
+        return not self._loaded or time.monotonic() - self._last_sync > self.sync_interval
+
+    async def _ensure_synced(self, db: AsyncSession):
+        if not self._stale():
+            return
+        # one sync at a time; requests that queued behind it find the index fresh
+        async with self._sync_lock:
+            if self._stale():
+                await self._sync(db)
+
+
+def create_search_backend():
+    """Pick the backend from ``SEARCH_BACKEND`` (``pgvector`` by default, or ``numpy``)."""
+    backend = os.getenv("SEARCH_BACKEND", "pgvector").lower()
+    if backend == "pgvector":
+        return PgvectorSearchBackend()
+    if backend == "numpy":
+        return NumpySearchBackend(
+            sync_interval=float(os.getenv("NUMPY_SEARCH_SYNC_INTERVAL", "30")),
+            sync_overlap=float(os.getenv("NUMPY_SEARCH_SYNC_OVERLAP", "60")),
+        )
+    raise ValueError(f"Unknown SEARCH_BACKEND: {backend}")
+
+
+search_backend = create_search_backend()
@@ -0,0 +1,192 @@
+"""Cache of ranked search results, so paging through a search does not re-rank.
+
+The first request for a search ranks its top ``SEARCH_CACHE_DEPTH`` images
+once and keeps the ranked ids (with similarities and fusion scores) for
+``SEARCH_CACHE_TTL`` seconds, keyed by the query embedding, mode and every
+parameter that changes the ranking. Later pages slice that list and only
+fetch their own rows with ``id = ANY(...)``, so likes and descriptions are
+always current. Pages past the cached depth go to the backend directly.
+
+Images ingested by this process are merged into cached vector rankings they
+belong to; text-ranked entries (hybrid/filtered) are dropped instead, since
+their text side cannot be recomputed here. Other workers' uploads show up
+once an entry expires.
+"""
+import bisect
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .search import PUBLIC, SearchFilters, hydrate, search_backend
+
+load_dotenv()
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_DEPTH = int(os.getenv("SEARCH_CACHE_DEPTH", "200"))
+
+
+@dataclass
+class RankedResults:
+    ids: List[int]
+    similarities: List[float]
+    scores: Optional[List[float]]
+    # every match is in the list: pages beyond it are empty, not uncached
+    complete: bool
+    # normalised query vector, kept for vector-only rankings that new images can be merged into
+    query: Optional[np.ndarray] = None
+    min_similarity: float = 0.0
+    filters: SearchFilters = PUBLIC
+
+
+def embedding_key(embedding: List[float]) -> str:
+    return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SearchResultCache:
+    def __init__(self, backend, maxsize: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL,
+                 depth: int = SEARCH_CACHE_DEPTH):
+        self.backend = backend
+        self.depth = depth
+        self.enabled = maxsize > 0 and depth > 0
+        self._entries = TTLCache(maxsize=max(maxsize, 1), ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.merged = 0
+
+    async def search(
+        self,
+        db: AsyncSession,
+        embedding: List[float],
+        min_similarity: float = 0.0,
+        page: int = 1,
+        per_page: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        text_query: Optional[str] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[dict]:
+        """Cached ``search_backend.search``."""
+        async def rank(page: int, per_page: int) -> List[dict]:
+            return await self.backend.search(db, embedding, min_similarity, page, per_page,
+                                             ef_search, probes, text_query=text_query, filters=filters)
+
+        key = ("vector", embedding_key(embedding), min_similarity, ef_search, probes, text_query, filters)
+        extend = None if text_query else (embedding, min_similarity, filters)
+        return await self._page(db, key, page, per_page, rank, extend)
+
+    async def hybrid_search(
+        self,
+        db: AsyncSession,
+        embedding: List[float],
+        text_query: str,
+        min_similarity: float = 0.0,
+        page: int = 1,
+        per_page: int = 10,
+        vector_weight: float = 1.0,
+        text_weight: float = 1.0,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: SearchFilters = PUBLIC,
+    ) -> List[dict]:
+        """Cached ``search_backend.hybrid_search``."""
+        async def rank(page: int, per_page: int) -> List[dict]:
+            return await self.backend.hybrid_search(db, embedding, text_query, min_similarity, page, per_page,
+                                                    vector_weight, text_weight, ef_search, probes,
+                                                    filters=filters)
+
+        key = ("hybrid", embedding_key(embedding), text_query, min_similarity,
+               vector_weight, text_weight, ef_search, probes, filters)
+        return await self._page(db, key, page, per_page, rank, None)
+
+    async def _page(self, db: AsyncSession, key: tuple, page: int, per_page: int,
+                    rank: Callable[[int, int], Awaitable[List[dict]]], extend) -> List[dict]:
+        offset = (page - 1) * per_page
+        if not self.enabled:
+            return await rank(page, per_page)
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and (offset + per_page <= self.depth or entry.complete):
+            with self._lock:
+                self.hits += 1
+                end = offset + per_page
+                ids, similarities = entry.ids[offset:end], entry.similarities[offset:end]
+                scores = entry.scores[offset:end] if entry.scores is not None else None
+            return await hydrate(db, ids, similarities, scores)
+
+        if offset + per_page > self.depth:
+            with self._lock:
+                self.bypassed += 1
+            return await rank(page, per_page)
+
+        with self._lock:
+            self.misses += 1
+        results = await rank(1, self.depth)
+        entry = RankedResults(
+            ids=[result["id"] for result in results],
+            similarities=[result["similarity"] for result in results],
+            scores=[result["score"] for result in results] if results and "score" in results[0] else None,
+            complete=len(results) < self.depth,
+        )
+        if extend is not None:
+            embedding, entry.min_similarity, entry.filters = extend
+            entry.query = _normalize(embedding)
+        with self._lock:
+            self._entries[key] = entry
+        return results[offset:offset + per_page]
+
+    def add(self, image_id: int, embedding: List[float], row=None):
+        """Merge a newly ingested image into the cached rankings it belongs to."""
+        if not self.enabled:
+            return
+        vector = _normalize(embedding)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.query is None:
+                    # text-ranked: cannot place the image without re-ranking
+                    self._entries.pop(key, None)
+                    continue
+                if row is None or not entry.filters.matches(row) or image_id in entry.ids:
+                    continue
+                similarity = round(float(entry.query @ vector), 4)
+                if similarity <= entry.min_similarity:
+                    continue
+                position = bisect.bisect_left([-s for s in entry.similarities], -similarity)
+                if position == len(entry.ids) and not entry.complete:
+                    continue  # ranks below everything cached; later pages are not cached anyway
+                entry.ids.insert(position, image_id)
+                entry.similarities.insert(position, similarity)
+                if len(entry.ids) > self.depth:
+                    del entry.ids[self.depth:], entry.similarities[self.depth:]
+                    entry.complete = False
+                self.merged += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "depth": self.depth,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "merged": self.merged,
+            }
+
+
+search_cache = SearchResultCache(search_backend)
@@ -0,0 +1,208 @@
+"""Local CPU inference for CLIP, the in-process alternative to the Azure endpoint.
+
+Uses the same checkpoint and preprocessing as ``score.py`` (the scoring script
+deployed behind the Azure endpoint), so vectors from either backend can be
+mixed in ``images.vector_embedding``. Selected with ``CLIP_BACKEND=local``;
+torch/transformers (and onnxruntime for ``CLIP_LOCAL_ONNX``) come from
+environment.yml and are only imported when the local backend is used.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from PIL import Image
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = os.getenv("CLIP_LOCAL_MODEL", "openai/clip-vit-base-patch32")
+ONNX_DIR = os.getenv("CLIP_LOCAL_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "visium", "clip-onnx"))
+
+
+class LocalClipModel:
+    """Loads CLIP once and runs batched feature extraction under ``torch.inference_mode()``.
+
+    ``quantize`` applies dynamic int8 quantisation to the Linear layers (or to
+    the exported graph when ``onnx`` is on). ``onnx`` exports both towers to
+    ONNX on first use and serves them with ONNX Runtime instead of torch.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, quantize: bool = False, onnx: bool = False):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.onnx = onnx
+        self.model = None
+        self.processor = None
+        self.sessions = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.processor is not None:
+                return
+            import torch
+            from transformers import CLIPModel, CLIPProcessor
+
+            processor = CLIPProcessor.from_pretrained(self.model_name)
+            model = CLIPModel.from_pretrained(self.model_name).eval()
+            if self.onnx:
+                self.sessions = self._onnx_sessions(model, processor)
+            else:
+                if self.quantize:
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self.model = model
+            self.processor = processor
+            logger.info(f"Loaded local CLIP {self.model_name} (onnx={self.onnx}, int8={self.quantize})")
+
+    def _onnx_sessions(self, model, processor):
+        import onnxruntime
+        import torch
+
+        class ImageFeatures(torch.nn.Module):
+            def forward(self, pixel_values):
+                return model.get_image_features(pixel_values=pixel_values)
+
+        class TextFeatures(torch.nn.Module):
+            def forward(self, input_ids, attention_mask):
+                return model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+        os.makedirs(ONNX_DIR, exist_ok=True)
+        suffix = ".int8.onnx" if self.quantize else ".onnx"
+        sample_image = processor(images=Image.new("RGB", (224, 224)), return_tensors="pt")
+        sample_text = processor(text=["a photo"], return_tensors="pt", padding=True)
+        towers = {
+            "image": (ImageFeatures(), (sample_image["pixel_values"],),
+                      {"pixel_values": {0: "batch"}}),
+            "text": (TextFeatures(), (sample_text["input_ids"], sample_text["attention_mask"]),
+                     {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}}),
+        }
+
+        paths = {}
+        for name, (module, args, input_axes) in towers.items():
+            raw_path = os.path.join(ONNX_DIR, f"{name}.onnx")
+            paths[name] = os.path.join(ONNX_DIR, f"{name}{suffix}")
+            if not os.path.exists(raw_path):
+                torch.onnx.export(
+                    module, args, raw_path,
+                    input_names=list(input_axes),
+                    output_names=["features"],
+                    dynamic_axes={**input_axes, "features": {0: "batch"}},
+                    opset_version=17
+                )
+            if self.quantize and not os.path.exists(paths[name]):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(raw_path, paths[name], weight_type=QuantType.QInt8)
+
+        providers = ["CPUExecutionProvider"]
+        return {name: onnxruntime.InferenceSession(path, providers=providers) for name, path in paths.items()}
+
+    def embed_images(self, images: List[bytes]) -> List[List[float]]:
+        self.load()
+        pil_images = [Image.open(BytesIO(data)).convert("RGB") for data in images]
+        if self.sessions is not None:
+            inputs = self.processor(images=pil_images, return_tensors="np")
+            features = self.sessions["image"].run(None, {"pixel_values": inputs["pixel_values"]})[0]
+            return features.tolist()
+
+        import torch
+        inputs = self.processor(images=pil_images, return_tensors="pt")
+        with torch.inference_mode():
+            features = self.model.get_image_features(**inputs)
+        return features.cpu().numpy().tolist()
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        self.load()
+        if self.sessions is not None:
+            inputs = self.processor(text=texts, return_tensors="np", padding=True, truncation=True)
+            features = self.sessions["text"].run(None, {
+                "input_ids": inputs["input_ids"].astype("int64"),
+                "attention_mask": inputs["attention_mask"].astype("int64"),
+            })[0]
+            return features.tolist()
+
+        import torch
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True, truncation=True)
+        with torch.inference_mode():
+            features = self.model.get_text_features(**inputs)
+        return features.cpu().numpy().tolist()
+
+
+# Process-pool workers each hold their own model, created by the initializer.
+_worker_model: Optional[LocalClipModel] = None
+
+
+def _init_worker(model_name: str, quantize: bool, onnx: bool):
+    global _worker_model
+    _worker_model = LocalClipModel(model_name, quantize, onnx)
+    _worker_model.load()
+
+
+def _worker_embed_images(images: List[bytes]) -> List[List[float]]:
+    return _worker_model.embed_images(images)
+
+
+def _worker_embed_texts(texts: List[str]) -> List[List[float]]:
+    return _worker_model.embed_texts(texts)
+
+
+class LocalClipBackend:
+    """Runs ``LocalClipModel`` on a thread or process pool so async callers never block the loop."""
+
+    def __init__(self, model: LocalClipModel, pool: str = "thread", workers: int = 1):
+        self.model = model
+        self.pool = pool
+        if pool == "process":
+            self.executor: Executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(model.model_name, model.quantize, model.onnx)
+            )
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="clip")
+
+    def embed_images(self, images: List[bytes]) -> List[List[float]]:
+        if self.pool == "process":
+            return self.executor.submit(_worker_embed_images, images).result()
+        return self.model.embed_images(images)
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if self.pool == "process":
+            return self.executor.submit(_worker_embed_texts, texts).result()
+        return self.model.embed_texts(texts)
+
+    async def aembed_images(self, images: List[bytes]) -> List[List[float]]:
+        fn = _worker_embed_images if self.pool == "process" else self.model.embed_images
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, images)
+
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        fn = _worker_embed_texts if self.pool == "process" else self.model.embed_texts
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, texts)
+
+
+_backend: Optional[LocalClipBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_local_backend() -> Optional[LocalClipBackend]:
+    """Shared local backend when ``CLIP_BACKEND=local``, otherwise None (use Azure)."""
+    global _backend
+    if os.getenv("CLIP_BACKEND", "azure").lower() != "local":
+        return None
+    with _backend_lock:
+        if _backend is None:
+            model = LocalClipModel(
+                quantize=os.getenv("CLIP_LOCAL_QUANTIZE", "false").lower() == "true",
+                onnx=os.getenv("CLIP_LOCAL_ONNX", "false").lower() == "true",
+            )
+            _backend = LocalClipBackend(
+                model,
+                pool=os.getenv("CLIP_LOCAL_POOL", "thread").lower(),
+                workers=int(os.getenv("CLIP_LOCAL_WORKERS", "1"))
+            )
+        return _backend
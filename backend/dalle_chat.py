@@ -1,3 +1,4 @@
+import asyncio
 import requests
 from PIL import Image
 import io
@@ -11,9 +12,11 @@ from typing import List, Dict, Union
 from dotenv import load_dotenv
 from PIL import Image, ImageDraw
 from io import BytesIO
+from http_client import http_client
 load_dotenv()
 # === Настройки ===
 api_key = os.getenv("OPENAI_API_KEY")
+EDITS_URL = "https://api.openai.com/v1/images/edits"
 # image_path = "or.png"
 # img = Image.open(image_path)
 # width, height = img.size
@@ -65,9 +68,9 @@ def prepare_image(path, size):
 # else:
 #     print("Ошибка:", response.status_code, response.text)
 
-def edit_image(image_path: str, prompt: str) -> Image.Image:
+def _prepare_edit_request(image_path, prompt: str):
     """
-    Edit the given image based on the prompt using DALL-E edits API and return the edited PIL Image.
+    Build the multipart files/data for the DALL-E edits API: the image plus a mask with a transparent center.
     """
     # Load and prepare the original image
     img = Image.open(image_path).convert("RGBA")
@@ -85,26 +88,55 @@ def edit_image(image_path: str, prompt: str) -> Image.Image:
         buf.seek(0)
         return buf
 
-    image_file = to_buffer(img)
-    mask_file = to_buffer(mask)
-
-    # Call the OpenAI image edits endpoint
-    headers = {"Authorization": f"Bearer {api_key}"}
     files = {
-        "image": ("image.png", image_file, "image/png"),
-        "mask": ("mask.png", mask_file, "image/png"),
+        "image": ("image.png", to_buffer(img), "image/png"),
+        "mask": ("mask.png", to_buffer(mask), "image/png"),
     }
     data = {"prompt": prompt, "model": "gpt-image-1", "size": "auto"}
+    return files, data
+
+
+def _decode_edit_response(response) -> Image.Image:
+    """
+    Works for both requests and httpx responses.
+    """
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+    b64 = response.json()["data"][0]["b64_json"]
+    return Image.open(BytesIO(base64.b64decode(b64)))
+
+
+def edit_image(image_path: str, prompt: str) -> Image.Image:
+    """
+    Edit the given image based on the prompt using DALL-E edits API and return the edited PIL Image.
+    """
+    files, data = _prepare_edit_request(image_path, prompt)
+
+    # Call the OpenAI image edits endpoint
+    headers = {"Authorization": f"Bearer {api_key}"}
     response = requests.post(
-        "https://api.openai.com/v1/images/edits",
+        EDITS_URL,
         headers=headers,
         files=files,
         data=data
     )
+    return _decode_edit_response(response)
 
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
 
-    b64 = response.json()["data"][0]["b64_json"]
-    edited_img = Image.open(BytesIO(base64.b64decode(b64)))
-    return edited_img
+async def aedit_image(image_path, prompt: str) -> Image.Image:
+    """
+    Async variant of edit_image that goes through the shared pooled HTTP client.
+    The Pillow decoding and PNG encoding run in a thread, off the event loop.
+    """
+    files, data = await asyncio.to_thread(_prepare_edit_request, image_path, prompt)
+
+    headers = {"Authorization": f"Bearer {api_key}"}
+    response = await http_client.post(
+        "image_edit",
+        EDITS_URL,
+        headers=headers,
+        files=files,
+        data=data
+    )
+    return await asyncio.to_thread(_decode_edit_response, response)
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Generic, List, Optional, Set, TypeVar
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# upstream statuses that say "not now" about the whole batch
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+MAX_RETRY_DELAY = 5.0
+
+
+def _is_item_error(error: Exception) -> bool:
+    """Whether a failed batch can be blamed on some of its items, so bisecting it helps."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return False
+    # undecodable images and the like
+    return isinstance(error, (ValueError, OSError))
+
+
+def _retry_delay(error: Exception) -> Optional[float]:
+    """Seconds to wait before retrying the whole batch once, or None to fail it."""
+    if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code not in RETRYABLE_STATUSES:
+        return None
+    retry_after = error.response.headers.get("retry-after", "")
+    return min(float(retry_after), MAX_RETRY_DELAY) if retry_after.isdigit() else 1.0
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesces concurrent single-item requests into one batched call.
+
+    Callers ``await submit(item)``. A background task collects items until
+    ``max_batch_size`` is reached or ``max_wait_ms`` has passed since the first
+    one arrived, calls ``process_batch`` once with the whole list and resolves
+    every caller's future with its own row. Batches are dispatched without
+    waiting for the previous one to finish.
+
+    When a batch fails because of some of its items (a 4xx validation error,
+    an undecodable image), it is split in half and retried, so one bad item
+    only fails its own caller. A rate limit or 5xx is retried once as a whole
+    after a short backoff. Anything else, such as timeouts, fails the batch.
+    """
+
+    def __init__(self, process_batch: Callable[[List[T]], Awaitable[List[R]]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # in-flight _dispatch tasks; the loop only keeps weak references to tasks
+        self._dispatches: Set[asyncio.Task] = set()
+        self._loop = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._dispatches = set()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item: T) -> R:
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = self._loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def close(self):
+        """Stop collecting, let in-flight batches finish and fail whatever is still queued."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, *self._dispatches, return_exceptions=True)
+        self._worker = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher closed"))
+
+    @staticmethod
+    def _fail(batch, error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _dispatch(self, batch, retried: bool = False):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"Batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            if _is_item_error(e):
+                if len(batch) > 1:
+                    logger.warning(f"Batch of {len(items)} failed, retrying in halves: {e}")
+                    middle = len(batch) // 2
+                    await asyncio.gather(self._dispatch(batch[:middle]), self._dispatch(batch[middle:]))
+                    return
+                logger.error(f"Batch item failed: {e}")
+                self._fail(batch, e)
+                return
+            delay = None if retried else _retry_delay(e)
+            if delay is not None:
+                logger.warning(f"Batch of {len(items)} failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                await self._dispatch(batch, retried=True)
+                return
+            logger.error(f"Batch of {len(items)} failed: {e}")
+            self._fail(batch, e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def default_batcher(process_batch: Callable[[List[T]], Awaitable[List[R]]]) -> Optional[MicroBatcher]:
+    """Batcher configured from CLIP_BATCH_MAX_SIZE / CLIP_BATCH_MAX_WAIT_MS; None when batching is off."""
+    max_batch_size = int(os.getenv("CLIP_BATCH_MAX_SIZE", "16"))
+    if max_batch_size <= 1:
+        return None
+    return MicroBatcher(
+        process_batch,
+        max_batch_size=max_batch_size,
+        max_wait_ms=float(os.getenv("CLIP_BATCH_MAX_WAIT_MS", "5"))
+    )
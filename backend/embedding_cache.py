@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# seconds between purges of expired and surplus rows from the SQLite file
+PURGE_INTERVAL = 300
+# disk writes waiting for the writer thread; further ones are dropped
+WRITE_QUEUE_SIZE = 10000
+WRITE_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """Bounded LRU cache of embedding vectors with an optional TTL.
+
+    When ``path`` is set, entries are also written to a SQLite file so the
+    cache survives restarts; the in-memory tier is checked first and disk hits
+    are promoted back into it. Disk writes are queued to a writer thread that
+    commits them in batches and periodically deletes expired rows and the
+    oldest ones beyond ``disk_maxsize``, so ``set`` never waits on SQLite.
+    Async callers use ``aget``, which reads the file off the event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0, path: Optional[str] = None,
+                 table: str = "embeddings", disk_maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.table = table
+        self.disk_maxsize = disk_maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dropped_writes = 0
+
+        self._db = None
+        self._writes: "queue.Queue" = queue.Queue(WRITE_QUEUE_SIZE)
+        if path:
+            self._path = path
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL)"
+            )
+            self._db.commit()
+            self._db_lock = threading.Lock()
+            self._writer = threading.Thread(target=self._write_loop, name=f"{table}-cache-writer", daemon=True)
+            self._writer.start()
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    def _remember(self, key: str, vector: List[float], expires_at: Optional[float]):
+        self._entries[key] = (vector, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_memory(self, key: str, now: float) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[List[float]]:
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    f"SELECT vector, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+            row = None
+        with self._lock:
+            if row is not None and (row[1] is None or row[1] > now):
+                vector = array("f", row[0]).tolist()
+                self._remember(key, vector, row[1])
+                self.disk_hits += 1
+                return vector
+            self.misses += 1
+            return None
+
+    def get(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        vector = self._get_memory(key, now)
+        if vector is None and self._db is not None:
+            vector = self._get_disk(key, now)
+        return vector
+
+    async def aget(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        vector = self._get_memory(key, now)
+        if vector is None and self._db is not None:
+            vector = await asyncio.to_thread(self._get_disk, key, now)
+        return vector
+
+    def set(self, key: str, vector: List[float]):
+        expires_at = self._expires_at()
+        with self._lock:
+            self._remember(key, vector, expires_at)
+        if self._db is not None:
+            try:
+                self._writes.put_nowait((key, array("f", vector).tobytes(), expires_at))
+            except queue.Full:
+                with self._lock:
+                    self.dropped_writes += 1
+
+    def _write_loop(self):
+        db = sqlite3.connect(self._path)
+        last_purge = 0.0
+        while True:
+            try:
+                rows = [self._writes.get(timeout=PURGE_INTERVAL)]
+            except queue.Empty:
+                rows = []
+            while rows and rows[-1] is not None and len(rows) < WRITE_BATCH_SIZE:
+                try:
+                    rows.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = bool(rows) and rows[-1] is None
+            rows = [row for row in rows if row is not None]
+            try:
+                if rows:
+                    db.executemany(
+                        f"INSERT OR REPLACE INTO {self.table} (key, vector, expires_at) VALUES (?, ?, ?)", rows
+                    )
+                    db.commit()
+                if time.time() - last_purge >= PURGE_INTERVAL:
+                    self._purge(db)
+                    last_purge = time.time()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+            if stop:
+                db.close()
+                return
+
+    def _purge(self, db):
+        db.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        # INSERT OR REPLACE gives rewritten keys a new rowid, so low rowids are the oldest writes
+        db.execute(
+            f"DELETE FROM {self.table} WHERE rowid <= "
+            f"(SELECT rowid FROM {self.table} ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+            (self.disk_maxsize,)
+        )
+        db.commit()
+
+    def close(self):
+        """Flush the queued disk writes and stop the writer thread."""
+        if self._db is not None and self._writer.is_alive():
+            self._writes.put(None)
+            self._writer.join()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "dropped_writes": self.dropped_writes,
+            }
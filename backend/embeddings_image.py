@@ -1,19 +1,49 @@
 import os
+import asyncio
 import base64
+import hashlib
 import requests
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 from PIL import Image
 from io import BytesIO
 import logging
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache
+from http_client import fetch_image, http_client
+from embedding_batcher import default_batcher
+from clip_local import get_local_backend
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def default_image_cache() -> Optional[EmbeddingCache]:
+    maxsize = int(os.getenv("IMAGE_EMBEDDING_CACHE_SIZE", "2048"))
+    if maxsize <= 0:
+        return None
+    return EmbeddingCache(
+        maxsize=maxsize,
+        ttl=float(os.getenv("IMAGE_EMBEDDING_CACHE_TTL", "0")),
+        path=os.getenv("IMAGE_EMBEDDING_CACHE_PATH"),
+        disk_maxsize=int(os.getenv("IMAGE_EMBEDDING_CACHE_DISK_SIZE", "100000")),
+        table="image_embeddings"
+    )
+
+
+def is_url(image_input: str) -> bool:
+    return image_input.startswith(("http://", "https://"))
+
+
 class ClipImageEmbedder:
-    def __init__(self):
+    def __init__(self, cache: Optional[EmbeddingCache] = None,
+                 url_lookup: Optional[Callable[[str], Optional[List[float]]]] = None):
+        """url_lookup - необязательный поиск уже сохранённого эмбеддинга по URL (например, в images)"""
+        self.cache = cache if cache is not None else default_image_cache()
+        self.url_lookup = url_lookup
+        self.batcher = default_batcher(self._embed_batch)
+        self.local = get_local_backend()
         self.endpoint = os.getenv("CLIP_ENDPOINT")
         self.api_key = os.getenv("CLIP_EMBADING_API")
         self.deployment = os.getenv("CLIP_DEPLOYMENT_NAME")
@@ -25,7 +55,7 @@ class ClipImageEmbedder:
 
     def _prepare_image_data(self, image_input: str) -> str:
         """Подготавливает изображение: URL или base64"""
-        if image_input.startswith(("http://", "https://")):
+        if is_url(image_input):
             return image_input
         try:
             with open(image_input, "rb") as f:
@@ -34,26 +64,45 @@ class ClipImageEmbedder:
             logger.error(f"Error loading image: {str(e)}")
             raise
 
+    def _load_image_bytes(self, image_input: str) -> bytes:
+        """Скачивает изображение по URL или читает файл"""
+        if is_url(image_input):
+            return fetch_image(image_input)
+        with open(image_input, "rb") as f:
+            return f.read()
+
+    async def _aload_image_bytes(self, image_input: str) -> bytes:
+        """Асинхронная версия _load_image_bytes"""
+        if is_url(image_input):
+            return await http_client.fetch_image(image_input)
+        return await asyncio.to_thread(self._load_image_bytes, image_input)
+
+    @staticmethod
+    def _payload(images: List[str]) -> Dict:
+        return {
+            "input_data": {
+                "columns": ["image", "text"],
+                "index": list(range(len(images))),
+                "data": [[img_data, ""] for img_data in images]
+            }
+        }
+
     def get_embeddings(self, image_paths: List[str]) -> List[Dict]:
         """Получает эмбеддинги для списка изображений"""
-        try:
-            inputs = []
-            for path in image_paths:
-                img_data = self._prepare_image_data(path)
-                inputs.append([img_data, ""])
-
-            payload = {
-                "input_data": {
-                    "columns": ["image", "text"],
-                    "index": list(range(len(image_paths))),
-                    "data": inputs
-                }
-            }
+        return self._request_embeddings([self._prepare_image_data(path) for path in image_paths])
 
+    def _request_embeddings(self, images: List[str]) -> List[Dict]:
+        """Отправляет в endpoint список URL / base64 строк"""
+        if self.local is not None:
+            images_bytes = [
+                self._load_image_bytes(img) if is_url(img) else base64.b64decode(img) for img in images
+            ]
+            return [{"image_features": emb} for emb in self.local.embed_images(images_bytes)]
+        try:
             response = requests.post(
                 self.endpoint,
                 headers=self.headers,
-                json=payload,
+                json=self._payload(images),
                 timeout=30
             )
 
@@ -64,10 +113,141 @@ class ClipImageEmbedder:
             logger.error(f"API Error: {str(e)}")
             raise
 
+    async def aget_embeddings(self, image_paths: List[str]) -> List[Dict]:
+        """Асинхронная версия get_embeddings"""
+        images = [await asyncio.to_thread(self._prepare_image_data, path) for path in image_paths]
+        return await self._arequest_embeddings(images)
+
+    async def _arequest_embeddings(self, images: List[str]) -> List[Dict]:
+        """Асинхронная версия _request_embeddings через общий пул соединений"""
+        if self.local is not None:
+            images_bytes = [
+                await self._aload_image_bytes(img) if is_url(img) else base64.b64decode(img) for img in images
+            ]
+            return [{"image_features": emb} for emb in await self.local.aembed_images(images_bytes)]
+        try:
+            response = await http_client.post(
+                "clip",
+                self.endpoint,
+                headers=self.headers,
+                json=self._payload(images)
+            )
+
+            response.raise_for_status()
+            return response.json()
+
+        except Exception as e:
+            logger.error(f"API Error: {str(e)}")
+            raise
+
+    def _lookup_url(self, url_key: str, image_path: str) -> Optional[List[float]]:
+        """Быстрый путь по URL: кэш, затем url_lookup"""
+        embedding = self.cache.get(url_key) if self.cache is not None else None
+        if embedding is None and self.url_lookup is not None:
+            embedding = self.url_lookup(image_path)
+            if embedding is not None and self.cache is not None:
+                self.cache.set(url_key, embedding)
+        return embedding
+
+    def _remember(self, content_key: str, url_key: Optional[str], embedding: List[float]):
+        if self.cache is not None:
+            self.cache.set(content_key, embedding)
+            if url_key:
+                self.cache.set(url_key, embedding)
+
     def get_embedding(self, image_path: str) -> List[float]:
-        """Получает эмбеддинг для одного изображения"""
-        results = self.get_embeddings([image_path])
-        return results[0]['image_features']
+        """Получает эмбеддинг для одного изображения.
+
+        Сначала ищет по URL (кэш, затем url_lookup), потом по sha256 содержимого,
+        и только при промахе обращается к модели.
+        """
+        if self.cache is None and self.url_lookup is None:
+            results = self.get_embeddings([image_path])
+            return results[0]['image_features']
+
+        url_key = f"url:{image_path}" if is_url(image_path) else None
+        if url_key:
+            embedding = self._lookup_url(url_key, image_path)
+            if embedding is not None:
+                return embedding
+
+        return self.get_embedding_from_bytes(self._load_image_bytes(image_path), url_key)
+
+    def get_embedding_from_bytes(self, data: bytes, url_key: Optional[str] = None) -> List[float]:
+        """Эмбеддинг по содержимому файла, кэшируется по sha256"""
+        content_key = f"sha256:{hashlib.sha256(data).hexdigest()}"
+        embedding = self.cache.get(content_key) if self.cache is not None else None
+        if embedding is None:
+            results = self._request_embeddings([base64.b64encode(data).decode()])
+            embedding = results[0]['image_features']
+        self._remember(content_key, url_key, embedding)
+        return embedding
+
+    async def aget_embedding(self, image_path: str) -> List[float]:
+        """Асинхронная версия get_embedding"""
+        if self.cache is None and self.url_lookup is None:
+            results = await self.aget_embeddings([image_path])
+            return results[0]['image_features']
+
+        url_key = f"url:{image_path}" if is_url(image_path) else None
+        if url_key:
+            embedding = await asyncio.to_thread(self._lookup_url, url_key, image_path)
+            if embedding is not None:
+                return embedding
+
+        return await self.aget_embedding_from_bytes(await self._aload_image_bytes(image_path), url_key)
+
+    async def aget_embedding_from_bytes(self, data: bytes, url_key: Optional[str] = None) -> List[float]:
+        """Асинхронная версия get_embedding_from_bytes"""
+        content_key = f"sha256:{hashlib.sha256(data).hexdigest()}"
+        embedding = await self.cache.aget(content_key) if self.cache is not None else None
+        if embedding is None:
+            image_b64 = base64.b64encode(data).decode()
+            if self.batcher is not None:
+                embedding = await self.batcher.submit(image_b64)
+            else:
+                results = await self._arequest_embeddings([image_b64])
+                embedding = results[0]['image_features']
+        self._remember(content_key, url_key, embedding)
+        return embedding
+
+    async def aget_embedding_batch(self, image_paths: List[str]) -> List[List[float]]:
+        """Эмбеддинги для списка изображений: кэш по URL и sha256, затем один запрос на все промахи"""
+        if self.cache is None and self.url_lookup is None:
+            results = await self.aget_embeddings(image_paths)
+            return [row['image_features'] for row in results]
+
+        embeddings: List[Optional[List[float]]] = [None] * len(image_paths)
+        url_keys = [f"url:{path}" if is_url(path) else None for path in image_paths]
+        for i, (path, url_key) in enumerate(zip(image_paths, url_keys)):
+            if url_key:
+                embeddings[i] = await asyncio.to_thread(self._lookup_url, url_key, path)
+
+        pending = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        contents = await asyncio.gather(*(self._aload_image_bytes(image_paths[i]) for i in pending))
+        content_keys = [f"sha256:{hashlib.sha256(data).hexdigest()}" for data in contents]
+
+        missing = {}
+        for i, data, content_key in zip(pending, contents, content_keys):
+            embeddings[i] = await self.cache.aget(content_key) if self.cache is not None else None
+            if embeddings[i] is None and content_key not in missing:
+                missing[content_key] = base64.b64encode(data).decode()
+        if missing:
+            results = await self._arequest_embeddings(list(missing.values()))
+            computed = dict(zip(missing, (row['image_features'] for row in results)))
+        else:
+            computed = {}
+
+        for i, content_key in zip(pending, content_keys):
+            if embeddings[i] is None:
+                embeddings[i] = computed[content_key]
+            self._remember(content_key, url_keys[i], embeddings[i])
+        return embeddings
+
+    async def _embed_batch(self, images: List[str]) -> List[List[float]]:
+        """Один запрос к endpoint на пачку изображений, собранную батчером"""
+        results = await self._arequest_embeddings(images)
+        return [row['image_features'] for row in results]
 
 if __name__ == "__main__":
     embedder = ClipImageEmbedder()
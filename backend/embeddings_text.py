@@ -1,14 +1,40 @@
 import requests
 import logging
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Optional
 from dotenv import load_dotenv
 import os
+from embedding_cache import EmbeddingCache
+from http_client import http_client
+from embedding_batcher import default_batcher
+from clip_local import get_local_backend
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def normalize_query(text: str) -> str:
+    """CLIP токенизатор и так приводит текст к нижнему регистру и схлопывает пробелы"""
+    return " ".join(text.lower().split())
+
+
+def default_text_cache() -> Optional[EmbeddingCache]:
+    maxsize = int(os.getenv("TEXT_EMBEDDING_CACHE_SIZE", "4096"))
+    if maxsize <= 0:
+        return None
+    return EmbeddingCache(
+        maxsize=maxsize,
+        ttl=float(os.getenv("TEXT_EMBEDDING_CACHE_TTL", "86400")),
+        path=os.getenv("TEXT_EMBEDDING_CACHE_PATH"),
+        disk_maxsize=int(os.getenv("TEXT_EMBEDDING_CACHE_DISK_SIZE", "100000")),
+        table="text_embeddings"
+    )
+
+
 class ClipTextEmbedder:
-    def __init__(self):
+    def __init__(self, cache: Optional[EmbeddingCache] = None):
+        self.cache = cache if cache is not None else default_text_cache()
+        self.batcher = default_batcher(self._embed_batch)
+        self.local = get_local_backend()
         self.endpoint = os.getenv("CLIP_ENDPOINT")
         self.api_key = os.getenv("CLIP_EMBADING_API")
         self.deployment = os.getenv("CLIP_DEPLOYMENT_NAME")
@@ -18,21 +44,25 @@ class ClipTextEmbedder:
             "azureml-model-deployment": self.deployment
         }
 
+    @staticmethod
+    def _payload(texts: List[str]) -> Dict:
+        return {
+            "input_data": {
+                "columns": ["image", "text"],
+                "index": list(range(len(texts))),
+                "data": [["", text] for text in texts]
+            }
+        }
+
     def get_text_embeddings(self, texts: List[str]) -> List[Dict]:
         """Получает эмбеддинги для списка текстов"""
+        if self.local is not None:
+            return [{"text_features": emb} for emb in self.local.embed_texts(texts)]
         try:
-            payload = {
-                "input_data": {
-                    "columns": ["image", "text"],
-                    "index": list(range(len(texts))),
-                    "data": [["", text] for text in texts]
-                }
-            }
-
             response = requests.post(
                 self.endpoint,
                 headers=self.headers,
-                json=payload,
+                json=self._payload(texts),
                 timeout=15
             )
 
@@ -44,9 +74,78 @@ class ClipTextEmbedder:
             raise
 
     def get_text_embedding(self, text: str) -> List[float]:
-        """Получает эмбеддинг для одного текста"""
-        results = self.get_text_embeddings([text])
-        return results[0]['text_features']
+        """Получает эмбеддинг для одного текста (с кэшем по нормализованному запросу)"""
+        key = normalize_query(text)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        results = self.get_text_embeddings([key])
+        embedding = results[0]['text_features']
+        if self.cache is not None:
+            self.cache.set(key, embedding)
+        return embedding
+
+    async def aget_text_embeddings(self, texts: List[str]) -> List[Dict]:
+        """Асинхронная версия get_text_embeddings через общий пул соединений"""
+        if self.local is not None:
+            return [{"text_features": emb} for emb in await self.local.aembed_texts(texts)]
+        try:
+            response = await http_client.post(
+                "clip",
+                self.endpoint,
+                headers=self.headers,
+                json=self._payload(texts)
+            )
+
+            response.raise_for_status()
+            return response.json()
+
+        except Exception as e:
+            logger.error(f"API Error: {str(e)}")
+            raise
+
+    async def aget_text_embedding(self, text: str) -> List[float]:
+        """Асинхронная версия get_text_embedding"""
+        key = normalize_query(text)
+        if self.cache is not None:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached
+
+        if self.batcher is not None:
+            embedding = await self.batcher.submit(key)
+        else:
+            results = await self.aget_text_embeddings([key])
+            embedding = results[0]['text_features']
+        if self.cache is not None:
+            self.cache.set(key, embedding)
+        return embedding
+
+    async def aget_text_embedding_batch(self, texts: List[str]) -> List[List[float]]:
+        """Эмбеддинги для списка текстов: кэш, затем один запрос на все промахи"""
+        keys = [normalize_query(text) for text in texts]
+        found = {}
+        if self.cache is not None:
+            for key in keys:
+                cached = await self.cache.aget(key)
+                if cached is not None:
+                    found[key] = cached
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            results = await self.aget_text_embeddings(missing)
+            for key, row in zip(missing, results):
+                found[key] = row['text_features']
+                if self.cache is not None:
+                    self.cache.set(key, row['text_features'])
+        return [found[key] for key in keys]
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Один запрос к endpoint на пачку текстов, собранную батчером"""
+        results = await self.aget_text_embeddings(texts)
+        return [row['text_features'] for row in results]
 
     def batch_embed(self, items: List[Union[str, bytes]]) -> List[List[float]]:
         """Универсальный метод для текста и изображений"""
@@ -0,0 +1,169 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+from typing import Dict, Iterable, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# endpoint name -> (max concurrent requests, timeout in seconds)
+ENDPOINT_DEFAULTS: Dict[str, Tuple[int, float]] = {
+    "clip": (32, 30.0),
+    "image_fetch": (16, 15.0),
+    "dalle": (4, 120.0),
+    "image_edit": (4, 180.0),
+}
+
+# Limits for images downloaded from user-supplied URLs
+IMAGE_FETCH_MAX_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_FETCH_MAX_REDIRECTS = int(os.getenv("IMAGE_FETCH_MAX_REDIRECTS", "5"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("HTTP_IMAGE_FETCH_TIMEOUT", ENDPOINT_DEFAULTS["image_fetch"][1]))
+
+
+class UnsafeURLError(ValueError):
+    """The URL points at a host the server must not fetch from (private, loopback, ...)."""
+
+
+def _check_addresses(host: str, addresses: Iterable[str]):
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if not ip.is_global:
+            raise UnsafeURLError(f"{host} resolves to the non-public address {ip}")
+
+
+def _split_url(url: str) -> Tuple[str, int]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeURLError(f"Only http(s) URLs can be fetched: {url}")
+    return parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+def check_public_url(url: str):
+    """Raise ``UnsafeURLError`` unless every address ``url``'s host resolves to is public."""
+    host, port = _split_url(url)
+    _check_addresses(host, (info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)))
+
+
+async def acheck_public_url(url: str):
+    host, port = _split_url(url)
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    _check_addresses(host, (info[4][0] for info in infos))
+
+
+def _check_image_response(headers, max_bytes: int):
+    content_type = headers.get("content-type", "")
+    if not content_type.lower().startswith("image/"):
+        raise ValueError(f"Expected an image, got content type {content_type or 'none'!r}")
+    declared = headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise ValueError(f"Response of {declared} bytes exceeds the {max_bytes} byte limit")
+
+
+def fetch_image(url: str, max_bytes: int = IMAGE_FETCH_MAX_BYTES) -> bytes:
+    """Blocking counterpart of ``AsyncHTTPClient.fetch_image``."""
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        check_public_url(url)
+        with requests.get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True, allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["location"])
+                continue
+            response.raise_for_status()
+            _check_image_response(response.headers, max_bytes)
+            body = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                body += chunk
+                if len(body) > max_bytes:
+                    raise ValueError(f"Response exceeds the {max_bytes} byte limit")
+            return bytes(body)
+    raise ValueError(f"Too many redirects fetching {url}")
+
+
+class AsyncHTTPClient:
+    """One pooled ``httpx.AsyncClient`` shared by every outbound model call.
+
+    Connections are kept alive and reused (HTTP/2 where the server offers it).
+    Each named endpoint gets its own concurrency limit and timeout, so a burst
+    of slow image edits cannot starve embedding calls of connections. Limits
+    can be overridden with ``HTTP_<NAME>_CONCURRENCY`` / ``HTTP_<NAME>_TIMEOUT``.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._timeouts: Dict[str, float] = {}
+        for name, (concurrency, timeout) in ENDPOINT_DEFAULTS.items():
+            self.configure_endpoint(
+                name,
+                int(os.getenv(f"HTTP_{name.upper()}_CONCURRENCY", concurrency)),
+                float(os.getenv(f"HTTP_{name.upper()}_TIMEOUT", timeout))
+            )
+
+    def configure_endpoint(self, name: str, max_concurrency: int, timeout: float):
+        self._semaphores[name] = asyncio.Semaphore(max_concurrency)
+        self._timeouts[name] = timeout
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=os.getenv("HTTP2_ENABLED", "true").lower() == "true",
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+                    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+                    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+                ),
+            )
+        return self._client
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        kwargs.setdefault("timeout", self._timeouts[endpoint])
+        async with self._semaphores[endpoint]:
+            return await self.client.request(method, url, **kwargs)
+
+    async def get(self, endpoint: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(endpoint, "GET", url, **kwargs)
+
+    async def post(self, endpoint: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(endpoint, "POST", url, **kwargs)
+
+    async def fetch_image(self, url: str, max_bytes: int = IMAGE_FETCH_MAX_BYTES) -> bytes:
+        """Download an image from a user-supplied URL.
+
+        Every hop of a redirect chain must resolve to public addresses only, the
+        response must be ``image/*`` and the download is aborted as soon as it
+        exceeds ``max_bytes``.
+        """
+        for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+            await acheck_public_url(url)
+            async with self._semaphores["image_fetch"]:
+                async with self.client.stream(
+                    "GET", url, timeout=self._timeouts["image_fetch"], follow_redirects=False
+                ) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    response.raise_for_status()
+                    _check_image_response(response.headers, max_bytes)
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body += chunk
+                        if len(body) > max_bytes:
+                            raise ValueError(f"Response exceeds the {max_bytes} byte limit")
+                    return bytes(body)
+        raise ValueError(f"Too many redirects fetching {url}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+http_client = AsyncHTTPClient()
@@ -4,7 +4,6 @@ from openai import AzureOpenAI
 import logging
 from dotenv import load_dotenv
 import numpy as np
-from sklearn.decomposition import PCA
 
 load_dotenv()
 
@@ -17,7 +16,6 @@ class TextEmbedder:
             api_key=os.getenv("TEXT_EMBADING_API")
         )
         self.deployment = os.getenv("AZURE_DEPLOYMENT_NAME_TEXT")
-        self.pca = None  # Инициализация PCA трансформера
 
     def _validate_env(self):
         required_vars = [
@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from "react"
 import { ImageCard } from "@/components/image-card"
-import { getPublicImages, type Image as ImageType } from "@/lib/api"
+import { getPublicImagesPage, type Image as ImageType } from "@/lib/api"
 import { Input } from "@/components/ui/input"
 import { Button } from "@/components/ui/button"
 import { Loader2, Search } from "lucide-react"
@@ -14,16 +14,17 @@ export default function AiGalleryPage() {
   const [filteredImages, setFilteredImages] = useState<ImageType[]>([])
   const [searchQuery, setSearchQuery] = useState("")
   const [isLoading, setIsLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const { toast } = useToast()
 
   useEffect(() => {
     const fetchImages = async () => {
       try {
         setIsLoading(true)
-        const data = await getPublicImages()
-        const aiOnly = data.filter(img => img.is_ai_generated)
-        setImages(aiOnly)
-        setFilteredImages(aiOnly)
+        const page = await getPublicImagesPage(null, true)
+        setImages(page.items)
+        setFilteredImages(page.items)
+        setNextCursor(page.next_cursor)
       } catch (error) {
         console.error("Error fetching AI images:", error)
         toast({
@@ -51,6 +52,17 @@ export default function AiGalleryPage() {
     setFilteredImages(filtered)
   }
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getPublicImagesPage(nextCursor, true)
+      setImages((prev) => [...prev, ...page.items])
+      setFilteredImages((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching AI images:", error)
+    }
+  }
+
   const handleLikeChange = (imageId: number, liked: boolean) => {
     setImages(prev =>
       prev.map(img =>
@@ -90,11 +102,20 @@ export default function AiGalleryPage() {
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       ) : filteredImages.length > 0 ? (
-        <div className="image-grid px-4">
-          {filteredImages.map(image => (
-            <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
-          ))}
-        </div>
+        <>
+          <div className="image-grid px-4">
+            {filteredImages.map(image => (
+              <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
+            ))}
+          </div>
+          {nextCursor && (
+            <div className="flex justify-center mt-8">
+              <Button variant="outline" onClick={loadMoreImages}>
+                Load more
+              </Button>
+            </div>
+          )}
+        </>
       ) : (
         <div className="text-center py-20">
           <p className="text-xl text-gray-500 dark:text-gray-400">No AI images found</p>
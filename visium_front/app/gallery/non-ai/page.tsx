@@ -2,7 +2,8 @@
 
 import { useState, useEffect } from "react"
 import { ImageCard } from "@/components/image-card"
-import { getPublicImages, type Image as ImageType } from "@/lib/api"
+import { getPublicImagesPage, type Image as ImageType } from "@/lib/api"
+import { Button } from "@/components/ui/button"
 import { Loader2 } from "lucide-react"
 import { useToast } from "@/components/ui/use-toast"
 import Link from "next/link"
@@ -11,16 +12,17 @@ export default function NonAiGalleryPage() {
   const [images, setImages] = useState<ImageType[]>([])
   const [filteredImages, setFilteredImages] = useState<ImageType[]>([])
   const [isLoading, setIsLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const { toast } = useToast()
 
   useEffect(() => {
     const fetchImages = async () => {
       try {
         setIsLoading(true)
-        const data = await getPublicImages()
-        const nonAi = data.filter(img => !img.is_ai_generated)
-        setImages(nonAi)
-        setFilteredImages(nonAi)
+        const page = await getPublicImagesPage(null, false)
+        setImages(page.items)
+        setFilteredImages(page.items)
+        setNextCursor(page.next_cursor)
       } catch (error) {
         console.error("Error fetching non-AI images:", error)
         toast({
@@ -36,6 +38,17 @@ export default function NonAiGalleryPage() {
     fetchImages()
   }, [toast])
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getPublicImagesPage(nextCursor, false)
+      setImages((prev) => [...prev, ...page.items])
+      setFilteredImages((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching non-AI images:", error)
+    }
+  }
+
   const handleLikeChange = (imageId: number, liked: boolean) => {
     setImages(prev =>
       prev.map(img =>
@@ -72,11 +85,20 @@ export default function NonAiGalleryPage() {
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       ) : filteredImages.length > 0 ? (
-        <div className="image-grid px-4">
-          {filteredImages.map(image => (
-            <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
-          ))}
-        </div>
+        <>
+          <div className="image-grid px-4">
+            {filteredImages.map(image => (
+              <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
+            ))}
+          </div>
+          {nextCursor && (
+            <div className="flex justify-center mt-8">
+              <Button variant="outline" onClick={loadMoreImages}>
+                Load more
+              </Button>
+            </div>
+          )}
+        </>
       ) : (
         <div className="text-center py-20">
           <p className="text-xl text-gray-500 dark:text-gray-400">No images found</p>
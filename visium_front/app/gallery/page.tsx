@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from "react"
 import { ImageCard } from "@/components/image-card"
-import { getPublicImages, type Image as ImageType } from "@/lib/api"
+import { getPublicImagesPage, withLikedState, type Image as ImageType } from "@/lib/api"
 import { Input } from "@/components/ui/input"
 import { Button } from "@/components/ui/button"
 import { Loader2, Search } from "lucide-react"
@@ -14,15 +14,18 @@ export default function GalleryPage() {
   const [filteredImages, setFilteredImages] = useState<ImageType[]>([])
   const [searchQuery, setSearchQuery] = useState("")
   const [isLoading, setIsLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const { toast } = useToast()
 
   useEffect(() => {
     const fetchImages = async () => {
       try {
         setIsLoading(true)
-        const data = await getPublicImages()
+        const page = await getPublicImagesPage()
+        const data = await withLikedState(page.items)
         setImages(data)
         setFilteredImages(data)
+        setNextCursor(page.next_cursor)
       } catch (error) {
         console.error("Error fetching images:", error)
         toast({
@@ -48,6 +51,18 @@ export default function GalleryPage() {
     setFilteredImages(filtered)
   }
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getPublicImagesPage(nextCursor)
+      const more = await withLikedState(page.items)
+      setImages((prev) => [...prev, ...more])
+      setFilteredImages((prev) => [...prev, ...more])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching images:", error)
+    }
+  }
+
   const handleLikeChange = (imageId: number, liked: boolean) => {
     setImages((prevImages) =>
       prevImages.map((img) =>
@@ -86,11 +101,20 @@ export default function GalleryPage() {
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       ) : filteredImages.length > 0 ? (
-        <div className="image-grid px-4">
-          {filteredImages.map((image) => (
-            <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
-          ))}
-        </div>
+        <>
+          <div className="image-grid px-4">
+            {filteredImages.map((image) => (
+              <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
+            ))}
+          </div>
+          {nextCursor && (
+            <div className="flex justify-center mt-8">
+              <Button variant="outline" onClick={loadMoreImages}>
+                Load more
+              </Button>
+            </div>
+          )}
+        </>
       ) : (
         <div className="text-center py-20">
           <p className="text-xl text-gray-500 dark:text-gray-400">No images found</p>
@@ -9,7 +9,7 @@ import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle }
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
 import { useToast } from "@/components/ui/use-toast"
 import { useAuth } from "@/hooks/use-auth"
-import { generateAiImage, uploadImage, getAuthToken, BASE_URL } from "@/lib/api"
+import { generateAiImage, uploadImage, getAuthToken, editImage } from "@/lib/api"
 import { Loader2, Sparkles, Save } from "lucide-react"
 import Image from "next/image"
 
@@ -95,13 +95,7 @@ export default function GeneratePage() {
     if (!localFile || !prompt) return
     setIsEditing(true)
     try {
-      const formData = new FormData()
-      formData.append('file', localFile)
-      formData.append('prompt', prompt)
-      const token = getAuthToken()
-      const res = await fetch(`${BASE_URL}/edit-image/`, { method: 'POST', headers: token ? { Authorization: `Bearer ${token}` } : undefined, body: formData })
-      if (!res.ok) throw new Error('Edit request failed')
-      const blob = await res.blob()
+      const blob = await editImage(localFile, prompt)
       const url = URL.createObjectURL(blob)
       setImageUrl(url)
       const file = new File([blob], 'edited.png', { type: 'image/png' })
@@ -19,7 +19,7 @@ import Image from "next/image"
 import { CommentSection } from "@/components/comment-section"
 import Link from "next/link"
 import { useToast } from "@/components/ui/use-toast"
-import { getAuthToken, BASE_URL, uploadImage } from "@/lib/api"
+import { getAuthToken, uploadImage, editImage } from "@/lib/api"
 import { Label } from "@/components/ui/label"
 import { Select, SelectTrigger, SelectValue, SelectContent, SelectItem } from "@/components/ui/select"
 
@@ -117,13 +117,7 @@ export default function ImageDetailPage() {
       const resp = await fetch(newImageUrl)
       const blob = await resp.blob()
       const file = new File([blob], 'toedit.png', { type: blob.type })
-      const formData = new FormData()
-      formData.append('file', file)
-      formData.append('prompt', actionPrompt)
-      const token = getAuthToken()
-      const res = await fetch(`${BASE_URL}/edit-image/`, { method: 'POST', headers: token ? { Authorization: `Bearer ${token}` } : undefined, body: formData })
-      if (!res.ok) throw new Error('Edit request failed')
-      const editedBlob = await res.blob()
+      const editedBlob = await editImage(file, actionPrompt)
       const url = URL.createObjectURL(editedBlob)
       setNewImageUrl(url)
       const editedFile = new File([editedBlob], 'edited.png', { type: editedBlob.type })
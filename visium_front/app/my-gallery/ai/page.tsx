@@ -2,7 +2,8 @@
 
 import { useState, useEffect } from "react"
 import { ImageCard } from "@/components/image-card"
-import { getUserImages, likeImage, unlikeImage, type Image as ImageType } from "@/lib/api"
+import { getUserImagesPage, likeImage, unlikeImage, type Image as ImageType } from "@/lib/api"
+import { Button } from "@/components/ui/button"
 import { Loader2 } from "lucide-react"
 import { useAuth } from "@/hooks/use-auth"
 import { useRouter } from "next/navigation"
@@ -11,6 +12,7 @@ import Link from "next/link"
 export default function MyAiGalleryPage() {
   const [images, setImages] = useState<ImageType[]>([])
   const [isImagesLoading, setIsImagesLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const { user, isLoading: authLoading } = useAuth()
   const router = useRouter()
 
@@ -25,6 +27,16 @@ export default function MyAiGalleryPage() {
     )
   }
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getUserImagesPage(nextCursor, true)
+      setImages((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching AI images:", error)
+    }
+  }
+
   useEffect(() => {
     if (!authLoading && !user) {
       router.push("/auth/login")
@@ -33,9 +45,9 @@ export default function MyAiGalleryPage() {
     if (user) {
       const fetchImages = async () => {
         try {
-          const data = await getUserImages()
-          const aiOnly = data.filter(img => img.is_ai_generated)
-          setImages(aiOnly)
+          const page = await getUserImagesPage(null, true)
+          setImages(page.items)
+          setNextCursor(page.next_cursor)
         } catch (error) {
           console.error("Error fetching AI images:", error)
         } finally {
@@ -76,11 +88,20 @@ export default function MyAiGalleryPage() {
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       ) : images.length > 0 ? (
-        <div className="image-grid px-4">
-          {images.map(img => (
-            <ImageCard key={img.id} image={img} onLikeChange={handleLikeChange} />
-          ))}
-        </div>
+        <>
+          <div className="image-grid px-4">
+            {images.map(img => (
+              <ImageCard key={img.id} image={img} onLikeChange={handleLikeChange} />
+            ))}
+          </div>
+          {nextCursor && (
+            <div className="flex justify-center mt-8">
+              <Button variant="outline" onClick={loadMoreImages}>
+                Load more
+              </Button>
+            </div>
+          )}
+        </>
       ) : (
         <div className="text-center py-20">
           <p className="text-xl text-gray-500 dark:text-gray-400">No AI generated images found</p>
@@ -2,7 +2,8 @@
 
 import { useState, useEffect } from "react"
 import { ImageCard } from "@/components/image-card"
-import { getUserImages, likeImage, unlikeImage, type Image as ImageType } from "@/lib/api"
+import { getUserImagesPage, likeImage, unlikeImage, type Image as ImageType } from "@/lib/api"
+import { Button } from "@/components/ui/button"
 import { Loader2 } from "lucide-react"
 import { useAuth } from "@/hooks/use-auth"
 import { useRouter } from "next/navigation"
@@ -11,6 +12,7 @@ import Link from "next/link"
 export default function MyNonAiGalleryPage() {
   const [images, setImages] = useState<ImageType[]>([])
   const [isImagesLoading, setIsImagesLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const { user, isLoading: authLoading } = useAuth()
   const router = useRouter()
 
@@ -31,6 +33,16 @@ export default function MyNonAiGalleryPage() {
     }
   }
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getUserImagesPage(nextCursor, false)
+      setImages((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching non-AI images:", error)
+    }
+  }
+
   useEffect(() => {
     if (!authLoading && !user) {
       router.push("/auth/login")
@@ -38,9 +50,9 @@ export default function MyNonAiGalleryPage() {
     if (user) {
       const fetchImages = async () => {
         try {
-          const data = await getUserImages()
-          const nonAi = data.filter(img => !img.is_ai_generated)
-          setImages(nonAi)
+          const page = await getUserImagesPage(null, false)
+          setImages(page.items)
+          setNextCursor(page.next_cursor)
         } catch (error) {
           console.error("Error fetching non-AI images:", error)
         } finally {
@@ -81,11 +93,20 @@ export default function MyNonAiGalleryPage() {
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       ) : images.length > 0 ? (
-        <div className="image-grid px-4">
-          {images.map(img => (
-            <ImageCard key={img.id} image={img} onLikeChange={handleLikeChange} />
-          ))}
-        </div>
+        <>
+          <div className="image-grid px-4">
+            {images.map(img => (
+              <ImageCard key={img.id} image={img} onLikeChange={handleLikeChange} />
+            ))}
+          </div>
+          {nextCursor && (
+            <div className="flex justify-center mt-8">
+              <Button variant="outline" onClick={loadMoreImages}>
+                Load more
+              </Button>
+            </div>
+          )}
+        </>
       ) : (
         <div className="text-center py-20">
           <p className="text-xl text-gray-500 dark:text-gray-400">No uploaded images found</p>
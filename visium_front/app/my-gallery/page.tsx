@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from "react"
 import { ImageCard } from "@/components/image-card"
-import { getUserImages, likeImage, unlikeImage, type Image as ImageType } from "@/lib/api"
+import { getUserImagesPage, likeImage, unlikeImage, type Image as ImageType } from "@/lib/api"
 import { Button } from "@/components/ui/button"
 import { Loader2, Plus } from "lucide-react"
 import { useAuth } from "@/hooks/use-auth"
@@ -12,6 +12,7 @@ import Link from "next/link"
 export default function MyGalleryPage() {
   const [images, setImages] = useState<ImageType[]>([])
   const [isImagesLoading, setIsImagesLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const { user, isLoading: authLoading } = useAuth()
   const router = useRouter()
 
@@ -27,8 +28,9 @@ export default function MyGalleryPage() {
     if (user) {
       const fetchImages = async () => {
         try {
-          const data = await getUserImages()
-          setImages(data)
+          const page = await getUserImagesPage()
+          setImages(page.items)
+          setNextCursor(page.next_cursor)
         } catch (error) {
           console.error("Error fetching images:", error)
         } finally {
@@ -39,6 +41,16 @@ export default function MyGalleryPage() {
     }
   }, [user])
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getUserImagesPage(nextCursor)
+      setImages((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching images:", error)
+    }
+  }
+
   // Handle like/unlike actions and update UI
   const handleLikeChange = async (id: number, liked: boolean) => {
     try {
@@ -108,11 +120,20 @@ export default function MyGalleryPage() {
         </div>
       ) : (
         images.length > 0 ? (
-          <div className="image-grid px-4">
-            {images.map(image => (
-              <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
-            ))}
-          </div>
+          <>
+            <div className="image-grid px-4">
+              {images.map(image => (
+                <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
+              ))}
+            </div>
+            {nextCursor && (
+              <div className="flex justify-center mt-8">
+                <Button variant="outline" onClick={loadMoreImages}>
+                  Load more
+                </Button>
+              </div>
+            )}
+          </>
         ) : (
           <div className="text-center py-20">
             <p className="text-xl text-gray-500 dark:text-gray-400">You haven't added any images yet</p>
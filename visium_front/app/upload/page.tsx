@@ -8,7 +8,7 @@ import { Textarea } from "@/components/ui/textarea"
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card"
 import { useToast } from "@/components/ui/use-toast"
 import { useAuth } from "@/hooks/use-auth"
-import { uploadImage, BASE_URL, getAuthToken } from "@/lib/api"
+import { uploadImage, getAuthToken, editImage } from "@/lib/api"
 import { Loader2, Upload, ImagePlus } from "lucide-react"
 import Image from "next/image"
 import { UploadButton, UploadDropzone } from "@/utils/uploadthing"
@@ -57,14 +57,8 @@ export default function UploadPage() {
     if (!localFile || !prompt) return
     setIsEditing(true)
     try {
-      const formData = new FormData()
-      formData.append('file', localFile)
-      formData.append('prompt', prompt)
-      // attach Bearer token
-      const token = getAuthToken()
-      const res = await fetch(`${BASE_URL}/edit-image/`, { method: 'POST', headers: token ? { Authorization: `Bearer ${token}` } : undefined, body: formData })
-      if (!res.ok) throw new Error('Edit request failed')
-      const blob = await res.blob()
+      // queued on the backend; resolves once the edited PNG is ready
+      const blob = await editImage(localFile, prompt)
       const url = URL.createObjectURL(blob)
       setImageUrl(url)
       // create File for further edits or saving
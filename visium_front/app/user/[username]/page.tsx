@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from "react"
 import { useParams, useRouter } from "next/navigation"
-import { getUserImagesByUsername, type Image as ImageType } from "@/lib/api"
+import { getUserImagesByUsernamePage, type Image as ImageType } from "@/lib/api"
 import { Button } from "@/components/ui/button"
 import { Loader2, ArrowLeft, User } from "lucide-react"
 import { ImageCard } from "@/components/image-card"
@@ -12,6 +12,7 @@ export default function UserGalleryPage() {
   const router = useRouter()
   const [images, setImages] = useState<ImageType[]>([])
   const [isLoading, setIsLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const username = params.username as string
 
   useEffect(() => {
@@ -21,8 +22,9 @@ export default function UserGalleryPage() {
           throw new Error("Username is required")
         }
 
-        const data = await getUserImagesByUsername(username)
-        setImages(data)
+        const page = await getUserImagesByUsernamePage(username)
+        setImages(page.items)
+        setNextCursor(page.next_cursor)
       } catch (error) {
         console.error("Error fetching user images:", error)
       } finally {
@@ -33,6 +35,16 @@ export default function UserGalleryPage() {
     fetchUserImages()
   }, [username])
 
+  const loadMoreImages = async () => {
+    try {
+      const page = await getUserImagesByUsernamePage(username, nextCursor)
+      setImages((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching user images:", error)
+    }
+  }
+
   const handleLikeChange = (imageId: number, liked: boolean) => {
     setImages((prevImages) =>
       prevImages.map((img) =>
@@ -64,11 +76,20 @@ export default function UserGalleryPage() {
           <Loader2 className="h-8 w-8 animate-spin text-primary" />
         </div>
       ) : images.length > 0 ? (
-        <div className="image-grid px-4">
-          {images.map((image) => (
-            <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
-          ))}
-        </div>
+        <>
+          <div className="image-grid px-4">
+            {images.map((image) => (
+              <ImageCard key={image.id} image={image} onLikeChange={handleLikeChange} />
+            ))}
+          </div>
+          {nextCursor && (
+            <div className="flex justify-center mt-8">
+              <Button variant="outline" onClick={loadMoreImages}>
+                Load more
+              </Button>
+            </div>
+          )}
+        </>
       ) : (
         <div className="text-center py-20">
           <p className="text-xl text-gray-500 dark:text-gray-400 mb-4">This user hasn't uploaded any images yet</p>
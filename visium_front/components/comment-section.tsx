@@ -3,7 +3,7 @@
 import { useState, useEffect } from "react"
 import { Button } from "@/components/ui/button"
 import { Textarea } from "@/components/ui/textarea"
-import { type Comment, addComment, getImageComments } from "@/lib/api"
+import { type Comment, addComment, getCommentTree } from "@/lib/api"
 import { useAuth } from "@/hooks/use-auth"
 import { useToast } from "@/components/ui/use-toast"
 import { Loader2, Reply } from "lucide-react"
@@ -14,6 +14,7 @@ interface CommentSectionProps {
 
 export function CommentSection({ imageId }: CommentSectionProps) {
   const [comments, setComments] = useState<Comment[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [newComment, setNewComment] = useState("")
   const [replyTo, setReplyTo] = useState<number | null>(null)
   const [isLoading, setIsLoading] = useState(false)
@@ -25,17 +26,9 @@ export function CommentSection({ imageId }: CommentSectionProps) {
     const fetchComments = async () => {
       setIsLoading(true)
       try {
-        const fetchedComments = await getImageComments(imageId)
-        // Organize comments into a tree structure
-        const topLevelComments = fetchedComments.filter((c) => !c.parent_comment_id)
-        const commentReplies = fetchedComments.filter((c) => c.parent_comment_id)
-
-        // Add replies to their parent comments
-        topLevelComments.forEach((comment) => {
-          comment.replies = commentReplies.filter((reply) => reply.parent_comment_id === comment.id)
-        })
-
-        setComments(topLevelComments)
+        const page = await getCommentTree(imageId)
+        setComments(page.items)
+        setNextCursor(page.next_cursor)
       } catch (error) {
         console.error("Error fetching comments:", error)
       } finally {
@@ -63,15 +56,9 @@ export function CommentSection({ imageId }: CommentSectionProps) {
       await addComment(imageId, newComment, replyTo)
 
       // Refresh comments
-      const fetchedComments = await getImageComments(imageId)
-      const topLevelComments = fetchedComments.filter((c) => !c.parent_comment_id)
-      const commentReplies = fetchedComments.filter((c) => c.parent_comment_id)
-
-      topLevelComments.forEach((comment) => {
-        comment.replies = commentReplies.filter((reply) => reply.parent_comment_id === comment.id)
-      })
-
-      setComments(topLevelComments)
+      const page = await getCommentTree(imageId)
+      setComments(page.items)
+      setNextCursor(page.next_cursor)
       setNewComment("")
       setReplyTo(null)
     } catch (error) {
@@ -81,6 +68,31 @@ export function CommentSection({ imageId }: CommentSectionProps) {
     }
   }
 
+  const loadMoreComments = async () => {
+    try {
+      const page = await getCommentTree(imageId, { cursor: nextCursor })
+      setComments((prev) => [...prev, ...page.items])
+      setNextCursor(page.next_cursor)
+    } catch (error) {
+      console.error("Error fetching comments:", error)
+    }
+  }
+
+  const loadMoreReplies = async (comment: Comment) => {
+    try {
+      const page = await getCommentTree(imageId, { parentId: comment.id, cursor: comment.replies_cursor, depth: 1 })
+      setComments((prev) =>
+        prev.map((c) =>
+          c.id === comment.id
+            ? { ...c, replies: [...(c.replies || []), ...page.items], replies_cursor: page.next_cursor }
+            : c,
+        ),
+      )
+    } catch (error) {
+      console.error("Error fetching replies:", error)
+    }
+  }
+
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleDateString()
   }
@@ -128,6 +140,11 @@ export function CommentSection({ imageId }: CommentSectionProps) {
                   ))}
                 </div>
               )}
+              {comment.replies_cursor && (
+                <Button variant="ghost" size="sm" className="text-xs ml-4 h-6 px-2" onClick={() => loadMoreReplies(comment)}>
+                  Show more replies
+                </Button>
+              )}
 
               {/* Reply form */}
               {replyTo === comment.id && (
@@ -152,6 +169,11 @@ export function CommentSection({ imageId }: CommentSectionProps) {
               )}
             </div>
           ))}
+          {nextCursor && (
+            <Button variant="outline" size="sm" onClick={loadMoreComments}>
+              Load more comments
+            </Button>
+          )}
         </div>
       ) : (
         <p className="text-sm text-gray-500 dark:text-gray-400">No comments yet. Be the first to comment!</p>
@@ -79,6 +79,8 @@ export interface Image {
   likes_count: number
   user_has_liked?: boolean
   username?: string
+  // only on the owner's own listing: pending | processing | ready | failed
+  ingest_status?: string
 }
 
 export interface Comment {
@@ -90,13 +92,41 @@ export interface Comment {
   }
   parent_comment_id: number | null
   replies?: Comment[]
+  // set when more replies exist; pass it with the comment id to getCommentTree
+  replies_cursor?: string | null
 }
 
+// A page of a cursor-paginated listing; pass next_cursor back to get the following page
+export interface Page<T> {
+  items: T[]
+  next_cursor: string | null
+}
+
+const withCursor = (endpoint: string, cursor?: string | null) =>
+  cursor ? `${endpoint}${endpoint.includes("?") ? "&" : "?"}cursor=${encodeURIComponent(cursor)}` : endpoint
+
+// Restrict a listing to AI generated (true) or other (false) images; undefined lists both
+const withAiFilter = (endpoint: string, isAiGenerated?: boolean) =>
+  isAiGenerated === undefined ? endpoint : `${endpoint}?is_ai_generated=${isAiGenerated}`
+
 // Get all public images
-export const getPublicImages = () => apiRequest<Image[]>("/get-images/")
+export const getPublicImagesPage = (cursor?: string | null, isAiGenerated?: boolean) =>
+  apiRequest<Page<Image>>(withCursor(withAiFilter("/get-images/", isAiGenerated), cursor))
 
 // Get user's uploaded images
-export const getUserImages = () => apiRequest<Image[]>("/get-my-images/")
+export const getUserImagesPage = (cursor?: string | null, isAiGenerated?: boolean) =>
+  apiRequest<Page<Image>>(withCursor(withAiFilter("/get-my-images/", isAiGenerated), cursor))
+
+// The signed-in user's feed: followed users' uploads and images like the ones they liked
+export interface FeedImage extends Image {
+  reason: "following" | "recommended"
+}
+
+export const getFeedPage = (cursor?: string | null) => apiRequest<Page<FeedImage>>(withCursor("/feed/", cursor))
+
+export const followUser = (userId: number) => apiRequest("/follow/", "POST", { user_id: userId })
+
+export const unfollowUser = (userId: number) => apiRequest("/follow/", "DELETE", { user_id: userId })
 
 // Upload an image
 export const uploadImage = (imageUrl: string, description: string, isAiGenerated = false) =>
@@ -115,16 +145,72 @@ export interface GenerateImageResponse {
 export const generateAiImage = (params: GenerateImageParams) =>
   apiRequest<GenerateImageResponse>("/generate-image/", "POST", params)
 
+// Edit an image with AI. The backend queues the edit and answers 202 with a job id,
+// so poll the job until it finishes (giving up after maxWaitMs) and then download the edited PNG.
+export async function editImage(file: File, prompt: string, pollIntervalMs = 2000, maxWaitMs = 5 * 60 * 1000): Promise<Blob> {
+  const formData = new FormData()
+  formData.append('file', file)
+  formData.append('prompt', prompt)
+  const token = getAuthToken()
+  const headers = token ? { Authorization: `Bearer ${token}` } : undefined
+
+  const res = await fetch(`${BASE_URL}/edit-image/`, { method: 'POST', headers, body: formData })
+  if (!res.ok) throw new Error('Edit request failed')
+  const { job_id } = (await res.json()) as { job_id: string }
+
+  const deadline = Date.now() + maxWaitMs
+  while (true) {
+    if (Date.now() > deadline) throw new Error('Edit timed out')
+    await new Promise((resolve) => setTimeout(resolve, pollIntervalMs))
+    const statusRes = await fetch(`${BASE_URL}/edit-image/${job_id}`, { headers })
+    if (!statusRes.ok) throw new Error('Edit status request failed')
+    const { status, error } = (await statusRes.json()) as { status: string; error?: string | null }
+    if (status === 'failed') throw new Error(error || 'Edit failed')
+    if (status === 'succeeded') break
+  }
+
+  const resultRes = await fetch(`${BASE_URL}/edit-image/${job_id}/result`, { headers })
+  if (!resultRes.ok) throw new Error('Edit result request failed')
+  return resultRes.blob()
+}
+
 // Like an image
 export const likeImage = (imageId: number) => apiRequest("/likes/", "POST", { image_id: imageId })
 
 // Unlike an image
 export const unlikeImage = (imageId: number) => apiRequest("/likes/", "DELETE", { image_id: imageId })
 
+// Which of the given images the current user has liked (one request for a whole page)
+export const getLikedImageIds = (imageIds: number[]) =>
+  apiRequest<{ liked: number[] }>("/likes/check/", "POST", { image_ids: imageIds })
+
+// Mark images with user_has_liked; leaves them unchanged when the check fails (e.g. signed out)
+export async function withLikedState<T extends Image>(images: T[]): Promise<T[]> {
+  if (images.length === 0) return images
+  try {
+    const { liked } = await getLikedImageIds(images.map((image) => image.id))
+    const likedIds = new Set(liked)
+    return images.map((image) => ({ ...image, user_has_liked: likedIds.has(image.id) }))
+  } catch {
+    return images
+  }
+}
+
 // Get comments for an image
 export const getImageComments = (imageId: number) =>
   apiRequest<Comment[]>("/comments/image/", "POST", { image_id: imageId })
 
+// Get a page of threaded comments; with parentId, a page of that comment's replies
+export const getCommentTree = (
+  imageId: number,
+  { parentId, cursor, depth = 2, repliesLimit = 5 }: { parentId?: number; cursor?: string | null; depth?: number; repliesLimit?: number } = {},
+) =>
+  apiRequest<Page<Comment>>(
+    withCursor(`/comments/tree/?depth=${depth}&replies_limit=${repliesLimit}`, cursor),
+    "POST",
+    { image_id: imageId, parent_id: parentId ?? null },
+  )
+
 // Add a comment to  =>
 //  apiRequest<Comment[]>('/comments/image/', 'POST', { image_id: imageId })
 
@@ -139,12 +225,30 @@ export const searchByText = (query: string) => apiRequest<Image[]>("/search/", "
 export const searchByImage = (imageUrl: string) =>
   apiRequest<Image[]>("/search-by-image/", "POST", { image_url: imageUrl })
 
+// Search with the stored vector of a gallery image (the image itself is left out)
+export const searchById = (imageId: number) =>
+  apiRequest<Image[]>("/search-by-id/", "POST", { image_id: imageId })
+
+// Precomputed "more like this" images for an image page
+export const getSimilarImages = (imageId: number, perPage = 10) =>
+  apiRequest<Image[]>(`/similar-images/?per_page=${perPage}`, "POST", { image_id: imageId }, false)
+
+export type BatchQuery = { query: string } | { image_url: string }
+export type BatchSearchResult = BatchQuery & { results: Image[] }
+
+// Search several text and/or image queries in one request; results come back in the same order
+export const searchBatch = (queries: BatchQuery[], perPage = 10) =>
+  apiRequest<BatchSearchResult[]>(`/search/batch/?per_page=${perPage}`, "POST", { queries })
+
 // Get detailed info for an image
 export const getImageInfo = (imageId: number) =>
   apiRequest<Image>("/image-info/", "POST", { image_id: imageId })
 
 // Get another user's images by username
+export const getUserImagesByUsernamePage = (username: string, cursor?: string | null) =>
+  apiRequest<Page<Image>>(withCursor('/user-images/', cursor), 'POST', { username }, false)
+
 export const getUserImagesByUsername = (username: string) =>
-  apiRequest<Image[]>('/user-images/', 'POST', { username }, false)
+  getUserImagesByUsernamePage(username).then((page) => page.items)
 
 export { getAuthToken }